@@ -0,0 +1,58 @@
+# Compares sklearn's RandomForestClassifier.predict_proba with flights.forest.CompiledForest.
+#
+#   python benchmarks/bench_forest.py [--model flights/data/random_forest_model.joblib]
+
+import os, sys, time, argparse, warnings
+import numpy as np
+import pandas as pd
+from joblib import load
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from flights.forest import CompiledForest  # noqa: E402
+
+BATCH_SIZES = [1, 10, 1000]
+
+def synthetic_rows(forest: CompiledForest, n_rows: int, seed: int = 0) -> np.ndarray:
+    # Spread each feature over the range of thresholds the trees split it on,
+    # so rows reach a realistic mix of leaves.
+    rng = np.random.default_rng(seed)
+    n_features = len(forest.feature_names)
+    internal = forest.children[0::2] != np.arange(len(forest.feature))
+    lo, hi = np.zeros(n_features), np.ones(n_features)
+    for f in range(n_features):
+        t = forest.threshold[internal & (forest.feature == f)]
+        if t.size:
+            lo[f], hi[f] = t.min() - 1.0, t.max() + 1.0
+    return rng.uniform(lo, hi, size=(n_rows, n_features))
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compiled forest inference against sklearn")
+    parser.add_argument("--model", default=os.path.join(BASE_DIR, "flights", "data", "random_forest_model.joblib"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        rf = load(args.model)
+    compiled = CompiledForest.from_sklearn(rf)
+
+    print(f"{'batch':>6} {'sklearn ms':>11} {'compiled ms':>12} {'speedup':>8} {'max |diff|':>11}")
+    for n in BATCH_SIZES:
+        X = pd.DataFrame(synthetic_rows(compiled, n), columns=compiled.feature_names)
+        diff = np.abs(rf.predict_proba(X) - compiled.predict_proba(X)).max()
+        t_sk = best_of(lambda: rf.predict_proba(X), args.repeat)
+        t_cf = best_of(lambda: compiled.predict_proba(X), args.repeat)
+        print(f"{n:>6} {t_sk * 1e3:>11.3f} {t_cf * 1e3:>12.3f} {t_sk / t_cf:>7.1f}x {diff:>11.2e}")
+
+if __name__ == "__main__":
+    main()
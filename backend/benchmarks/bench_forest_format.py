@@ -0,0 +1,66 @@
+# File size, load time and accuracy of the binary forest format
+# (CompiledForest.export / from_file) against the joblib pickle and the .npy
+# directory cache. Load times are best-of --repeat with the files in the page
+# cache; "first predict" includes faulting the mapped pages in.
+#
+#   python benchmarks/bench_forest_format.py [--model flights/data/random_forest_model.joblib]
+
+import os, sys, time, shutil, argparse, tempfile, warnings
+import numpy as np
+import pandas as pd
+from joblib import load
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from flights.forest import LEAF_ENCODINGS, CompiledForest  # noqa: E402
+from bench_forest import best_of, synthetic_rows  # noqa: E402
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark forest file formats against joblib")
+    parser.add_argument("--model", default=os.path.join(BASE_DIR, "flights", "data", "random_forest_model.joblib"))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    def load_joblib():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return load(args.model)
+
+    rf = load_joblib()
+    compiled = CompiledForest.from_sklearn(rf)
+    X = pd.DataFrame(synthetic_rows(compiled, args.rows), columns=compiled.feature_names)
+    expected = rf.predict_proba(X)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        npy_dir = os.path.join(tmp, "forest-npy")
+        compiled.save(npy_dir)
+        candidates = [
+            ("joblib", os.path.getsize(args.model), load_joblib),
+            (".npy directory", dir_size(npy_dir), lambda: CompiledForest.load(npy_dir)),
+        ]
+        for encoding in LEAF_ENCODINGS:
+            path = os.path.join(tmp, f"forest-{encoding}.forest")
+            compiled.export(path, leaf_encoding=encoding)
+            candidates.append((f"forest ({encoding} leaves)", os.path.getsize(path),
+                               lambda path=path: CompiledForest.from_file(path)))
+
+        print(f"{'format':<24} {'size KiB':>9} {'load ms':>9} {'first predict ms':>17} {'max |diff|':>11}")
+        for label, size, loader in candidates:
+            t_load = best_of(loader, args.repeat)
+            model = loader()
+            t0 = time.perf_counter()
+            probabilities = model.predict_proba(X)
+            t_first = time.perf_counter() - t0
+            diff = np.abs(probabilities - expected).max()
+            print(f"{label:<24} {size / 1024:>9.0f} {t_load * 1e3:>9.2f} {t_first * 1e3:>17.2f} {diff:>11.2e}")
+    finally:
+        shutil.rmtree(tmp)
+
+if __name__ == "__main__":
+    main()
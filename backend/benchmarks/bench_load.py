@@ -0,0 +1,164 @@
+# Load generator for /api/flights/predict and /api/flights/upload.
+#
+# By default it serves the project in-process on a threaded WSGI server, with
+# uploads parsed by flights.fake_openai at --latency seconds per call, and
+# drives each endpoint from --concurrency closed-loop clients. --url targets a
+# server that is already running instead (start that one with OPENAI_BASE_URL
+# pointing at `python -m flights.fake_openai` to keep uploads offline).
+#
+# Every request has distinct legs / file bytes, so neither the prediction nor
+# the parse cache answers; --cached repeats one request to measure hits.
+#
+#   python benchmarks/bench_load.py --concurrency 1 8 32 --requests 400 --json load.json
+#   python benchmarks/bench_load.py --url http://127.0.0.1:8000 --endpoints predict
+
+import os, sys, time, json, uuid, argparse, threading
+import urllib.error, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from report import latency_summary, write_report  # noqa: E402
+
+ROUTES = [("JFK", "LAX", 375), ("ATL", "ORD", 95), ("SFO", "EWR", 330), ("DCA", "ORD", 140), ("FLL", "LGA", 165)]
+AIRLINES = ["DL", "UA", "AA", "WN", "B6"]
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def setup_django(openai_base_url: str = None):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "skygamble.settings")
+    if openai_base_url:
+        os.environ["OPENAI_BASE_URL"] = openai_base_url
+        os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ.setdefault("PARSER_QUEUE_TIMEOUT", "600")
+    import django
+    django.setup()
+
+def serve_in_process():
+    from django.core.wsgi import get_wsgi_application
+    server = make_server("127.0.0.1", 0, get_wsgi_application(), server_class=ThreadingWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def predict_request(i: int, legs: int):
+    flights = []
+    for j in range(legs):
+        origin, dest, minutes = ROUTES[(i + j) % len(ROUTES)]
+        dep = datetime(2025, 1, 1, 6, 0) + timedelta(days=(i * legs + j) % 365, minutes=15 * ((i + j) % 60))
+        airline = AIRLINES[j % len(AIRLINES)]
+        flights.append({
+            "airline": airline, "flightNumber": f"{airline}{100 + (i * legs + j) % 9000}",
+            "departureAirport": origin, "arrivalAirport": dest,
+            "departureDateTime": dep.strftime("%Y-%m-%dT%H:%M:00.000Z"),
+            "arrivalDateTime": (dep + timedelta(minutes=minutes)).strftime("%Y-%m-%dT%H:%M:00.000Z"),
+        })
+    return json.dumps({"flights": flights}).encode(), "application/json"
+
+def upload_request(i: int, legs: int):
+    boundary = uuid.uuid4().hex
+    content = b"%PDF-1.4 " + str(i).encode()
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"pass-{i}.pdf\"\r\n"
+        f"Content-Type: application/pdf\r\n\r\n"
+    ).encode() + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+ENDPOINTS = {
+    "predict": ("/api/flights/predict", predict_request),
+    "upload": ("/api/flights/upload", upload_request),
+}
+
+def run_load(base_url: str, endpoint: str, concurrency: int, n_requests: int, legs: int, cached: bool) -> dict:
+    path, make_request = ENDPOINTS[endpoint]
+    latencies, errors = [], {}
+    lock = threading.Lock()
+    counter = iter(range(n_requests))
+
+    def client():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            body, content_type = make_request(0 if cached else i, legs)
+            request = urllib.request.Request(base_url + path, data=body, headers={"Content-Type": content_type})
+            t0 = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=600) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as exc:
+                status = exc.code
+            except OSError as exc:
+                status = type(exc).__name__
+            elapsed = time.perf_counter() - t0
+            with lock:
+                if status == 201:
+                    latencies.append(elapsed)
+                else:
+                    errors[str(status)] = errors.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.perf_counter() - started
+    summary = latency_summary(latencies, wall) if latencies else {"count": 0}
+    summary["errors"] = errors
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the predict and upload endpoints")
+    parser.add_argument("--url", default=None, help="base URL of a running server (default: serve in-process)")
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=sorted(ENDPOINTS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint and concurrency level")
+    parser.add_argument("--legs", type=int, default=2, help="legs per predict request")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake OpenAI latency in seconds (in-process only)")
+    parser.add_argument("--cached", action="store_true", help="repeat one request so the caches answer")
+    parser.add_argument("--json", default=None, help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    fake = server = None
+    base_url = args.url
+    if base_url is None:
+        from flights.fake_openai import FakeOpenAIServer
+        fake = FakeOpenAIServer(latency=args.latency).start()
+        setup_django(fake.base_url)
+        server, base_url = serve_in_process()
+
+    results = {}
+    try:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                name = f"{endpoint}@c{concurrency}"
+                results[name] = run_load(base_url, endpoint, concurrency, args.requests, args.legs, args.cached)
+                r = results[name]
+                print(
+                    f"{name:<16} {r['count']:>5} ok {sum(r['errors'].values()):>4} err  "
+                    + (f"p50 {r['p50_ms']:8.1f}  p95 {r['p95_ms']:8.1f}  p99 {r['p99_ms']:8.1f} ms  "
+                       f"{r['throughput_per_s']:7.1f} req/s" if r["count"] else ""),
+                    file=sys.stderr,
+                )
+    finally:
+        if server is not None:
+            server.shutdown()
+        if fake is not None:
+            fake.stop()
+
+    params = {k: getattr(args, k) for k in ("requests", "legs", "cached")}
+    params.update(target="in-process" if args.url is None else args.url,
+                  latency=args.latency if args.url is None else None)
+    write_report("load", params, results, args.json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# Microbenchmarks of the per-leg scoring helpers in flights.utils, reported as
+# p50/p95/p99 JSON (see report.py for comparing two runs).
+#
+#   python benchmarks/bench_micro.py --samples 2000 --json micro.json
+
+import os, sys, time, argparse
+from datetime import date
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from report import latency_summary, write_report  # noqa: E402
+
+SEGMENT = dict(date="2025-11-26T22:10:00.000", airline="UA", flight_number="UA15", origin="SFO", dest="EWR",
+               dep_time=1330, arr_time=650, elapsed_time=330.0, distance=2565.0)
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "skygamble.settings")
+    import django
+    django.setup()
+
+def sample(fn, samples: int, inner: int, warmup: int = 20) -> list:
+    # Seconds per call; cheap functions run `inner` times per sample so timer
+    # overhead stays out of the numbers.
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(samples):
+        t0 = time.perf_counter()
+        for _ in range(inner):
+            fn()
+        latencies.append((time.perf_counter() - t0) / inner)
+    return latencies
+
+def benchmarks(batch: int) -> dict:
+    from flights.features import build_features
+    from flights.metrics import span
+    from flights.utils import calculate_flight_duration, haversine, map, predict, us_holiday_flags
+
+    row = map(**SEGMENT)
+    rows = build_features([SEGMENT] * batch)
+    holiday = date(2025, 11, 26)
+
+    def empty_span():
+        with span("bench"):
+            pass
+
+    # name: (callable, inner repeats)
+    return {
+        "map": (lambda: map(**SEGMENT), 1),
+        f"build_features[{batch}]": (lambda: build_features([SEGMENT] * batch), 1),
+        "predict[1]": (lambda: predict(row), 1),
+        f"predict[{batch}]": (lambda: predict(rows), 1),
+        "haversine": (lambda: haversine(37.619, -122.375, 40.6925, -74.1687), 1000),
+        "calculate_flight_duration": (
+            lambda: calculate_flight_duration("2025-11-26T22:10", "2025-11-27T06:40", "SFO", "EWR"), 100),
+        "us_holiday_flags": (lambda: us_holiday_flags(holiday), 1000),
+        "metrics.span": (empty_span, 1000),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark map/predict and the feature helpers")
+    parser.add_argument("--samples", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=100, help="rows for the batched predict/build_features cases")
+    parser.add_argument("--only", nargs="*", default=None, help="benchmark names to run (default all)")
+    parser.add_argument("--json", default=None, help="write the report here instead of stdout")
+    args = parser.parse_args()
+
+    setup_django()
+    results = {}
+    for name, (fn, inner) in benchmarks(args.batch).items():
+        if args.only and name not in args.only:
+            continue
+        results[name] = latency_summary(sample(fn, args.samples, inner))
+        print(f"{name:<28} p50 {results[name]['p50_ms']:9.4f} ms  p99 {results[name]['p99_ms']:9.4f} ms", file=sys.stderr)
+    write_report("micro", {"samples": args.samples, "batch": args.batch}, results, args.json)
+
+if __name__ == "__main__":
+    main()
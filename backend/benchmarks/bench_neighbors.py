@@ -0,0 +1,68 @@
+# Query latency and recall@k of the IVF neighbor index (flights.neighbors)
+# against exact brute-force search, on synthetic clustered embeddings or on a
+# built index.
+#
+#   python benchmarks/bench_neighbors.py --rows 1000000 --nprobe 4 8 16
+#   python benchmarks/bench_neighbors.py --index flights/data/neighbors
+
+import os, sys, time, argparse
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "skygamble.settings")
+    import django
+    django.setup()
+
+def synthetic_embeddings(n_rows: int, dim: int = 33, n_clusters: int = 500, seed: int = 0) -> np.ndarray:
+    # Clustered like real routes/schedules, with the two delay columns last.
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    X = centers[rng.integers(0, n_clusters, n_rows)] + 0.3 * rng.normal(size=(n_rows, dim)).astype(np.float32)
+    delays = rng.gamma(1.5, 12.0, size=(n_rows, 2)).astype(np.float32)
+    return np.hstack([X, delays])
+
+def timed_search(fn, queries: np.ndarray):
+    latencies, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append(fn(q[None, :])[0][0])
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies) * 1e3, results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the neighbor index against exact search")
+    parser.add_argument("--index", default=None, help="a built index directory; synthetic data otherwise")
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=50)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    setup_django()
+    from flights.neighbors import NeighborIndex
+
+    rng = np.random.default_rng(1)
+    if args.index:
+        index = NeighborIndex.load(args.index)
+    else:
+        data = synthetic_embeddings(args.rows)
+        t0 = time.perf_counter()
+        index = NeighborIndex.build(lambda: [data], airline_stats={}, airport_busyness={})
+        print(f"Built {index.nlist} lists over {args.rows:,} rows in {time.perf_counter() - t0:.1f} s")
+    rows = rng.choice(len(index.vectors), args.queries, replace=False)
+    queries = np.asarray(index.vectors[np.sort(rows)]) + 0.05 * rng.normal(size=(args.queries, index.vectors.shape[1]))
+    queries = queries.astype(np.float32)
+
+    exact_ms, exact = timed_search(lambda q: index.search_exact(q, args.k), queries)
+    print(f"{'search':>12} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>10}")
+    print(f"{'exact':>12} {np.percentile(exact_ms, 50):>8.2f} {np.percentile(exact_ms, 99):>8.2f} {1.0:>10.3f}")
+    for nprobe in args.nprobe:
+        ms, approx = timed_search(lambda q: index.search(q, args.k, nprobe=nprobe), queries)
+        recall = np.mean([len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx, exact)])
+        print(f"{'nprobe=' + str(nprobe):>12} {np.percentile(ms, 50):>8.2f} {np.percentile(ms, 99):>8.2f} {recall:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Upload throughput: sync UploadItineraryView vs the async upload view, against
+# flights.fake_openai with a fixed parser latency.
+#
+# The sync view gets --workers threads (a threaded WSGI worker); the async view
+# runs on a single event loop with up to PARSER_MAX_CONCURRENCY parses in
+# flight (one ASGI worker). Every upload has distinct bytes, so the parse cache
+# never answers.
+#
+#   python benchmarks/bench_upload.py --requests 64 --workers 4 --latency 0.5
+
+import os, sys, time, asyncio, argparse
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+def setup_django(base_url: str, concurrency: int):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "skygamble.settings")
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "fake"
+    os.environ["PARSE_CACHE_BACKEND"] = "none"
+    os.environ["PARSER_MAX_CONCURRENCY"] = str(concurrency)
+    os.environ["PARSER_QUEUE_TIMEOUT"] = "600"
+    import django
+    from django.test.utils import setup_test_environment
+    django.setup()
+    setup_test_environment()
+
+def upload_file(i: int):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    return SimpleUploadedFile(f"pass-{i}.pdf", b"%PDF-1.4 " + str(i).encode(), content_type="application/pdf")
+
+def run_sync(n_requests: int, workers: int) -> float:
+    from django.test import Client
+
+    def one(i):
+        response = Client().post("/api/flights/upload", {"file": upload_file(i)})
+        assert response.status_code == 201, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(one, range(n_requests)))
+    return time.perf_counter() - started
+
+def run_async(n_requests: int) -> float:
+    from django.test import AsyncClient
+
+    async def one(i):
+        response = await AsyncClient().post("/api/flights/upload/async", {"file": upload_file(i)})
+        assert response.status_code == 201, response.status_code
+
+    async def all_requests():
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+
+    started = time.perf_counter()
+    asyncio.run(all_requests())
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sync vs async itinerary upload")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4, help="threads for the sync view")
+    parser.add_argument("--concurrency", type=int, default=64, help="PARSER_MAX_CONCURRENCY for the async view")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake parser latency in seconds")
+    args = parser.parse_args()
+
+    from flights.fake_openai import FakeOpenAIServer
+    with FakeOpenAIServer(latency=args.latency) as server:
+        setup_django(server.base_url, args.concurrency)
+        t_sync = run_sync(args.requests, args.workers)
+        t_async = run_async(args.requests)
+
+    print(f"{args.requests} uploads, parser latency {args.latency}s")
+    for label, seconds in ((f"sync, {args.workers} threads", t_sync), (f"async, 1 loop, {args.concurrency} in flight", t_async)):
+        print(f"  {label:<32} {seconds:7.2f}s {args.requests / seconds:7.1f} req/s")
+
+if __name__ == "__main__":
+    main()
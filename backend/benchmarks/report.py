@@ -0,0 +1,82 @@
+# JSON reports for bench_micro.py and bench_load.py, and a comparison of two
+# of them so a change can be checked against the commit before it:
+#
+#   git stash && python benchmarks/bench_micro.py --json base.json && git stash pop
+#   python benchmarks/bench_micro.py --json head.json
+#   python benchmarks/report.py base.json head.json --threshold 0.10
+
+import os, sys, json, platform, argparse, subprocess
+from datetime import datetime, timezone
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def latency_summary(latencies_s, wall_s: float = None) -> dict:
+    # Milliseconds; throughput is per wall-clock second when the calls overlapped.
+    ms = np.asarray(latencies_s, dtype=np.float64) * 1e3
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    total = wall_s if wall_s is not None else ms.sum() / 1e3
+    return {
+        "count": int(ms.size), "mean_ms": float(ms.mean()), "p50_ms": float(p50),
+        "p95_ms": float(p95), "p99_ms": float(p99), "max_ms": float(ms.max()),
+        "throughput_per_s": float(ms.size / total) if total else None,
+    }
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BASE_DIR, capture_output=True, text=True)
+    except OSError:
+        return None
+    return out.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "") if out.returncode == 0 else None
+
+def write_report(kind: str, params: dict, results: dict, path: str = None) -> dict:
+    report = {
+        "kind": kind, "commit": git_commit(), "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+        "params": params, "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if path and path != "-":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+def compare(base: dict, head: dict, threshold: float) -> list:
+    # (name, metric, base, head, relative change, regressed) for p50/p95/p99 of every shared result.
+    rows = []
+    for name in sorted(set(base["results"]) & set(head["results"])):
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            b, h = base["results"][name].get(metric), head["results"][name].get(metric)
+            if b and h is not None:
+                change = (h - b) / b
+                rows.append((name, metric, b, h, change, change > threshold))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports")
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.head, encoding="utf-8") as f:
+        head = json.load(f)
+    if base["kind"] != head["kind"]:
+        sys.exit(f"Cannot compare a {base['kind']} report with a {head['kind']} report")
+    if base["params"] != head["params"]:
+        print(f"warning: parameters differ: {base['params']} vs {head['params']}")
+
+    rows = compare(base, head, args.threshold)
+    print(f"{base['commit']} -> {head['commit']}")
+    print(f"{'benchmark':<32} {'metric':>7} {'base ms':>10} {'head ms':>10} {'change':>8}")
+    for name, metric, b, h, change, regressed in rows:
+        print(f"{name:<32} {metric[:3]:>7} {b:>10.3f} {h:>10.3f} {change:>+7.1%}{'  REGRESSION' if regressed else ''}")
+    sys.exit(1 if any(r[-1] for r in rows) else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import math
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from zoneinfo import ZoneInfo
+
+EARTH_RADIUS_MILES = 3958.8
+
+AIRPORT_TABLE_FORMAT = 1
+AIRPORT_TABLE_FILENAME = "airports.npz"
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    """utils.haversine over arrays; agrees with it to within float rounding."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = np.radians(np.subtract(lat2, lat1))
+    dlambda = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return EARTH_RADIUS_MILES * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class AirportIndex:
+    """Every known airport as an integer ID, with its latitude, longitude and
+    time zone held in arrays.
+
+    IDs below `n_served` are the airports the model serves (airports.json, with
+    its coordinates); the rest come from airportsdata and are only good for
+    time zones and for the embedding pipeline. Route distances between served
+    airports are memoized in a dense ID x ID matrix filled on first use (about
+    1 MB for the ~340 airports in airports.json), so a route's trig runs once
+    per process and a batch of legs is one array lookup.
+
+    The table is saved as one uncompressed .npz (see `manage.py
+    build_airport_table`) that loads in a few milliseconds.
+    """
+
+    def __init__(self, codes, lat, lon, tz, tz_names, n_served):
+        self.codes = np.asarray(codes, dtype="U3")
+        self._positions = pd.Index(self.codes)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.tz = np.asarray(tz, dtype=np.int16)
+        self.tz_names = [str(name) for name in tz_names]
+        self.n_served = int(n_served)
+        self._zones = {}
+        self._route_miles = np.full((self.n_served, self.n_served), np.nan)
+
+    @classmethod
+    def from_sources(cls, coordinates, airports_data):
+        """Merge airports.json coordinates with the airportsdata IATA database."""
+        served = sorted(coordinates)
+        others = sorted(
+            c for c, rec in airports_data.items()
+            if c not in coordinates and len(c) == 3 and not (math.isnan(float(rec["lat"])) or math.isnan(float(rec["lon"])))
+        )
+        tz_names = sorted({rec["tz"] for rec in airports_data.values() if rec.get("tz")})
+        tz_ids = {name: i for i, name in enumerate(tz_names)}
+
+        def tz_id(code):
+            rec = airports_data.get(code)
+            return tz_ids.get(rec.get("tz"), -1) if rec else -1
+
+        return cls(
+            codes=served + others,
+            lat=[coordinates[c]["lat"] for c in served] + [float(airports_data[c]["lat"]) for c in others],
+            lon=[coordinates[c]["lon"] for c in served] + [float(airports_data[c]["lon"]) for c in others],
+            tz=[tz_id(c) for c in served + others],
+            tz_names=tz_names,
+            n_served=len(served),
+        )
+
+    def save(self, path):
+        """Write the table to `path`, renamed into place so readers never see half a file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".airports-", suffix=".npz", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f, format=AIRPORT_TABLE_FORMAT, codes=self.codes, lat=self.lat, lon=self.lon,
+                    tz=self.tz, tz_names=np.asarray(self.tz_names), n_served=self.n_served,
+                )
+            # mkstemp files are private; the table is read by every worker user.
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if int(data["format"]) != AIRPORT_TABLE_FORMAT:
+                raise ValueError(f"Unsupported airport table format in {path}: {int(data['format'])!r}")
+            return cls(
+                codes=data["codes"], lat=data["lat"], lon=data["lon"], tz=data["tz"],
+                tz_names=data["tz_names"].tolist(), n_served=int(data["n_served"]),
+            )
+
+    def __contains__(self, code):
+        return code in self._positions
+
+    def ids(self, codes):
+        """Airport IDs for IATA codes; -1 for codes not in the table."""
+        return self._positions.get_indexer(pd.Index(codes))
+
+    def unknown(self, codes):
+        """The codes the model cannot score: not served, or without a time zone."""
+        ids = self.ids(codes)
+        bad = (ids < 0) | (ids >= self.n_served)
+        bad[~bad] = self.tz[ids[~bad]] < 0
+        return sorted(set(np.asarray(codes, dtype=object)[bad].tolist()))
+
+    def coordinates(self, code):
+        i = self._positions.get_loc(code)
+        return {"lat": float(self.lat[i]), "lon": float(self.lon[i])}
+
+    def zone(self, code):
+        """The cached ZoneInfo of an airport; KeyError when it has none."""
+        tz_id = self.tz[self._positions.get_loc(code)]
+        if tz_id < 0:
+            raise KeyError(code)
+        return self._zone(self.tz_names[tz_id])
+
+    def _zone(self, name):
+        zone = self._zones.get(name)
+        if zone is None:
+            zone = self._zones[name] = ZoneInfo(name)
+        return zone
+
+    def route_miles(self, origin_ids, dest_ids):
+        """Great-circle miles for every (origin, dest) pair of served airport IDs."""
+        origin_ids, dest_ids = np.asarray(origin_ids), np.asarray(dest_ids)
+        miles = self._route_miles[origin_ids, dest_ids]
+        todo = np.isnan(miles)
+        if todo.any():
+            i, j = origin_ids[todo], dest_ids[todo]
+            # Racing fills write the same value, so no lock is needed.
+            self._route_miles[i, j] = haversine_miles(self.lat[i], self.lon[i], self.lat[j], self.lon[j])
+            miles = self._route_miles[origin_ids, dest_ids]
+        return miles
+
+    def to_utc(self, local, ids):
+        """UTC instants for naive local datetimes at airports `ids`.
+
+        Matches datetime.replace(tzinfo=ZoneInfo(tz)): ambiguous times take the
+        first (DST) reading. Times inside a DST gap come back NaT.
+        """
+        out = pd.Series(pd.NaT, index=local.index, dtype="datetime64[ns, UTC]")
+        tz_ids = pd.Series(self.tz[ids], index=local.index)
+        for tz_id, idx in local.groupby(tz_ids).groups.items():
+            values = pd.DatetimeIndex(local[idx]).tz_localize(
+                self._zone(self.tz_names[tz_id]), ambiguous=np.ones(len(idx), dtype=bool), nonexistent="NaT",
+            )
+            out[idx] = values.tz_convert("UTC")
+        return out
@@ -4,3 +4,15 @@ from django.apps import AppConfig
 class FlightsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'flights'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import checks  # noqa: F401
+
+        if settings.PRELOAD_ARTIFACTS:
+            from .utils import model_registry, registry
+            registry.preload()
+            # The model is not a registry artifact: model_registry swaps in new
+            # versions, so callers ask it for the current one on every request.
+            model_registry.current()
@@ -0,0 +1,217 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUBackend:
+    """In-process LRU; per worker, gone on restart."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            for key, value in mapping.items():
+                self._data[key] = (expires_at, value)
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend:
+    """On-disk cache shared by every worker on the host."""
+
+    # Keys per SELECT in get_many(), under SQLite's bound-parameter limit.
+    BATCH = 500
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, time.time()))
+            return None
+        return json.loads(value)
+
+    def get_many(self, keys):
+        conn = self._connect()
+        now = time.time()
+        found = {}
+        keys = list(keys)
+        for i in range(0, len(keys), self.BATCH):
+            batch = keys[i:i + self.BATCH]
+            rows = conn.execute(
+                f"SELECT key, value FROM cache WHERE key IN ({','.join('?' * len(batch))})"
+                " AND (expires_at IS NULL OR expires_at > ?)",
+                (*batch, now),
+            )
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, mapping, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), expires_at) for key, value in mapping.items()],
+            )
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+class DjangoCacheBackend:
+    """Delegates to a configured Django cache (e.g. Redis or memcached)."""
+
+    def __init__(self, alias="default"):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set(self, key, value, ttl=None):
+        self.cache.set(key, value, timeout=ttl)
+
+    def set_many(self, mapping, ttl=None):
+        self.cache.set_many(mapping, timeout=ttl)
+
+    def clear(self):
+        self.cache.clear()
+
+
+BACKENDS = {
+    "memory": LRUBackend,
+    "sqlite": SQLiteBackend,
+    "django": DjangoCacheBackend,
+}
+
+
+def make_backend(name, **options):
+    try:
+        backend_cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown cache backend {name!r}; expected one of {sorted(BACKENDS)}") from None
+    return backend_cls(**options)
+
+
+class CountingCache:
+    """A backend plus a TTL and hit/miss counters.
+
+    `None` is never cached, so a miss is always unambiguous.
+    """
+
+    def __init__(self, backend, ttl=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = self.backend.get_many(keys)
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set(self, key, value):
+        if value is not None:
+            self.backend.set(key, value, self.ttl)
+
+    def set_many(self, mapping):
+        mapping = {k: v for k, v in mapping.items() if v is not None}
+        if mapping:
+            self.backend.set_many(mapping, self.ttl)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def make_cache(name, ttl=None, max_entries=1024, path=None, alias="default"):
+    """A CountingCache over backend `name`, or None when `name` is "none".
+
+    Takes the *_CACHE_* settings; each backend uses only its own options.
+    """
+    if name == "none":
+        return None
+    options = {
+        "memory": {"max_entries": max_entries},
+        "sqlite": {"path": path},
+        "django": {"alias": alias},
+    }.get(name, {})
+    return CountingCache(make_backend(name, **options), ttl=ttl)
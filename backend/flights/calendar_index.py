@@ -0,0 +1,90 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from pandas.tseries.holiday import USFederalHolidayCalendar as USCal
+
+CALENDAR_FIELDS = [
+    "is_us_holiday", "is_holiday_window", "is_thanksgiving_week",
+    "is_xmas_nye_window", "week_of_year", "day_of_year",
+]
+
+_DAY = np.timedelta64(1, "D")
+
+
+def _build_table(start_year, end_year):
+    days = pd.date_range(f"{start_year}-01-01", f"{end_year}-12-31", freq="D")
+
+    # Pad by a year so observed dates that cross a year boundary are included.
+    hol = USCal().holidays(start=f"{start_year - 1}-01-01", end=f"{end_year + 1}-12-31")
+    hol = pd.to_datetime(hol).normalize()
+    is_holiday = days.isin(hol)
+    window = is_holiday | (days - pd.Timedelta(days=1)).isin(hol) | (days + pd.Timedelta(days=1)).isin(hol)
+
+    thanksgiving = np.zeros(len(days), dtype=bool)
+    for y in range(start_year, end_year + 1):
+        fourth_thu = pd.date_range(f"{y}-11-01", f"{y}-11-30", freq="W-THU")[3]
+        thanksgiving |= (days >= fourth_thu - pd.Timedelta(days=3)) & (days <= fourth_thu + pd.Timedelta(days=3))
+
+    m, d = days.month, days.day
+    xmas = ((m == 12) & (d >= 20)) | ((m == 1) & (d <= 5))
+
+    return np.column_stack([
+        is_holiday, window, thanksgiving, xmas,
+        days.isocalendar().week.to_numpy(), days.day_of_year,
+    ]).astype(np.int16)
+
+
+class CalendarIndex:
+    """Per-day calendar features for a range of years, one row per day.
+
+    lookup() is a single array index per date; dates outside the range grow
+    the table once and are cached from then on.
+    """
+
+    def __init__(self, start_year, end_year):
+        self._lock = threading.Lock()
+        self._state = self._build(start_year, end_year)
+
+    @staticmethod
+    def _build(start_year, end_year):
+        return start_year, end_year, np.datetime64(f"{start_year}-01-01", "D"), _build_table(start_year, end_year)
+
+    @property
+    def years(self):
+        return self._state[0], self._state[1]
+
+    def _covering(self, days):
+        start_year, end_year, origin, table = self._state
+        lo, hi = days.min(), days.max()
+        if lo >= origin and hi < origin + len(table) * _DAY:
+            return origin, table
+        with self._lock:
+            start_year, end_year = self._state[:2]
+            start_year = min(start_year, lo.astype("datetime64[Y]").astype(int) + 1970)
+            end_year = max(end_year, hi.astype("datetime64[Y]").astype(int) + 1970)
+            self._state = self._build(int(start_year), int(end_year))
+            return self._state[2], self._state[3]
+
+    def lookup(self, dates):
+        """Return an (n, len(CALENDAR_FIELDS)) int16 array for `dates`."""
+        days = np.asarray(pd.to_datetime(dates).values, dtype="datetime64[D]").reshape(-1)
+        origin, table = self._covering(days)
+        return table[(days - origin).astype(np.int64)]
+
+    def lookup_one(self, date):
+        return self.lookup([date])[0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def calendar_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CalendarIndex(settings.CALENDAR_START_YEAR, settings.CALENDAR_END_YEAR)
+    return _index
@@ -0,0 +1,17 @@
+import os
+
+from django.core.checks import Error, register
+
+
+@register()
+def check_airport_table(app_configs, **kwargs):
+    """Refuse to start without the prebuilt airport table every request reads."""
+    from .utils import airport_table_path
+
+    if os.path.exists(airport_table_path):
+        return []
+    return [Error(
+        f"No airport table at {airport_table_path}.",
+        hint="Build it with `python manage.py build_airport_table`.",
+        id="flights.E001",
+    )]
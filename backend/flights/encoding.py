@@ -0,0 +1,56 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+ENCODER_FORMAT = 1
+UNKNOWN_VALUE = -1.0
+
+
+class CategoricalEncoder:
+    """Ordinal encoding with a fixed training vocabulary.
+
+    Mirrors OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1)
+    fit on the training set, but encodes with plain dict lookups so nothing is
+    fit at request time.
+    """
+
+    def __init__(self, categories, unknown_value=UNKNOWN_VALUE):
+        self.categories = {col: list(values) for col, values in categories.items()}
+        self.unknown_value = float(unknown_value)
+        self._codes = {
+            col: {value: float(code) for code, value in enumerate(values)}
+            for col, values in self.categories.items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("format") != ENCODER_FORMAT:
+            raise ValueError(f"Unsupported encoder format in {path}: {payload.get('format')!r}")
+        return cls(payload["categories"], unknown_value=payload.get("unknown_value", UNKNOWN_VALUE))
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "format": ENCODER_FORMAT,
+                "unknown_value": self.unknown_value,
+                "categories": self.categories,
+            }, f)
+
+    def transform(self, df):
+        X = df.copy()
+        for col in X.select_dtypes(include=["object"]).columns:
+            codes = self._codes.get(col)
+            if codes is not None:
+                X[col] = X[col].map(codes).fillna(self.unknown_value).astype(np.float64)
+            else:
+                # Numeric in training, textual at serving time: flight numbers
+                # arrive as "DL423", so keep their digits as the fn_int feature does.
+                numbers = pd.to_numeric(X[col], errors="coerce")
+                text = numbers.isna() & X[col].notna()
+                digits = X.loc[text, col].astype(str).str.replace(r"\D", "", regex=True)
+                numbers[text] = pd.to_numeric(digits, errors="coerce")
+                X[col] = numbers.fillna(self.unknown_value).astype(np.float64)
+        return X
@@ -0,0 +1,134 @@
+"""A local stand-in for the two OpenAI endpoints the itinerary parser calls.
+
+Serves POST /v1/files and POST /v1/responses with a configurable delay, so
+the upload paths can be tested and load-tested without network access or cost:
+
+    python -m flights.fake_openai --port 8100 --latency 1.5
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=fake python manage.py runserver
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_ITEMS = [{
+    "relevant": True,
+    "departure_airport": "JFK",
+    "arrival_airport": "LAX",
+    "departure_datetime_local": "2025-09-26T14:35",
+    "arrival_datetime_local": "2025-09-26T17:50",
+    "airline_iata": "DL",
+    "flight_number": "DL423",
+    "missing_fields": [],
+    "notes": "Served by flights.fake_openai.",
+}]
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, items=None):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.items = DEFAULT_ITEMS if items is None else items
+        self.requests = []
+        self._ids = itertools.count(1)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_id(self, prefix):
+        return f"{prefix}-{next(self._ids)}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            size = 0
+            while True:
+                n = int(self.rfile.readline().strip() or b"0", 16)
+                if n == 0:
+                    self.rfile.readline()
+                    return size
+                self.rfile.read(n)
+                self.rfile.readline()
+                size += n
+        n = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(n)
+        return n
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        size = self._read_body()
+        server.requests.append((self.path, size))
+        now = int(time.time())
+        if self.path.endswith("/files"):
+            self._send(200, {
+                "id": server.next_id("file"), "object": "file", "bytes": size, "created_at": now,
+                "filename": "upload", "purpose": "user_data", "status": "processed",
+            })
+        elif self.path.endswith("/responses"):
+            time.sleep(server.latency)
+            self._send(200, {
+                "id": server.next_id("resp"), "object": "response", "created_at": now,
+                "model": "fake", "status": "completed", "parallel_tool_calls": False,
+                "tool_choice": "auto", "tools": [],
+                "output": [{
+                    "type": "message", "id": server.next_id("msg"), "role": "assistant", "status": "completed",
+                    "content": [{"type": "output_text", "text": json.dumps(server.items), "annotations": []}],
+                }],
+            })
+        else:
+            self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI files/responses server for the itinerary parser")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds spent in each /responses call")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, latency=args.latency)
+    print(f"Fake OpenAI listening on {server.base_url} (latency {args.latency}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
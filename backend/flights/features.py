@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+
+from .calendar_index import CALENDAR_FIELDS, calendar_index
+from .utils import CARRIER_CATEGORY, SLOT_AIRPORTS, hhmm_to_min_of_day
+
+# Column order produced by utils.map(); the forest was fit on exactly this layout.
+FEATURE_COLUMNS = [
+    "FlightDate", "Year", "Month", "DayofMonth", "DayOfWeek", "Quarter",
+    "week_of_year", "day_of_year", "is_month_start", "is_month_end",
+    "is_weekend", "season", "is_us_holiday", "is_holiday_window",
+    "is_thanksgiving_week", "is_xmas_nye_window",
+    "is_peak_summer", "is_spring_break_season",
+    "Reporting_Airline", "Flight_Number_Reporting_Airline",
+    "flight_num_int", "flight_num_mod100", "flight_series_100s", "is_even_flight",
+    "carrier_category", "Origin", "Dest", "route", "carrier_route",
+    "origin_slot_controlled", "dest_slot_controlled",
+    "CRSElapsedTime", "Distance", "scheduled_avg_speed_mph",
+    "log_distance", "log_crs_elapsed", "schedule_buffer_minutes",
+    "sched_dep_minute_of_day", "sched_arr_minute_of_day",
+    "dep_hour", "arr_hour", "dep_minute_of_hour", "arr_minute_of_hour",
+    "dep_minute_sin", "dep_minute_cos", "arr_minute_sin", "arr_minute_cos",
+    "dep_part_of_day", "arr_part_of_day", "dep_hour_sin", "dep_hour_cos",
+    "arr_hour_sin", "arr_hour_cos", "DayOfWeek_sin", "DayOfWeek_cos",
+    "Month_sin", "Month_cos", "dep_is_quarter", "arr_is_quarter",
+    "dep_minute_quarter_delta", "arr_minute_quarter_delta",
+    "is_first_wave", "is_morning_rush", "is_midday",
+    "is_afternoon_rush", "is_late_night",
+    "arrives_next_day_local",
+]
+
+SEGMENT_FIELDS = [
+    "date", "airline", "flight_number", "origin", "dest",
+    "dep_time", "arr_time", "elapsed_time", "distance",
+]
+
+_SEASON_BY_MONTH = np.array(["DJF"]*2 + ["MAM"]*3 + ["JJA"]*3 + ["SON"]*3 + ["DJF"], dtype=object)
+_PART_OF_DAY = np.array(["night"]*6 + ["morning"]*6 + ["afternoon"]*6 + ["evening"]*6, dtype=object)
+
+
+def _cyclical(value, period):
+    angle = 2.0 * np.pi * (value % period) / period
+    return np.sin(angle), np.cos(angle)
+
+
+def _minute_of_day(values):
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iu" and (arr >= 0).all():
+        # str(v).zfill(4) split as HH|MM is plain integer division for non-negative ints
+        return ((arr // 100) * 60 + arr % 100) % 1440
+    return np.array([hhmm_to_min_of_day(v) for v in values], dtype=np.int64)
+
+
+def _quarter_delta(minute):
+    return np.minimum.reduce([
+        minute, 60 - minute,
+        np.abs(minute - 15), np.abs(minute - 30), np.abs(minute - 45),
+    ])
+
+
+def build_features(segments):
+    """Vectorized utils.map() over many segments.
+
+    `segments` is a DataFrame or a list of dicts keyed by SEGMENT_FIELDS (the
+    keyword arguments of map()). Returns one row per segment with
+    FEATURE_COLUMNS in map()'s order and dtypes.
+    """
+    seg = segments if isinstance(segments, pd.DataFrame) else pd.DataFrame(list(segments), columns=SEGMENT_FIELDS)
+    n = len(seg)
+    index = pd.RangeIndex(n)
+
+    d = pd.Series(pd.to_datetime(list(seg["date"]), format="mixed"), index=index).dt.normalize()
+    year = d.dt.year.to_numpy(np.int64)
+    month = d.dt.month.to_numpy(np.int64)
+    dom = d.dt.day.to_numpy(np.int64)
+    dow = d.dt.dayofweek.to_numpy(np.int64) + 1
+    quarter = (month - 1) // 3 + 1
+
+    cal = calendar_index().lookup(d)
+    cal = {name: pd.Series(cal[:, i].astype(np.int64), index=index) for i, name in enumerate(CALENDAR_FIELDS)}
+
+    airline = seg["airline"].to_numpy(object)
+    flight_number = seg["flight_number"].to_numpy(object)
+    origin = seg["origin"].to_numpy(object)
+    dest = seg["dest"].to_numpy(object)
+
+    fn_int = np.array(
+        [int(''.join(filter(str.isdigit, str(fn))) or 0) for fn in flight_number],
+        dtype=np.int64,
+    )
+    carrier_cat = np.array([CARRIER_CATEGORY.get(a, "other") for a in airline], dtype=object)
+    route = np.array([f"{o}-{t}" for o, t in zip(origin, dest)], dtype=object)
+    carrier_route = np.array([f"{a}:{r}" for a, r in zip(airline, route)], dtype=object)
+
+    sched_dep_minute = _minute_of_day(seg["dep_time"].to_numpy())
+    sched_arr_minute = _minute_of_day(seg["arr_time"].to_numpy())
+    dep_hour = (sched_dep_minute % 1440) // 60
+    arr_hour = (sched_arr_minute % 1440) // 60
+    dep_minute_of_hour = sched_dep_minute % 60
+    arr_minute_of_hour = sched_arr_minute % 60
+    dep_min_sin, dep_min_cos = _cyclical(dep_minute_of_hour, 60)
+    arr_min_sin, arr_min_cos = _cyclical(arr_minute_of_hour, 60)
+    dep_hour_sin, dep_hour_cos = _cyclical(dep_hour, 24)
+    arr_hour_sin, arr_hour_cos = _cyclical(arr_hour, 24)
+    dow_sin, dow_cos = _cyclical(dow, 7)
+    month_sin, month_cos = _cyclical(month, 12)
+
+    elapsed = seg["elapsed_time"]
+    distance = seg["distance"]
+    elapsed_f = elapsed.to_numpy(np.float64)
+    distance_f = distance.to_numpy(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(elapsed_f > 0, distance_f / (elapsed_f / 60.0), np.nan)
+
+    def col(values):
+        return pd.Series(values, index=index)
+
+    def flag(mask):
+        return col(np.asarray(mask).astype(np.int64))
+
+    features = {
+        "FlightDate": d.dt.strftime("%Y-%m-%d"),
+        "Year": col(year), "Month": col(month), "DayofMonth": col(dom), "DayOfWeek": col(dow),
+        "Quarter": col(quarter),
+        "week_of_year": cal["week_of_year"], "day_of_year": cal["day_of_year"],
+        "is_month_start": flag(d.dt.is_month_start), "is_month_end": flag(d.dt.is_month_end),
+        "is_weekend": flag(dow >= 6),
+        "season": col(_SEASON_BY_MONTH[month - 1].tolist()),
+        "is_us_holiday": cal["is_us_holiday"], "is_holiday_window": cal["is_holiday_window"],
+        "is_thanksgiving_week": cal["is_thanksgiving_week"], "is_xmas_nye_window": cal["is_xmas_nye_window"],
+        "is_peak_summer": flag((month >= 6) & (month <= 8)),
+        "is_spring_break_season": flag((month >= 3) & (month <= 4)),
+        "Reporting_Airline": col(airline.tolist()),
+        "Flight_Number_Reporting_Airline": col(flight_number.tolist()),
+        "flight_num_int": col(fn_int), "flight_num_mod100": col(fn_int % 100),
+        "flight_series_100s": col(fn_int // 100), "is_even_flight": flag(fn_int % 2 == 0),
+        "carrier_category": col(carrier_cat.tolist()),
+        "Origin": col(origin.tolist()), "Dest": col(dest.tolist()),
+        "route": col(route.tolist()), "carrier_route": col(carrier_route.tolist()),
+        "origin_slot_controlled": flag([o in SLOT_AIRPORTS for o in origin]),
+        "dest_slot_controlled": flag([t in SLOT_AIRPORTS for t in dest]),
+        "CRSElapsedTime": col(elapsed.tolist()), "Distance": col(distance.tolist()),
+        "scheduled_avg_speed_mph": col(speed),
+        "log_distance": col(np.log1p(distance_f)), "log_crs_elapsed": col(np.log1p(elapsed_f)),
+        "schedule_buffer_minutes": col(elapsed_f - distance_f * 60.0 / 450.0),
+        "sched_dep_minute_of_day": col(sched_dep_minute), "sched_arr_minute_of_day": col(sched_arr_minute),
+        "dep_hour": col(dep_hour), "arr_hour": col(arr_hour),
+        "dep_minute_of_hour": col(dep_minute_of_hour), "arr_minute_of_hour": col(arr_minute_of_hour),
+        "dep_minute_sin": col(dep_min_sin), "dep_minute_cos": col(dep_min_cos),
+        "arr_minute_sin": col(arr_min_sin), "arr_minute_cos": col(arr_min_cos),
+        "dep_part_of_day": col(_PART_OF_DAY[dep_hour].tolist()),
+        "arr_part_of_day": col(_PART_OF_DAY[arr_hour].tolist()),
+        "dep_hour_sin": col(dep_hour_sin), "dep_hour_cos": col(dep_hour_cos),
+        "arr_hour_sin": col(arr_hour_sin), "arr_hour_cos": col(arr_hour_cos),
+        "DayOfWeek_sin": col(dow_sin), "DayOfWeek_cos": col(dow_cos),
+        "Month_sin": col(month_sin), "Month_cos": col(month_cos),
+        "dep_is_quarter": flag(dep_minute_of_hour % 15 == 0),
+        "arr_is_quarter": flag(arr_minute_of_hour % 15 == 0),
+        "dep_minute_quarter_delta": col(_quarter_delta(dep_minute_of_hour)),
+        "arr_minute_quarter_delta": col(_quarter_delta(arr_minute_of_hour)),
+        "is_first_wave": flag(dep_hour < 7),
+        "is_morning_rush": flag((dep_hour >= 7) & (dep_hour <= 9)),
+        "is_midday": flag((dep_hour >= 10) & (dep_hour <= 15)),
+        "is_afternoon_rush": flag((dep_hour >= 16) & (dep_hour <= 19)),
+        "is_late_night": flag((dep_hour >= 21) & (dep_hour <= 23)),
+        "arrives_next_day_local": flag(
+            (arr_hour < dep_hour) | ((arr_hour == dep_hour) & (arr_minute_of_hour < dep_minute_of_hour))
+        ),
+    }
+    return pd.DataFrame(features, columns=FEATURE_COLUMNS)
@@ -0,0 +1,268 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Rows evaluated at once; bounds the (rows x trees) index matrices.
+CHUNK_ROWS = 4096
+
+# Single-file forest (CompiledForest.export / from_file):
+#   magic | uint32 format | uint32 manifest length | manifest JSON | arrays
+# Each array starts on a FOREST_ALIGN boundary at the offset the manifest
+# gives, so the file is memory-mapped and used in place; nothing is unpickled.
+FOREST_MAGIC = b"SKYFRST\0"
+FOREST_FORMAT = 1
+FOREST_ALIGN = 64
+# Leaf distributions as probabilities (float64, float32) or as uint16 counts
+# out of LEAF_SCALE per leaf (about 8e-6 worst-case error per class).
+LEAF_ENCODINGS = ("uint16", "float32", "float64")
+LEAF_SCALE = 65535
+
+
+def quantize_leaves(value, scale=LEAF_SCALE):
+    """Leaf distributions as uint16 counts that sum to exactly `scale` per leaf
+    (largest remainder), so quantized probabilities still sum to one."""
+    scaled = np.asarray(value, dtype=np.float64) * scale
+    counts = np.floor(scaled)
+    short = (scale - counts.sum(axis=1)).astype(np.int64)
+    short[scaled.sum(axis=1) == 0] = 0
+    order = np.argsort(counts - scaled, axis=1, kind="stable")
+    bump = np.arange(value.shape[1])[None, :] < short[:, None]
+    np.put_along_axis(counts, order, np.take_along_axis(counts, order, axis=1) + bump, axis=1)
+    return counts.astype(np.uint16)
+
+
+def floor_float32(values):
+    """Largest float32 <= each value.
+
+    For any float32 x, `x <= floor_float32(t)` is exactly `x <= t`, so splits can
+    be evaluated in float32 without changing a single decision.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = values.astype(np.float32)
+    up = out > values
+    out[up] = np.nextafter(out[up], np.float32(-np.inf))
+    return out
+
+
+def _align(offset):
+    return -(-offset // FOREST_ALIGN) * FOREST_ALIGN
+
+
+class CompiledForest:
+    """A fitted RandomForestClassifier flattened into contiguous node arrays.
+
+    All trees share one node table; `children[2 * node + go_right]` is the next
+    node and leaves point to themselves. A batch is evaluated by stepping every
+    (row, tree) pair max_depth times with array indexing instead of going
+    through sklearn's per-tree joblib dispatch.
+    """
+
+    def __init__(self, feature, threshold, children, missing_left, value, roots, max_depth,
+                 classes, feature_names=None, value_scale=1.0):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = classes
+        self.feature_names = None if feature_names is None else list(feature_names)
+        # Leaf values are probabilities times value_scale (1.0 unless quantized).
+        self.value_scale = float(value_scale)
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, children, missing, values, roots = [], [], [], [], [], []
+        offset = 0
+        for est in forest.estimators_:
+            tree = est.tree_
+            n = tree.node_count
+            is_leaf = tree.children_left == -1
+            own = np.arange(offset, offset + n)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, 0.0, tree.threshold))
+            children.append(np.column_stack([
+                np.where(is_leaf, own, tree.children_left + offset),
+                np.where(is_leaf, own, tree.children_right + offset),
+            ]).ravel())
+            missing.append(np.asarray(getattr(tree, "missing_go_to_left", np.zeros(n)), dtype=bool))
+            value = tree.value[:, 0, :].astype(np.float64)
+            norm = value.sum(axis=1, keepdims=True)
+            norm[norm == 0.0] = 1.0
+            values.append(value / norm)
+            roots.append(offset)
+            offset += n
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=floor_float32(np.concatenate(thresholds)),
+            children=np.concatenate(children).astype(np.int32),
+            missing_left=np.concatenate(missing),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max(est.tree_.max_depth for est in forest.estimators_),
+            classes=np.asarray(forest.classes_),
+            feature_names=getattr(forest, "feature_names_in_", None),
+        )
+
+    _ARRAYS = ("feature", "threshold", "children", "missing_left", "value", "roots", "classes_")
+
+    def save(self, directory):
+        """Write the node arrays as .npy files (plus meta.json) into `directory`.
+
+        The directory is populated under a temporary name and renamed into place,
+        so concurrent readers never see a half-written forest.
+        """
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".forest-", dir=parent)
+        try:
+            for name in self._ARRAYS:
+                np.save(os.path.join(tmp, f"{name}.npy"), getattr(self, name))
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"max_depth": self.max_depth, "feature_names": self.feature_names}, f)
+            os.replace(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(directory):
+                raise
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in cls._ARRAYS
+        }
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return cls(
+            feature=arrays["feature"], threshold=arrays["threshold"], children=arrays["children"],
+            missing_left=arrays["missing_left"], value=arrays["value"], roots=arrays["roots"],
+            max_depth=meta["max_depth"], classes=np.asarray(arrays["classes_"]),
+            feature_names=meta["feature_names"],
+        )
+
+    def export(self, path, leaf_encoding="uint16"):
+        """Write the forest as one flat, versioned binary file (see FOREST_MAGIC).
+
+        Written under a temporary name and renamed into place, like save().
+        """
+        if leaf_encoding not in LEAF_ENCODINGS:
+            raise ValueError(f"leaf_encoding must be one of {', '.join(LEAF_ENCODINGS)}, not {leaf_encoding!r}")
+        if leaf_encoding == "uint16":
+            value, value_scale = quantize_leaves(np.asarray(self.value) / self.value_scale), LEAF_SCALE
+        else:
+            value, value_scale = np.asarray(self.value, dtype=leaf_encoding) / self.value_scale, 1.0
+        arrays = {
+            "feature": np.asarray(self.feature, dtype=np.int32),
+            "threshold": np.asarray(self.threshold, dtype=np.float32),
+            "children": np.asarray(self.children, dtype=np.int32),
+            "missing_left": np.asarray(self.missing_left, dtype=bool),
+            "value": np.asarray(value, dtype=leaf_encoding),
+            "roots": np.asarray(self.roots, dtype=np.int32),
+        }
+        classes = np.asarray(self.classes_)
+        manifest = {
+            "format": FOREST_FORMAT, "max_depth": self.max_depth, "n_trees": self.n_trees,
+            "feature_names": self.feature_names, "classes": classes.tolist(), "classes_dtype": classes.dtype.str,
+            "leaf_encoding": leaf_encoding, "value_scale": value_scale, "arrays": {},
+        }
+        # Offsets depend on the manifest's length, which depends on the offsets;
+        # reserve room for them and pad the manifest to the reserved size.
+        for name, array in arrays.items():
+            manifest["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": 10 ** 12}
+        reserved = len(json.dumps(manifest).encode("utf-8"))
+        offset = _align(len(FOREST_MAGIC) + 8 + reserved)
+        for name, array in arrays.items():
+            manifest["arrays"][name]["offset"] = offset
+            offset = _align(offset + array.nbytes)
+        header = json.dumps(manifest).encode("utf-8").ljust(reserved)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=".forest-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(FOREST_MAGIC)
+                f.write(np.array([FOREST_FORMAT, reserved], dtype="<u4").tobytes())
+                f.write(header)
+                for name, array in arrays.items():
+                    f.write(b"\0" * (manifest["arrays"][name]["offset"] - f.tell()))
+                    f.write(np.ascontiguousarray(array).tobytes())
+            os.replace(tmp, path)
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def from_file(cls, path, mmap_mode="r"):
+        """Open a file written by export(); the arrays are views into one memory map."""
+        data = np.memmap(path, dtype=np.uint8, mode=mmap_mode) if mmap_mode else np.fromfile(path, dtype=np.uint8)
+        if bytes(data[:len(FOREST_MAGIC)]) != FOREST_MAGIC:
+            raise ValueError(f"{path} is not a forest file")
+        fmt, length = np.frombuffer(bytes(data[len(FOREST_MAGIC):len(FOREST_MAGIC) + 8]), dtype="<u4")
+        if fmt != FOREST_FORMAT:
+            raise ValueError(f"Unsupported forest format in {path}: {int(fmt)}")
+        start = len(FOREST_MAGIC) + 8
+        manifest = json.loads(bytes(data[start:start + int(length)]).decode("utf-8"))
+
+        def array(name):
+            spec = manifest["arrays"][name]
+            dtype = np.dtype(spec["dtype"])
+            count = int(np.prod(spec["shape"], dtype=np.int64))
+            stop = spec["offset"] + count * dtype.itemsize
+            return data[spec["offset"]:stop].view(dtype).reshape(spec["shape"])
+
+        return cls(
+            feature=array("feature"), threshold=array("threshold"), children=array("children"),
+            missing_left=array("missing_left"), value=array("value"), roots=array("roots"),
+            max_depth=manifest["max_depth"],
+            classes=np.asarray(manifest["classes"], dtype=np.dtype(manifest["classes_dtype"])),
+            feature_names=manifest["feature_names"], value_scale=manifest["value_scale"],
+        )
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def _as_matrix(self, X):
+        if isinstance(X, pd.DataFrame):
+            if self.feature_names is not None:
+                X = X[self.feature_names]
+            X = X.to_numpy(np.float64)
+        # sklearn evaluates splits on float32 inputs, like the thresholds here.
+        return np.ascontiguousarray(np.asarray(X, dtype=np.float64).astype(np.float32))
+
+    def _leaves(self, X):
+        n_rows, n_features = X.shape
+        row_base = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        nodes = np.broadcast_to(self.roots.astype(np.intp), (n_rows, self.n_trees))
+        flat = X.ravel()
+        has_missing = bool(np.isnan(flat).any())
+        for _ in range(self.max_depth):
+            x = flat.take(row_base + self.feature.take(nodes))
+            go_right = ~(x <= self.threshold.take(nodes))
+            if has_missing:
+                go_right &= ~(np.isnan(x) & self.missing_left.take(nodes))
+            nodes = self.children.take(2 * nodes + go_right)
+        return nodes
+
+    def apply(self, X):
+        """Leaf node index reached in every tree, shape (n_rows, n_trees)."""
+        return self._leaves(self._as_matrix(X))
+
+    def predict_proba(self, X):
+        X = self._as_matrix(X)
+        out = np.empty((len(X), self.value.shape[1]), dtype=np.float64)
+        for start in range(0, len(X), CHUNK_ROWS):
+            leaves = self._leaves(X[start:start + CHUNK_ROWS])
+            votes = np.einsum("ntc->nc", self.value.take(leaves, axis=0), dtype=np.float64)
+            out[start:start + CHUNK_ROWS] = votes / (self.n_trees * self.value_scale)
+        return out
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
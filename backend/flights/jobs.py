@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import ParseJob
+from .parser import get_parse_cache, parse_cache_key, parse_itinerary
+
+logger = logging.getLogger(__name__)
+
+
+def submit_job(filename, content_type, fh, digest):
+    """Queue an upload (a binary file object and its SHA-256) for background
+    parsing and return its ParseJob.
+
+    Uploads already in the parse cache come back as finished jobs.
+    """
+    cache = get_parse_cache()
+    cached = cache.get(parse_cache_key(digest)) if cache is not None else None
+    if cached is not None:
+        now = timezone.now()
+        return ParseJob.objects.create(
+            filename=filename, content_type=content_type, status=ParseJob.DONE,
+            result=cached, cache_hit=True, parse_tier="cache", started_at=now, finished_at=now,
+        )
+
+    job = ParseJob(filename=filename, content_type=content_type)
+    os.makedirs(settings.PARSE_JOB_SPOOL_DIR, exist_ok=True)
+    job.spool_path = os.path.join(settings.PARSE_JOB_SPOOL_DIR, f"{job.id}.bin")
+    with open(job.spool_path, "wb") as out:
+        shutil.copyfileobj(fh, out)
+    job.save()
+    ensure_inprocess_workers()
+    return job
+
+
+def _remove_spool(path):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def claim_next_job():
+    """Atomically move the oldest runnable job to RUNNING; None if there is none.
+
+    A RUNNING job whose worker has not sent a heartbeat for PARSE_JOB_TIMEOUT
+    seconds (the worker died) is retried until it has used
+    PARSE_JOB_MAX_ATTEMPTS. A slow parse keeps its heartbeat going and is
+    never taken over.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.PARSE_JOB_TIMEOUT)
+    abandoned = ParseJob.objects.filter(
+        status=ParseJob.RUNNING, heartbeat_at__lt=stale, attempts__gte=settings.PARSE_JOB_MAX_ATTEMPTS,
+    )
+    for job_id, spool_path in abandoned.values_list("id", "spool_path"):
+        failed = ParseJob.objects.filter(id=job_id, status=ParseJob.RUNNING, heartbeat_at__lt=stale).update(
+            status=ParseJob.FAILED, error="Gave up after repeated worker timeouts.", finished_at=now,
+        )
+        if failed:
+            _remove_spool(spool_path)
+
+    candidates = (
+        ParseJob.objects
+        .filter(Q(status=ParseJob.PENDING) | Q(status=ParseJob.RUNNING, heartbeat_at__lt=stale))
+        .order_by("created_at")
+        .values_list("id", "status", "heartbeat_at")[:16]
+    )
+    for job_id, status, heartbeat_at in candidates:
+        claimed = ParseJob.objects.filter(id=job_id, status=status, heartbeat_at=heartbeat_at).update(
+            status=ParseJob.RUNNING, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1,
+        )
+        if claimed:
+            return ParseJob.objects.get(id=job_id)
+    return None
+
+
+def _heartbeat(job_id, stop):
+    try:
+        while not stop.wait(settings.PARSE_JOB_HEARTBEAT_INTERVAL):
+            ParseJob.objects.filter(id=job_id, status=ParseJob.RUNNING).update(heartbeat_at=timezone.now())
+    except Exception:
+        logger.exception("Heartbeat of parse job %s failed", job_id)
+    finally:
+        connection.close()
+
+
+def run_job(job):
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job.id, stop), name=f"parse-heartbeat-{job.id}", daemon=True)
+    heartbeat.start()
+    try:
+        with open(job.spool_path, "rb") as fh:
+            job.result, job.parse_tier = parse_itinerary(job.filename, fh, job.content_type)
+        job.cache_hit = job.parse_tier == "cache"
+        job.status = ParseJob.DONE
+    except Exception as exc:
+        logger.exception("Parse job %s failed", job.id)
+        job.status = ParseJob.FAILED
+        job.error = f"{type(exc).__name__}: {exc}"
+    finally:
+        stop.set()
+        heartbeat.join()
+    job.finished_at = timezone.now()
+    job.save(update_fields=["status", "result", "cache_hit", "parse_tier", "error", "finished_at"])
+    _remove_spool(job.spool_path)
+    return job
+
+
+def run_pending_jobs(limit=None):
+    """Process runnable jobs on the calling thread; returns how many ran."""
+    done = 0
+    while limit is None or done < limit:
+        job = claim_next_job()
+        if job is None:
+            break
+        run_job(job)
+        done += 1
+    return done
+
+
+class JobWorkerPool:
+    """Threads that poll the ParseJob table and parse one upload at a time each.
+
+    The pool size is the parse concurrency, independent of how many uploads
+    the web workers accept.
+    """
+
+    def __init__(self, concurrency, poll_interval):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+        self.pid = None
+
+    def start(self):
+        self.pid = os.getpid()
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._work, name=f"parse-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _work(self):
+        try:
+            while not self._stop.is_set():
+                close_old_connections()
+                try:
+                    job = claim_next_job()
+                    if job is not None:
+                        run_job(job)
+                        continue
+                except Exception:
+                    logger.exception("Parse worker error")
+                self._stop.wait(self.poll_interval)
+        finally:
+            connection.close()
+
+
+_inprocess_pool = None
+_inprocess_lock = threading.Lock()
+
+
+def ensure_inprocess_workers():
+    # With PARSE_JOB_WORKERS > 0 every web process runs its own small pool, so
+    # job mode works without a separate `manage.py run_parse_workers`.
+    global _inprocess_pool
+    if settings.PARSE_JOB_WORKERS <= 0:
+        return
+    with _inprocess_lock:
+        if _inprocess_pool is None or _inprocess_pool.pid != os.getpid():
+            _inprocess_pool = JobWorkerPool(settings.PARSE_JOB_WORKERS, settings.PARSE_JOB_POLL_INTERVAL).start()
+
+
+async def job_events(job_id, poll_interval=0.5, timeout=None):
+    """Server-sent events for a job: a `status` event on every change, then one
+    `result` event when it finishes (or `timeout` when it does not in time).
+
+    An async generator, so under ASGI a watcher holds no thread while it
+    waits. Streams end after PARSE_JOB_EVENTS_TIMEOUT and EventSource
+    clients reconnect after the `retry` delay, so under WSGI a watcher ties
+    up a thread for at most that long.
+    """
+    timeout = settings.PARSE_JOB_EVENTS_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    get_job = sync_to_async(lambda: ParseJob.objects.filter(id=job_id).first())
+    last_status = None
+    yield f"retry: {settings.PARSE_JOB_EVENTS_RETRY_MS}\n\n"
+    while True:
+        job = await get_job()
+        if job is None:
+            yield "event: error\ndata: {\"error\": \"Job not found.\"}\n\n"
+            return
+        if job.status != last_status:
+            last_status = job.status
+            yield f"event: status\ndata: {json.dumps({'status': job.status})}\n\n"
+        if job.status in ParseJob.FINISHED:
+            yield f"event: result\ndata: {json.dumps(job.as_dict())}\n\n"
+            return
+        if time.monotonic() >= deadline:
+            yield "event: timeout\ndata: {}\n\n"
+            return
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,450 @@
+"""Local tiers tried before the LLM parser (flights.parser.parse_itinerary).
+
+Text is pulled out of the upload (pypdf when installed, otherwise a small
+content-stream reader that handles simply encoded PDFs), and IATA boarding pass
+barcodes (BCBP) are decoded from that text or, with zxing-cpp and Pillow
+installed, from images. A tier only answers when every segment has both
+airports, both times, the airline and flight number, and a plausible block
+time; anything less goes to the LLM.
+"""
+import io
+import logging
+import re
+import zlib
+from datetime import date, datetime, time, timedelta
+
+from django.conf import settings
+
+from .registry import registry
+from .utils import calculate_flight_duration
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+try:
+    import zxingcpp
+    from PIL import Image
+except ImportError:
+    zxingcpp = None
+
+logger = logging.getLogger(__name__)
+
+# Block times outside this window (minutes) mean the fields were mismatched.
+MIN_BLOCK_MINUTES = 15
+MAX_BLOCK_MINUTES = 20 * 60
+
+
+# --- Text extraction -------------------------------------------------------
+
+_STREAM_RE = re.compile(rb"stream\r?\n(.*?)\r?\nendstream", re.S)
+_PDF_TOKEN_RE = re.compile(rb"\(|-?\d*\.?\d+|[A-Za-z'\"*]+|\[|\]")
+_PDF_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f"}
+_PDF_LINE_OPS = {b"Td", b"TD", b"T*", b"Tm", b"ET", b"'", b'"'}
+
+
+def _pdf_string(raw):
+    def unescape(m):
+        esc = m.group(1)
+        if esc[:1].isdigit():
+            return bytes([int(esc, 8) & 0xFF])
+        if esc in (b"\n", b"\r"):
+            return b""
+        return _PDF_ESCAPES.get(esc, esc)
+    return re.sub(rb"\\([0-7]{1,3}|.)", unescape, raw, flags=re.S).decode("latin-1")
+
+
+def _pdf_string_end(content, start):
+    # Literal strings may nest balanced parentheses: (New York (JFK)).
+    depth, i = 0, start
+    while i < len(content):
+        c = content[i:i + 1]
+        if c == b"\\":
+            i += 1
+        elif c == b"(":
+            depth += 1
+        elif c == b")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(content)
+
+
+def _content_stream_text(content):
+    lines, line, in_array = [], [], False
+    pos = 0
+    while True:
+        m = _PDF_TOKEN_RE.search(content, pos)
+        if m is None:
+            break
+        tok, pos = m.group(0), m.end()
+        if tok == b"(":
+            end = _pdf_string_end(content, m.start())
+            line.append(_pdf_string(content[m.end():end]))
+            pos = end + 1
+        elif tok == b"[":
+            in_array = True
+        elif tok == b"]":
+            in_array = False
+        elif in_array:
+            # A large negative kern inside a TJ array is a word gap.
+            if float(tok) < -200:
+                line.append(" ")
+        elif tok in _PDF_LINE_OPS and line:
+            lines.append("".join(line))
+            line = []
+    if line:
+        lines.append("".join(line))
+    return "\n".join(lines)
+
+
+def extract_pdf_text(raw):
+    if pypdf is not None:
+        try:
+            reader = pypdf.PdfReader(io.BytesIO(raw))
+            return "\n".join(page.extract_text() or "" for page in reader.pages)
+        except Exception:
+            logger.debug("pypdf could not read the upload", exc_info=True)
+    parts = []
+    for m in _STREAM_RE.finditer(raw):
+        body = m.group(1)
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            pass
+        if b"BT" in body:
+            parts.append(_content_stream_text(body))
+    return "\n".join(parts)
+
+
+def extract_text(raw, content_type):
+    if content_type == "application/pdf":
+        return extract_pdf_text(raw)
+    if content_type.startswith("text/"):
+        return raw.decode("utf-8", "replace")
+    return ""
+
+
+def decode_barcodes(raw, content_type):
+    if zxingcpp is None or not content_type.startswith("image/"):
+        return []
+    try:
+        return [b.text for b in zxingcpp.read_barcodes(Image.open(io.BytesIO(raw)))]
+    except Exception:
+        logger.debug("Could not decode barcodes in the upload", exc_info=True)
+        return []
+
+
+# --- BCBP ------------------------------------------------------------------
+
+_BCBP_RE = re.compile(r"M[1-9].{58,}")
+
+
+def parse_bcbp(data):
+    """Legs of an IATA BCBP string as dicts, or None if it is not one.
+
+    Only the mandatory items are read; the year is not encoded, so the Julian
+    date is resolved against the current year.
+    """
+    if len(data) < 60 or data[0] != "M" or not data[1].isdigit():
+        return None
+    airports = registry.get("airport_index")
+    legs, pos = [], 23
+    for _ in range(int(data[1])):
+        leg = data[pos:pos + 37]
+        if len(leg) < 37:
+            return None
+        origin, dest = leg[7:10], leg[10:13]
+        airline = leg[13:16].strip()
+        number = leg[16:21].strip().rstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ ")
+        julian = leg[21:24]
+        if not (origin in airports and dest in airports and len(airline) == 2
+                and number.isdigit() and julian.isdigit() and 1 <= int(julian) <= 366):
+            return None
+        try:
+            conditional_size = int(leg[35:37], 16)
+        except ValueError:
+            return None
+        legs.append({
+            "origin": origin,
+            "dest": dest,
+            "airline": airline,
+            "number": str(int(number)),
+            "date": date(date.today().year, 1, 1) + timedelta(days=int(julian) - 1),
+        })
+        pos += 37 + conditional_size
+    return legs
+
+
+def bcbp_legs(text, barcodes):
+    legs = []
+    candidates = list(barcodes) + [m.group(0) for line in text.splitlines() for m in _BCBP_RE.finditer(line)]
+    for candidate in candidates:
+        legs.extend(parse_bcbp(candidate) or [])
+    return legs
+
+
+# --- Free text -------------------------------------------------------------
+
+_FLIGHT_RE = re.compile(
+    r"(?P<label>\b(?i:flight)(?:\s*(?i:no\.?|number|#))?[:\s]*)?"
+    r"\b(?P<airline>[A-Z][A-Z\d]|\d[A-Z])(?P<space>\s?)(?P<number>\d{1,4})\b"
+)
+_AIRPORT_RES = (
+    re.compile(r"\(([A-Z]{3})\)"),
+    re.compile(r"\b([A-Z]{3})\s*(?:-|–|—|→|->|>|/|\bto\b|\bTO\b)\s*([A-Z]{3})\b"),
+    re.compile(r"\b(?i:from|to|depart\w*|arriv\w*|origin|destination)\b[:\s]+([A-Z]{3})\b"),
+)
+_TIME_RE = re.compile(r"(?<!\d)([01]?\d|2[0-3]):([0-5]\d)(?:\s*(?i:([ap])\.?m\b\.?))?")
+_MONTH = (
+    r"(?i:(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?"
+    r"|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b\.?)"
+)
+_DATE_RES = (
+    ("ymd", re.compile(r"\b(\d{4})-(\d{2})-(\d{2})(?!\d)")),
+    ("dmy", re.compile(rf"\b(\d{{1,2}})\s*{_MONTH},?\s*(\d{{4}})?")),
+    ("mdy", re.compile(rf"\b{_MONTH}\s*(\d{{1,2}})(?:st|nd|rd|th)?\b,?\s*(\d{{4}})?")),
+    ("slash", re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b")),
+)
+_MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1
+)}
+
+# Aircraft type designators that read as a two-character airline code and a
+# number (A320, B738, E175, Q400, MD88, DC10); only trusted behind a flight label.
+_EQUIPMENT_RE = re.compile(r"A[23]\d\d|B7[0-8]\d|E(?:1[4-9]|2\d)\d|Q[1-4]00|MD\d\d|DC\d\d?")
+
+# Labels whose numbers look like flights or times but are not.
+_NOT_A_FLIGHT = ("gate", "seat", "terminal", "zone", "group", "row", "aircraft", "equipment")
+_NOT_A_FLIGHT_TIME = ("board", "gate clos", "check-in", "check in")
+
+
+def _preceded_by(text, start, labels, width=16):
+    before = text[max(0, start - width):start].lower()
+    return any(label in before for label in labels)
+
+
+def _year(value):
+    year = int(value) if value else date.today().year
+    return year if 2000 <= year <= 2100 else date.today().year
+
+
+def _make_date(kind, groups):
+    if kind == "ymd":
+        y, m, d = (int(g) for g in groups)
+    elif kind == "dmy":
+        d, m, y = int(groups[0]), _MONTHS[groups[1][:3].lower()], _year(groups[2])
+    elif kind == "mdy":
+        m, d, y = _MONTHS[groups[0][:3].lower()], int(groups[1]), _year(groups[2])
+    else:
+        a, b, y = (int(g) for g in groups)
+        if a > 12:
+            d, m = a, b
+        elif b > 12:
+            m, d = a, b
+        else:
+            return None  # 03/04/2025: day and month order is ambiguous
+    try:
+        return date(y, m, d)
+    except ValueError:
+        return None
+
+
+def find_dates(text):
+    found = []
+    for kind, pattern in _DATE_RES:
+        for m in pattern.finditer(text):
+            value = _make_date(kind, m.groups())
+            if value is not None:
+                has_year = m.groups()[-1] is not None
+                found.append((not has_year, m.start(), m.end(), value))
+    # Where matches overlap ("DL 7 Oct 3, 2025") the one with a year wins.
+    found.sort()
+    taken = []
+    for _, start, end, value in found:
+        if all(end <= s or start >= e for s, e, _ in taken):
+            taken.append((start, end, value))
+    return sorted((start, value) for start, _, value in taken)
+
+
+def find_times(text):
+    times = []
+    for m in _TIME_RE.finditer(text):
+        if _preceded_by(text, m.start(), _NOT_A_FLIGHT_TIME):
+            continue
+        hour, minute, meridiem = int(m.group(1)), int(m.group(2)), m.group(3)
+        if meridiem:
+            if not 1 <= hour <= 12:
+                continue
+            hour = hour % 12 + (12 if meridiem.lower() == "p" else 0)
+        times.append((m.start(), time(hour, minute)))
+    return times
+
+
+def find_airports(text):
+    airports = registry.get("airport_index")
+    found = []
+    for pattern in _AIRPORT_RES:
+        for m in pattern.finditer(text):
+            for i in range(1, pattern.groups + 1):
+                if m.group(i) in airports:
+                    found.append((m.start(i), m.group(i)))
+    codes = []
+    for _, code in sorted(set(found)):
+        if not codes or codes[-1] != code:
+            codes.append(code)
+    return codes
+
+
+def find_flights(text):
+    flights = []
+    for m in _FLIGHT_RE.finditer(text):
+        if not (m.group("label") or not m.group("space")):
+            continue
+        if not m.group("label") and _EQUIPMENT_RE.fullmatch(m.group("airline") + m.group("number")):
+            continue
+        if _preceded_by(text, m.start("airline"), _NOT_A_FLIGHT):
+            continue
+        flight = (m.group("airline"), str(int(m.group("number"))))
+        if flights and flights[-1][1] == flight:
+            continue
+        flights.append((m.start(), flight))
+    return flights
+
+
+def text_blocks(text):
+    """Split text into one block per flight number: (airline, number, block)."""
+    flights = find_flights(text)
+    blocks = []
+    for i, (start, (airline, number)) in enumerate(flights):
+        begin = 0 if i == 0 else start
+        end = flights[i + 1][0] if i + 1 < len(flights) else len(text)
+        blocks.append((airline, number, text[begin:end]))
+    return blocks
+
+
+def segment_from_block(airline, number, block):
+    codes = find_airports(block)
+    dates = find_dates(block)
+    times = find_times(block)
+    if len(codes) < 2 or not dates or len(times) < 2:
+        return None
+    return {
+        "origin": codes[0],
+        "dest": codes[1],
+        "airline": airline,
+        "number": number,
+        "date": dates[0][1],
+        "dep": times[0][1],
+        "arr": times[1][1],
+    }
+
+
+# --- Assembly --------------------------------------------------------------
+
+def _fmt(value):
+    return value.strftime("%Y-%m-%dT%H:%M")
+
+
+def segment_item(segment, notes):
+    """A PARSER_PROMPT item for a complete segment, or None when no arrival
+    day gives a plausible block time."""
+    if segment["origin"] == segment["dest"]:
+        return None
+    departure = datetime.combine(segment["date"], segment["dep"])
+    arrivals = []
+    for days in (0, 1, -1, 2):
+        arrival = datetime.combine(segment["date"] + timedelta(days=days), segment["arr"])
+        minutes = calculate_flight_duration(_fmt(departure), _fmt(arrival), segment["origin"], segment["dest"])
+        if MIN_BLOCK_MINUTES <= minutes <= MAX_BLOCK_MINUTES:
+            arrivals.append(arrival)
+    if len(arrivals) != 1:
+        return None
+    return {
+        "relevant": True,
+        "departure_airport": segment["origin"],
+        "arrival_airport": segment["dest"],
+        "departure_datetime_local": _fmt(departure),
+        "arrival_datetime_local": _fmt(arrivals[0]),
+        "airline_iata": segment["airline"],
+        "flight_number": segment["airline"] + segment["number"],
+        "missing_fields": [],
+        "notes": notes,
+    }
+
+
+def _items(segments, notes):
+    if not segments or any(s is None for s in segments):
+        return None
+    items = [segment_item(s, notes) for s in segments]
+    if any(i is None for i in items):
+        return None
+    return sorted(items, key=lambda i: i["departure_datetime_local"])
+
+
+def parse_bcbp_tier(text, barcodes):
+    legs = bcbp_legs(text, barcodes)
+    if not legs:
+        return None
+    blocks = {(airline, number): block for airline, number, block in text_blocks(text)}
+    segments = []
+    for leg in legs:
+        # The barcode has the route and flight; times come from the printed text.
+        block = blocks.get((leg["airline"], leg["number"]))
+        if block is None and len(legs) == 1:
+            block = text
+        times = find_times(block) if block else []
+        dates = find_dates(block) if block else []
+        if len(times) < 2:
+            return None
+        segments.append(dict(leg, date=dates[0][1] if dates else leg["date"], dep=times[0][1], arr=times[1][1]))
+    return _items(segments, "Parsed locally from the boarding pass barcode and document text.")
+
+
+def parse_text_tier(text):
+    blocks = text_blocks(text)
+    if not blocks:
+        return None
+    return _items(
+        [segment_from_block(*b) for b in blocks],
+        "Parsed locally from the document text.",
+    )
+
+
+def _read_limited(data):
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data) if len(data) <= settings.PARSER_LOCAL_MAX_BYTES else None
+    data.seek(0, io.SEEK_END)
+    size = data.tell()
+    data.seek(0)
+    if size > settings.PARSER_LOCAL_MAX_BYTES:
+        return None
+    raw = data.read()
+    data.seek(0)
+    return raw
+
+
+def parse_locally(data, content_type):
+    """(items, tier) from the first local tier in PARSER_LOCAL_TIERS that fully
+    parses the upload, or None when the LLM is needed."""
+    tiers = settings.PARSER_LOCAL_TIERS
+    if not tiers:
+        return None
+    try:
+        raw = _read_limited(data)
+        if raw is None:
+            return None
+        text = extract_text(raw, content_type)
+        parsers = {
+            "bcbp": lambda: parse_bcbp_tier(text, decode_barcodes(raw, content_type)),
+            "text": lambda: parse_text_tier(text),
+        }
+        for tier in tiers:
+            items = parsers[tier]()
+            if items is not None:
+                return items, tier
+    except Exception:
+        logger.exception("Local parse failed; falling back to the LLM")
+    return None
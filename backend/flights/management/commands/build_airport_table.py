@@ -0,0 +1,29 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from flights.airports import AirportIndex
+from flights.utils import airport_table_path, build_airport_index
+
+
+class Command(BaseCommand):
+    help = "Merge airports.json and airportsdata into the airport table read by serving and gen_embeddings.py."
+    # The system checks insist on the table this command builds.
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=airport_table_path)
+
+    def handle(self, *args, **options):
+        index = build_airport_index()
+        index.save(options["output"])
+
+        started = time.perf_counter()
+        AirportIndex.load(options["output"])
+        load_ms = (time.perf_counter() - started) * 1e3
+        self.stdout.write(
+            f"Wrote {options['output']}: {len(index.codes):,} airports ({index.n_served} served), "
+            f"{len(index.tz_names)} time zones, {os.path.getsize(options['output']) / 1024:.0f} KiB, "
+            f"loads in {load_ms:.1f} ms."
+        )
@@ -0,0 +1,61 @@
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.neighbors import NeighborIndex
+
+
+def read_month(entry, features):
+    # Entries as written by model/gen_embeddings.py; .npy months are memory-mapped.
+    if "npy" in entry:
+        return np.load(entry["npy"], mmap_mode="r")
+    if "parquet" in entry:
+        return pd.read_parquet(entry["parquet"], columns=features).to_numpy(np.float32)
+    return pd.read_csv(entry["csv"], usecols=features)[features].to_numpy(np.float32)
+
+
+class Command(BaseCommand):
+    help = "Build the nearest-neighbor delay index from model/gen_embeddings.py output (fastest from --format npy)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("embeddings", help="gen_embeddings.py --output directory (holds manifest.json)")
+        parser.add_argument("--output", default=settings.NEIGHBOR_INDEX_DIR)
+        parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default 4 * sqrt(rows))")
+        parser.add_argument("--sample-size", type=int, default=None, help="rows k-means is fit on")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        root = options["embeddings"]
+
+        def load(name):
+            try:
+                with open(os.path.join(root, name), "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except OSError as exc:
+                raise CommandError(f"Cannot read {name} in {root}: {exc}")
+
+        manifest = load("manifest.json")
+        features = manifest.get("features") or load("feature_schema.json")["features"]
+        config = manifest.get("config") or load("config.json")
+        entries = [e for e in manifest["files"] if e.get("rows_out")]
+        if not entries:
+            raise CommandError(f"No embeddings listed in {root}/manifest.json.")
+
+        started = time.perf_counter()
+        index = NeighborIndex.build(
+            lambda: (read_month(e, features) for e in entries),
+            nlist=options["nlist"], sample_size=options["sample_size"], seed=options["seed"],
+            directory=options["output"],
+            airline_stats=load("airline_embeddings.json"), airport_busyness=load("airport_busyness.json"),
+            scales={k: config[k] for k in ("distance_scale", "elapsed_scale", "route_vec_div", "coord_scale") if k in config},
+            features=features,
+        )
+        self.stdout.write(
+            f"Indexed {len(index.vectors):,} flights from {len(entries)} months into {options['output']} "
+            f"({index.nlist} lists) in {time.perf_counter() - started:.1f} s."
+        )
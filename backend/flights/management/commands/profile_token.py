@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.profiling import make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Print a signed X-Profile header value that makes ProfilingMiddleware profile a request."
+
+    def handle(self, *args, **options):
+        if not settings.PROFILE_SIGNING_KEY:
+            raise CommandError("Set PROFILE_SIGNING_KEY (in the servers' environment too) to sign profile headers.")
+        if not settings.PROFILE_ENABLED:
+            self.stderr.write("PROFILE_ENABLED is off; the token is ignored until it is set.")
+        self.stdout.write(make_profile_token())
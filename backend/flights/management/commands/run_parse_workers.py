@@ -0,0 +1,32 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from flights.jobs import JobWorkerPool, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = "Parse queued itinerary uploads (job mode of /api/flights/upload)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=4, help="parses running at once")
+        parser.add_argument("--poll-interval", type=float, default=settings.PARSE_JOB_POLL_INTERVAL)
+        parser.add_argument("--once", action="store_true", help="drain the queue on this thread and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            done = run_pending_jobs()
+            self.stdout.write(f"Processed {done} job(s).")
+            return
+
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+
+        pool = JobWorkerPool(options["concurrency"], options["poll_interval"]).start()
+        self.stdout.write(f"Parse workers running (concurrency={options['concurrency']}). Ctrl+C to stop.")
+        stop.wait()
+        self.stdout.write("Stopping; waiting for running parses to finish...")
+        pool.stop()
@@ -0,0 +1,91 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from flights.model_registry import model_registry
+from flights.offline_scoring import (
+    CHUNK_ROWS, SHARD_ROWS, STATE_FILENAME, check_state, init_worker, iter_shards, part_path, score_shard,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Score a BTS-style schedule (CSV or Parquet) offline into Parquet parts of delay-bucket "
+        "probabilities. Rerunning with the same arguments resumes after the last finished shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("schedule", help="CSV or .parquet with BTS on-time columns (FlightDate, Origin, CRSDepTime, ...)")
+        parser.add_argument("output", help="directory for part-NNNNN.parquet files")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--shard-rows", type=int, default=SHARD_ROWS, help="rows per shard (and per output part)")
+        parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="rows per predict() call inside a shard")
+        parser.add_argument("--force", action="store_true", help="discard parts from an earlier, different run")
+
+    def handle(self, *args, **options):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise CommandError("score_flights writes Parquet and needs pyarrow: pip install pyarrow")
+        path, out_dir = options["schedule"], options["output"]
+        try:
+            stat = os.stat(path)
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        os.makedirs(out_dir, exist_ok=True)
+
+        model = model_registry.current()
+        state = {
+            "schedule": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime,
+            "shard_rows": options["shard_rows"], "model_version": model.version, "model_digest": model.digest,
+        }
+        if options["force"]:
+            for name in os.listdir(out_dir):
+                if name.startswith("part-") or name == STATE_FILENAME:
+                    os.unlink(os.path.join(out_dir, name))
+        try:
+            check_state(out_dir, state)
+        except ValueError as exc:
+            raise CommandError(f"{exc}; pass --force to start over.")
+
+        started = time.perf_counter()
+        rows = shards = skipped = 0
+        in_flight = {}
+        max_in_flight = 2 * options["workers"]
+
+        def collect(futures):
+            nonlocal rows, shards
+            for future in futures:
+                number = in_flight.pop(future)
+                try:
+                    _, n = future.result()
+                except ValueError as exc:
+                    raise CommandError(f"Shard {number:05d}: {exc}")
+                except Exception as exc:
+                    raise CommandError(f"Shard {number:05d} failed: {type(exc).__name__}: {exc}")
+                rows += n
+                shards += 1
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"shard {number:05d}: {n:,} rows | {shards} shards, {rows:,} rows, "
+                    f"{rows / elapsed if elapsed else 0:,.0f} rows/s"
+                )
+
+        with ProcessPoolExecutor(max_workers=options["workers"], initializer=init_worker) as pool:
+            for number, schedule in iter_shards(path, options["shard_rows"]):
+                if os.path.exists(part_path(out_dir, number)):
+                    skipped += 1
+                    continue
+                if len(in_flight) >= max_in_flight:
+                    collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+                future = pool.submit(score_shard, number, schedule, out_dir, options["chunk_rows"], model.digest)
+                in_flight[future] = number
+            collect(wait(in_flight).done)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Scored {rows:,} rows in {shards} shards ({skipped} already done) into {out_dir} "
+            f"in {elapsed:.1f} s ({rows / elapsed if elapsed else 0:,.0f} rows/s)."
+        )
@@ -0,0 +1,178 @@
+"""Per-stage request timings and counters, served as Prometheus text on /metrics.
+
+Everything lives in this worker process's memory, so each worker exposes its
+own series; scrape every worker (or sum them in Prometheus). A stage is timed
+with
+
+    with span("predict.features"):
+        ...
+
+which costs two perf_counter() calls, a dict lookup and a locked bucket
+increment: about a microsecond.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._samples(values, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _samples(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _samples(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            labels = _format_labels(self.labelnames + ("le",), values + (_format_value(float(bound)),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "skygamble_stage_seconds", "Time spent in one stage of a request path.", ["stage"],
+)
+SEGMENTS_PER_REQUEST = Histogram(
+    "skygamble_segments_per_request", "Flight legs in one scoring request.", ["endpoint"], buckets=SIZE_BUCKETS,
+)
+PREDICTION_LEGS = Counter(
+    "skygamble_prediction_legs_total", "Distinct legs scored, by where the answer came from.", ["source"],
+)
+PARSES = Counter("skygamble_parses_total", "Itinerary parses, by the tier that answered.", ["tier"])
+PARSE_FAILURES = Counter("skygamble_parse_failures_total", "Itinerary parses that raised, by error.", ["error"])
+
+METRICS = [STAGE_SECONDS, SEGMENTS_PER_REQUEST, PREDICTION_LEGS, PARSES, PARSE_FAILURES]
+
+
+class span:
+    """Time a `with` block into skygamble_stage_seconds{stage=...}."""
+
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, stage):
+        self._child = STAGE_SECONDS.labels(stage)
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(perf_counter() - self._start)
+        return False
+
+
+def render(caches=None):
+    """All metrics as Prometheus text; `caches` maps names to CountingCaches (or None)."""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    caches = {name: cache for name, cache in (caches or {}).items() if cache is not None}
+    for field in ("hits", "misses"):
+        name = f"skygamble_cache_{field}_total"
+        lines.append(f"# HELP {name} Cache lookups that {'found' if field == 'hits' else 'missed'} an entry.")
+        lines.append(f"# TYPE {name} counter")
+        for cache_name, cache in sorted(caches.items()):
+            lines.append(f'{name}{{cache="{cache_name}"}} {getattr(cache, field)}')
+    return "\n".join(lines) + "\n"
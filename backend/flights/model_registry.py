@@ -0,0 +1,211 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from joblib import load
+
+from .encoding import CategoricalEncoder
+from .forest import CompiledForest
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILENAME = "random_forest_model.joblib"
+# `manage.py export_forest` output; preferred over the joblib pickle when present.
+FOREST_FILENAME = "random_forest_model.forest"
+ENCODER_FILENAME = "categorical_encoder.json"
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def load_compiled_forest(model_path, digest, cache_dir):
+    # The flattened arrays are cached on disk keyed by the model's content hash
+    # and memory-mapped, so every worker shares one copy through the page cache.
+    forest_dir = os.path.join(cache_dir, f"forest-{digest[:16]}")
+    if not os.path.isdir(forest_dir):
+        CompiledForest.from_sklearn(load(model_path)).save(forest_dir)
+    return CompiledForest.load(forest_dir, mmap_mode="r")
+
+
+class ServingModel:
+    """One model version: the compiled forest plus its categorical encoder.
+
+    `digest` hashes the model file and the encoder's vocabulary together, so it
+    changes whenever the scores could.
+    """
+
+    def __init__(self, version, forest, encoder, digest=None):
+        self.version = version
+        self.forest = forest
+        self.encoder = encoder
+        self.digest = digest
+
+    @property
+    def classes_(self):
+        return self.forest.classes_
+
+    def predict_proba(self, df_rows):
+        with span("predict.encode"):
+            X = self.encoder.transform(df_rows)
+        with span("predict.forest"):
+            return self.forest.predict_proba(X)
+
+
+def model_file(directory):
+    """The forest file of a model directory if there is one, else its joblib pickle."""
+    forest_path = os.path.join(directory, FOREST_FILENAME)
+    return forest_path if os.path.isfile(forest_path) else os.path.join(directory, MODEL_FILENAME)
+
+
+def load_encoder(directory):
+    """The model's categorical encoder. There is no fallback: without the training
+    vocabulary every category would encode as unknown and scores would silently drift."""
+    path = os.path.join(directory, ENCODER_FILENAME)
+    try:
+        return CategoricalEncoder.load(path)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"No categorical encoder at {path}; build it with model/build_encoder.py before serving this model."
+        ) from None
+
+
+def load_serving_model(directory, version=None, cache_dir=None):
+    model_path = model_file(directory)
+    digest = file_digest(model_path)
+    if model_path.endswith(FOREST_FILENAME):
+        forest = CompiledForest.from_file(model_path)
+    else:
+        forest = load_compiled_forest(model_path, digest, cache_dir or settings.ARTIFACT_CACHE_DIR)
+    encoder = load_encoder(directory)
+    content = hashlib.sha256(digest.encode())
+    content.update(json.dumps(encoder.categories, sort_keys=True).encode())
+    return ServingModel(version or digest[:12], forest, encoder, content.hexdigest())
+
+
+def _version_key(name):
+    return [(0, int(part), "") if part.isdigit() else (1, 0, part) for part in re.split(r"(\d+)", name) if part]
+
+
+class ModelRegistry:
+    """Versioned models under `model_dir`, swapped in without a restart.
+
+    Every subdirectory `<model_dir>/<version>/` holding a random_forest_model.forest
+    or .joblib is a version; the highest one in natural sort order is served.
+    A version also needs its categorical_encoder.json and is not served
+    without it. Publish a new version by writing it under a dot-prefixed name
+    and renaming it into place. When no version exists the model in
+    `default_dir` is served, versioned by its content hash.
+
+    current() returns an immutable ServingModel. Callers hold on to it for the
+    whole request, so a swap never changes the model under an in-flight request.
+    """
+
+    def __init__(self, model_dir, default_dir, cache_dir, poll_interval=0.0):
+        self.model_dir = model_dir
+        self.default_dir = default_dir
+        self.cache_dir = cache_dir
+        self.poll_interval = poll_interval
+        self._current = None
+        self._load_lock = threading.Lock()
+        self._failed = None
+        self._watcher_pid = None
+
+    def available_versions(self):
+        try:
+            names = os.listdir(self.model_dir)
+        except FileNotFoundError:
+            return []
+        return sorted(
+            (n for n in names
+             if not n.startswith(".") and os.path.isfile(model_file(os.path.join(self.model_dir, n)))),
+            key=_version_key,
+        )
+
+    def _latest(self):
+        versions = self.available_versions()
+        if versions:
+            return versions[-1], os.path.join(self.model_dir, versions[-1])
+        return None, self.default_dir
+
+    def current(self):
+        model = self._current
+        if model is None:
+            with self._load_lock:
+                if self._current is None:
+                    version, directory = self._latest()
+                    self._current = load_serving_model(directory, version, self.cache_dir)
+                    logger.info("Serving model version %s", self._current.version)
+            model = self._current
+        self._ensure_watcher()
+        return model
+
+    def check(self):
+        """Raise ImproperlyConfigured when the version current() would serve has no
+        encoder, so a server refuses to start instead of failing every /predict."""
+        version, directory = self._latest()
+        path = os.path.join(directory, ENCODER_FILENAME)
+        if not os.path.isfile(path):
+            raise ImproperlyConfigured(
+                f"No categorical encoder at {path} for model version {version or 'default'}. "
+                "Build it from the training data with `make build-encoder DATA=flights_transformed.csv` "
+                "(model/build_encoder.py)."
+            )
+
+    def refresh(self):
+        """Load and swap in the newest version if it differs; True when swapped."""
+        version, directory = self._latest()
+        current = self._current
+        if current is not None and version in (None, current.version):
+            return False
+        stat = os.stat(model_file(directory))
+        encoder_path = os.path.join(directory, ENCODER_FILENAME)
+        encoder_mtime = os.stat(encoder_path).st_mtime_ns if os.path.exists(encoder_path) else None
+        signature = (version, stat.st_size, stat.st_mtime_ns, encoder_mtime)
+        if signature == self._failed:
+            return False
+        with self._load_lock:
+            try:
+                model = load_serving_model(directory, version, self.cache_dir)
+            except Exception:
+                self._failed = signature
+                logger.exception("Could not load model version %s; still serving %s",
+                                 version, current.version if current else None)
+                return False
+            self._current = model
+        logger.info("Swapped model version %s -> %s", current.version if current else None, model.version)
+        return True
+
+    def _ensure_watcher(self):
+        # Threads don't survive fork, so every worker process starts its own.
+        if self.poll_interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name="model-registry-watcher", daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Model registry refresh failed")
+
+
+model_registry = ModelRegistry(
+    model_dir=settings.MODEL_DIR,
+    default_dir=os.path.join(settings.BASE_DIR, "flights", "data"),
+    cache_dir=settings.ARTIFACT_CACHE_DIR,
+    poll_interval=settings.MODEL_RELOAD_INTERVAL,
+)
@@ -1,3 +1,47 @@
+import uuid
+
 from django.db import models
 
-# Create your models here.
+
+class ParseJob(models.Model):
+    """An itinerary upload queued for background parsing (flights.jobs)."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(PENDING, "Pending"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+    FINISHED = (DONE, FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=255)
+    spool_path = models.CharField(max_length=1024, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    cache_hit = models.BooleanField(default=False)
+    parse_tier = models.CharField(max_length=16, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the worker while it parses; a stale heartbeat means it died.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["created_at"]
+
+    def as_dict(self):
+        return {
+            "id": str(self.id),
+            "status": self.status,
+            "result": self.result,
+            "error": self.error or None,
+            "cache_hit": self.cache_hit,
+            "parse_tier": self.parse_tier or None,
+            "attempts": self.attempts,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
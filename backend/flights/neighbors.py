@@ -0,0 +1,341 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .registry import registry
+from .scoring import flights_frame, segments_from_flights
+
+logger = logging.getLogger(__name__)
+
+NEIGHBOR_INDEX_FORMAT = 1
+
+# model/gen_embeddings.py: every embedding ends with the two delays, which are
+# what a neighbor lookup reports rather than what it matches on.
+DELAY_COLUMNS = ["DepDelay", "ArrDelay"]
+N_DELAYS = len(DELAY_COLUMNS)
+
+DEFAULT_SCALES = {"distance_scale": 1000.0, "elapsed_scale": 300.0, "route_vec_div": 2.0, "coord_scale": 1.0}
+DELAY_QUANTILES = [0.1, 0.25, 0.5, 0.75, 0.9]
+DELAY_THRESHOLDS = [15, 30, 60]
+
+# Rows compared against the queries at once in exact search and assignment.
+CHUNK_ROWS = 65536
+
+
+def _squared_distances(queries, vectors):
+    d = (queries * queries).sum(axis=1)[:, None] - 2.0 * queries @ vectors.T + (vectors * vectors).sum(axis=1)[None, :]
+    return np.maximum(d, 0.0, out=d)
+
+
+def _nearest(queries, vectors):
+    nearest = np.empty(len(queries), dtype=np.int32)
+    for start in range(0, len(queries), CHUNK_ROWS):
+        nearest[start:start + CHUNK_ROWS] = _squared_distances(queries[start:start + CHUNK_ROWS], vectors).argmin(axis=1)
+    return nearest
+
+
+def kmeans(sample, n_clusters, iterations=10, seed=0):
+    """Lloyd's k-means on float32 rows; empty clusters are re-seeded from the sample."""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = _nearest(sample, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids, dtype=np.float64)
+        np.add.at(sums, labels, sample)
+        empty = counts == 0
+        centroids[~empty] = (sums[~empty] / counts[~empty, None]).astype(np.float32)
+        centroids[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class NeighborIndex:
+    """An IVF (inverted file) index over flight embeddings.
+
+    Vectors are clustered around `centroids` and stored grouped by cluster, so
+    list `c` is `vectors[offsets[c]:offsets[c + 1]]`. A query scans the
+    `nprobe` lists with the nearest centroids; nprobe >= nlist, or an index
+    built without lists, is exact brute-force search. All arrays are .npy
+    files memory-mapped on load, so workers share one copy.
+    """
+
+    _ARRAYS = ("centroids", "offsets", "vectors", "delays")
+
+    def __init__(self, centroids, offsets, vectors, delays, airline_stats, airport_busyness,
+                 scales=None, features=None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.vectors = vectors
+        self.delays = delays
+        self.airline_stats = airline_stats
+        self.airport_busyness = airport_busyness
+        self.scales = dict(DEFAULT_SCALES, **(scales or {}))
+        self.features = features
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrices, nlist=None, sample_size=None, seed=0, directory=None, **metadata):
+        """Cluster and store embedding matrices (each with the delay columns last).
+
+        `matrices` is a callable returning the matrices afresh; they are read
+        a few times (sizes, k-means sample, assignment, fill). With
+        `directory` the grouped vectors go straight into memory-mapped .npy
+        files there, so the corpus never has to fit in memory.
+        """
+        sizes = [len(X) for X in matrices()]
+        n = sum(sizes)
+        if n == 0:
+            raise ValueError("No embeddings to index.")
+        dim = next(X.shape[1] for X in matrices() if len(X)) - N_DELAYS
+        nlist = max(1, min(nlist or int(4 * np.sqrt(n)), n))
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(n, sample_size or 256 * nlist)
+        picks = np.sort(rng.choice(n, sample_size, replace=False))
+        sample, start = [], 0
+        for X, size in zip(matrices(), sizes):
+            rows = picks[(picks >= start) & (picks < start + size)] - start
+            sample.append(np.asarray(X[rows, :dim], dtype=np.float32))
+            start += size
+        centroids = kmeans(np.concatenate(sample), nlist, seed=seed) if nlist > 1 else np.zeros((1, dim), np.float32)
+
+        labels = np.concatenate([
+            _nearest(np.asarray(X[:, :dim], dtype=np.float32), centroids) for X in matrices()
+        ]) if nlist > 1 else np.zeros(n, dtype=np.int32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+
+        if directory is None:
+            vectors = np.empty((n, dim), dtype=np.float32)
+            delays = np.empty((n, N_DELAYS), dtype=np.float32)
+            cls._fill(vectors, delays, labels, matrices(), sizes, dim)
+            return cls(centroids, offsets, vectors, delays, **metadata)
+
+        tmp = cls._staging_dir(directory)
+        try:
+            vectors = np.lib.format.open_memmap(os.path.join(tmp, "vectors.npy"), "w+", np.float32, (n, dim))
+            delays = np.lib.format.open_memmap(os.path.join(tmp, "delays.npy"), "w+", np.float32, (n, N_DELAYS))
+            cls._fill(vectors, delays, labels, matrices(), sizes, dim)
+            vectors.flush()
+            delays.flush()
+            cls(centroids, offsets, vectors, delays, **metadata)._save_meta(tmp)
+            del vectors, delays
+            cls._publish(tmp, directory)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return cls.load(directory)
+
+    @staticmethod
+    def _fill(vectors, delays, labels, matrices, sizes, dim):
+        # Stable order keeps the rows of one list in corpus order.
+        slots = np.empty(len(labels), dtype=np.int64)
+        slots[np.argsort(labels, kind="stable")] = np.arange(len(labels))
+        start = 0
+        for X, size in zip(matrices, sizes):
+            dest = slots[start:start + size]
+            vectors[dest] = np.asarray(X[:, :dim], dtype=np.float32)
+            delays[dest] = np.asarray(X[:, dim:], dtype=np.float32)
+            start += size
+
+    @staticmethod
+    def _staging_dir(directory):
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        return tempfile.mkdtemp(prefix=".neighbors-", dir=parent)
+
+    @staticmethod
+    def _publish(tmp, directory):
+        # Readers that already mapped the old index keep their open files.
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.replace(tmp, directory)
+
+    def save(self, directory):
+        """Write the index into `directory`, renamed into place when complete."""
+        tmp = self._staging_dir(directory)
+        try:
+            np.save(os.path.join(tmp, "vectors.npy"), np.asarray(self.vectors))
+            np.save(os.path.join(tmp, "delays.npy"), np.asarray(self.delays))
+            self._save_meta(tmp)
+            self._publish(tmp, directory)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def _save_meta(self, directory):
+        np.save(os.path.join(directory, "centroids.npy"), self.centroids)
+        np.save(os.path.join(directory, "offsets.npy"), self.offsets)
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": NEIGHBOR_INDEX_FORMAT,
+                "size": int(len(self.vectors)),
+                "dim": int(self.vectors.shape[1]),
+                "nlist": self.nlist,
+                "scales": self.scales,
+                "features": self.features,
+                "airline_stats": self.airline_stats,
+                "airport_busyness": self.airport_busyness,
+            }, f)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("format") != NEIGHBOR_INDEX_FORMAT:
+            raise ValueError(f"Unsupported neighbor index format in {directory}: {meta.get('format')!r}")
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in cls._ARRAYS
+        }
+        return cls(
+            np.asarray(arrays["centroids"]), np.asarray(arrays["offsets"]), arrays["vectors"], arrays["delays"],
+            airline_stats=meta["airline_stats"], airport_busyness=meta["airport_busyness"],
+            scales=meta["scales"], features=meta["features"],
+        )
+
+    def search_exact(self, queries, k):
+        """Row indices and squared distances of the k nearest rows, by brute force."""
+        queries = np.asarray(queries, dtype=np.float32)
+        k = min(k, len(self.vectors))
+        best_d = np.full((len(queries), 0), np.inf, dtype=np.float32)
+        best_i = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(self.vectors), CHUNK_ROWS):
+            d = _squared_distances(queries, np.asarray(self.vectors[start:start + CHUNK_ROWS]))
+            best_d = np.concatenate([best_d, d], axis=1)
+            best_i = np.concatenate([best_i, np.broadcast_to(np.arange(start, start + d.shape[1]), d.shape)], axis=1)
+            if best_d.shape[1] > k:
+                keep = np.argpartition(best_d, k - 1, axis=1)[:, :k]
+                best_d = np.take_along_axis(best_d, keep, axis=1)
+                best_i = np.take_along_axis(best_i, keep, axis=1)
+        order = np.argsort(best_d, axis=1, kind="stable")
+        return np.take_along_axis(best_i, order, axis=1), np.take_along_axis(best_d, order, axis=1)
+
+    def search(self, queries, k, nprobe=None):
+        """Approximate k nearest rows: exact distances within the nprobe nearest lists."""
+        nprobe = nprobe or settings.NEIGHBOR_NPROBE
+        if nprobe >= self.nlist:
+            return self.search_exact(queries, k)
+        queries = np.asarray(queries, dtype=np.float32)
+        probes = np.argsort(_squared_distances(queries, self.centroids), axis=1)[:, :nprobe]
+        out_i = np.full((len(queries), k), -1, dtype=np.int64)
+        out_d = np.full((len(queries), k), np.inf, dtype=np.float32)
+        for q, lists in enumerate(probes):
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in lists])
+            if not len(rows):
+                continue
+            d = _squared_distances(queries[q:q + 1], np.asarray(self.vectors[rows]))[0]
+            top = np.argpartition(d, k - 1)[:k] if len(d) > k else np.arange(len(d))
+            top = top[np.argsort(d[top], kind="stable")]
+            out_i[q, :len(top)], out_d[q, :len(top)] = rows[top], d[top]
+        return out_i, out_d
+
+    def embed(self, flights):
+        """Query vectors for FLIGHT_FIELDS legs, built as model/gen_embeddings.py
+        builds a historical row (without the delays)."""
+        airports = registry.get("airport_index")
+        legs = flights_frame(flights)
+        seg = segments_from_flights(legs)
+        date = pd.to_datetime(seg["date"])
+        month, dom, dow = date.dt.month.to_numpy(), date.dt.day.to_numpy(), date.dt.dayofweek.to_numpy() + 1
+        s = self.scales
+
+        def sin_cos(fraction):
+            angle = 2.0 * np.pi * np.asarray(fraction, dtype=np.float64)
+            return np.sin(angle), np.cos(angle)
+
+        o, d = airports.ids(seg["origin"]), airports.ids(seg["dest"])
+        lat1, lon1 = np.radians(airports.lat[o]), np.radians(airports.lon[o])
+        lat2, lon2 = np.radians(airports.lat[d]), np.radians(airports.lon[d])
+        o_xyz = np.column_stack([np.cos(lat1) * np.cos(lon1), np.cos(lat1) * np.sin(lon1), np.sin(lat1)])
+        d_xyz = np.column_stack([np.cos(lat2) * np.cos(lon2), np.cos(lat2) * np.sin(lon2), np.sin(lat2)])
+        route = (d_xyz - o_xyz) / s["route_vec_div"]
+        dlon = lon2 - lon1
+        bearing = np.arctan2(np.sin(dlon) * np.cos(lat2),
+                             np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon))
+
+        # Thanksgiving is the fourth Thursday of November.
+        nov1_weekday = pd.to_datetime(pd.DataFrame({"year": date.dt.year, "month": 11, "day": 1})).dt.dayofweek
+        thanksgiving = (month == 11) & (dom == (22 + (3 - nov1_weekday) % 7).to_numpy())
+        christmas_eve = (month == 12) & (dom == 24)
+
+        def airline_row(al):
+            info = self.airline_stats.get(al)
+            if info is None:
+                return [0.0] * 6
+            return [*(s["coord_scale"] * float(v) for v in info["centroid_xyz"]),
+                    float(info["typical_dep_sin"]), float(info["typical_dep_cos"]),
+                    float(info["mean_distance_miles"]) / s["distance_scale"]]
+
+        return np.column_stack([
+            *sin_cos((month - 1) / 12.0), *sin_cos((dom - 1) / date.dt.days_in_month.to_numpy()),
+            *sin_cos((dow - 1) / 7.0),
+            *sin_cos(seg["dep_time"].to_numpy() / 1440.0), *sin_cos(seg["arr_time"].to_numpy() / 1440.0),
+            o_xyz * s["coord_scale"], d_xyz * s["coord_scale"], route * s["coord_scale"],
+            np.sin(bearing), np.cos(bearing),
+            seg["elapsed_time"].to_numpy() / s["elapsed_scale"], seg["distance"].to_numpy() / s["distance_scale"],
+            christmas_eve.astype(np.float64), thanksgiving.astype(np.float64),
+            np.array([airline_row(al.strip()) for al in legs["airline"]], dtype=np.float64).reshape(-1, 6),
+            [self.airport_busyness.get(c, 0.0) for c in seg["origin"]],
+            [self.airport_busyness.get(c, 0.0) for c in seg["dest"]],
+        ]).astype(np.float32)
+
+
+def delay_distribution(delays):
+    """Summary of the (n, 2) departure/arrival delays of one leg's neighbors."""
+    out = {"neighbors": int(len(delays))}
+    for j, name in enumerate(("departure_delay", "arrival_delay")):
+        values = delays[:, j].astype(np.float64)
+        if not len(values):
+            out[name] = None
+            continue
+        quantiles = np.quantile(values, DELAY_QUANTILES)
+        out[name] = {
+            "mean": float(values.mean()),
+            **{f"p{round(q * 100)}": float(v) for q, v in zip(DELAY_QUANTILES, quantiles)},
+            **{f"share_over_{t}": float((values > t).mean()) for t in DELAY_THRESHOLDS},
+        }
+    return out
+
+
+def similar_flights(flights, k):
+    """Delay distribution of the k most similar historical flights, per leg."""
+    index = get_neighbor_index()
+    rows, _ = index.search(index.embed(flights), k)
+    return [delay_distribution(np.asarray(index.delays[r[r >= 0]])) for r in rows]
+
+
+# Whether the missing index has been logged. The registry retries the loader
+# on every request so a freshly built index is picked up without a restart;
+# the warning is logged once until the index shows up.
+_missing_logged = False
+
+
+def load_neighbor_index():
+    global _missing_logged
+    try:
+        index = NeighborIndex.load(settings.NEIGHBOR_INDEX_DIR)
+    except FileNotFoundError:
+        if not _missing_logged:
+            _missing_logged = True
+            logger.warning("No neighbor index at %s; build one with manage.py build_neighbor_index.",
+                           settings.NEIGHBOR_INDEX_DIR)
+        return None
+    _missing_logged = False
+    return index
+
+
+def get_neighbor_index():
+    return registry.get("neighbor_index")
+
+
+registry.register("neighbor_index", load_neighbor_index)
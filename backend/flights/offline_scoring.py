@@ -0,0 +1,150 @@
+"""Offline scoring of BTS-style schedules (manage.py score_flights).
+
+The schedule is cut into shards of consecutive rows. Shards are scored on a
+process pool, and each finished shard is written to its own Parquet part.
+That file is the shard's checkpoint: a rerun skips every shard whose part
+already exists.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .features import build_features
+from .registry import registry
+from .utils import predict
+
+# Columns of a BTS on-time performance schedule, as the forest was trained on.
+SCHEDULE_COLUMNS = [
+    "FlightDate", "Reporting_Airline", "Flight_Number_Reporting_Airline", "Origin", "Dest",
+    "CRSDepTime", "CRSArrTime", "CRSElapsedTime",
+]
+DISTANCE_COLUMN = "Distance"
+# Coerced to numbers; a row with a value that is not one cannot be scored.
+NUMERIC_COLUMNS = [
+    "Flight_Number_Reporting_Airline", "CRSDepTime", "CRSArrTime", "CRSElapsedTime", DISTANCE_COLUMN,
+]
+
+SHARD_ROWS = 250_000
+CHUNK_ROWS = 20_000
+STATE_FILENAME = "_score_flights.json"
+
+_model = None
+
+
+def init_worker():
+    """Pool initializer: load the serving model once per worker process."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    from .model_registry import model_registry
+
+    global _model
+    _model = model_registry.current()
+
+
+def iter_shards(path, shard_rows=SHARD_ROWS):
+    """(shard number, DataFrame) for consecutive row ranges of a CSV or Parquet schedule."""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        batches = pq.ParquetFile(path).iter_batches(batch_size=shard_rows)
+        frames = (batch.to_pandas() for batch in batches)
+    else:
+        frames = pd.read_csv(path, chunksize=shard_rows, dtype={"Reporting_Airline": str, "Origin": str, "Dest": str})
+    for number, frame in enumerate(frames):
+        yield number, frame
+
+
+def segments_from_schedule(schedule):
+    """build_features() input for BTS rows, plus the mask of rows that can be scored.
+
+    Times stay HHMM, as in the training data; a missing Distance column is
+    filled with great-circle miles from the airport index. Rows with a blank
+    or non-numeric value in a numeric column are left unscored.
+    """
+    missing = [c for c in SCHEDULE_COLUMNS if c not in schedule.columns]
+    if missing:
+        raise ValueError(f"Schedule is missing columns: {', '.join(missing)}")
+    columns = SCHEDULE_COLUMNS + ([DISTANCE_COLUMN] if DISTANCE_COLUMN in schedule.columns else [])
+    rows = schedule[columns].reset_index(drop=True)
+    for column in NUMERIC_COLUMNS:
+        if column in rows.columns:
+            rows[column] = pd.to_numeric(rows[column], errors="coerce")
+    # A copy: pandas may hand back a read-only view, and valid is updated below.
+    valid = rows.notna().all(axis=1).to_numpy(copy=True)
+    rows = rows[valid].reset_index(drop=True)
+
+    if DISTANCE_COLUMN in rows.columns:
+        distance = rows[DISTANCE_COLUMN].astype(np.float64)
+    else:
+        index = registry.get("airport_index")
+        origin_ids, dest_ids = index.ids(rows["Origin"]), index.ids(rows["Dest"])
+        served = (origin_ids >= 0) & (origin_ids < index.n_served) & (dest_ids >= 0) & (dest_ids < index.n_served)
+        distance = np.full(len(rows), np.nan)
+        distance[served] = index.route_miles(origin_ids[served], dest_ids[served])
+        keep = ~np.isnan(distance)
+        valid[np.flatnonzero(valid)[~keep]] = False
+        rows, distance = rows[keep].reset_index(drop=True), distance[keep]
+
+    segments = pd.DataFrame({
+        "date": rows["FlightDate"].astype(str),
+        "airline": rows["Reporting_Airline"].astype(str),
+        "flight_number": rows["Flight_Number_Reporting_Airline"].astype(np.int64),
+        "origin": rows["Origin"].astype(str),
+        "dest": rows["Dest"].astype(str),
+        "dep_time": rows["CRSDepTime"].astype(np.int64),
+        "arr_time": rows["CRSArrTime"].astype(np.int64),
+        "elapsed_time": rows["CRSElapsedTime"].astype(np.float64),
+        "distance": np.asarray(distance, dtype=np.float64),
+    })
+    return segments, valid
+
+
+def score_shard(number, schedule, out_dir, chunk_rows=CHUNK_ROWS, model_digest=None):
+    """Score one shard and write part-<number>.parquet; returns (number, rows).
+
+    With `model_digest`, refuse to score with any other model (one published
+    while the run was going).
+    """
+    model = _model
+    if model_digest is not None and model.digest != model_digest:
+        raise ValueError(f"The serving model changed during the run (now version {model.version})")
+    segments, valid = segments_from_schedule(schedule)
+    probabilities = np.full((len(schedule), len(model.classes_)), np.nan)
+    scored = np.empty((len(segments), len(model.classes_)))
+    for start in range(0, len(segments), chunk_rows):
+        chunk = segments.iloc[start:start + chunk_rows].reset_index(drop=True)
+        scored[start:start + len(chunk)] = predict(build_features(chunk), model)
+    probabilities[valid] = scored
+
+    out = schedule[[c for c in SCHEDULE_COLUMNS if c in schedule.columns]].reset_index(drop=True)
+    for i, label in enumerate(model.classes_):
+        out[f"p_{label}"] = probabilities[:, i]
+    path = part_path(out_dir, number)
+    tmp = f"{path}.tmp"
+    out.to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return number, len(schedule)
+
+
+def part_path(out_dir, number):
+    return os.path.join(out_dir, f"part-{number:05d}.parquet")
+
+
+def check_state(out_dir, state):
+    """Record what is being scored; a rerun may only resume the same input,
+    sharding and model."""
+    path = os.path.join(out_dir, STATE_FILENAME)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+    except FileNotFoundError:
+        previous = None
+    if previous is not None and previous != state:
+        raise ValueError(f"{out_dir} holds shards of a different run: {previous}")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
@@ -0,0 +1,200 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import weakref
+
+from django.conf import settings
+from openai import AsyncOpenAI, OpenAI, Timeout
+
+from .caching import make_cache
+from .local_parser import parse_locally
+from .metrics import PARSE_FAILURES, PARSES, span
+from .uploads import content_digest
+from .utils import PARSER_PROMPT
+
+logger = logging.getLogger(__name__)
+
+PROMPT_DIGEST = hashlib.sha256(PARSER_PROMPT.encode("utf-8")).hexdigest()
+
+_client = None
+_parse_cache = None
+_lock = threading.Lock()
+
+# One async client (and its connection pool) plus one concurrency semaphore per
+# event loop; both are bound to the loop that first uses them.
+_async_resources = weakref.WeakKeyDictionary()
+
+
+class ParserBusy(Exception):
+    """Every parser slot stayed taken for PARSER_QUEUE_TIMEOUT seconds."""
+
+
+def client_options():
+    # base_url falls back to OPENAI_BASE_URL, which is how a local fake parser
+    # server is swapped in for tests and benchmarks.
+    return {
+        "api_key": os.environ.get("OPENAI_API_KEY"),
+        "timeout": Timeout(settings.PARSER_TIMEOUT, connect=settings.PARSER_CONNECT_TIMEOUT),
+        "max_retries": settings.PARSER_MAX_RETRIES,
+    }
+
+
+def get_client():
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = OpenAI(**client_options())
+    return _client
+
+
+def get_async_resources():
+    loop = asyncio.get_running_loop()
+    resources = _async_resources.get(loop)
+    if resources is None:
+        resources = (AsyncOpenAI(**client_options()), asyncio.Semaphore(settings.PARSER_MAX_CONCURRENCY))
+        _async_resources[loop] = resources
+    return resources
+
+
+def get_parse_cache():
+    """The shared parse-result cache, or None when PARSE_CACHE_BACKEND is "none"."""
+    global _parse_cache
+    if _parse_cache is None and settings.PARSE_CACHE_BACKEND != "none":
+        with _lock:
+            if _parse_cache is None:
+                _parse_cache = make_cache(
+                    settings.PARSE_CACHE_BACKEND,
+                    ttl=settings.PARSE_CACHE_TTL,
+                    max_entries=settings.PARSE_CACHE_MAX_ENTRIES,
+                    path=settings.PARSE_CACHE_PATH,
+                    alias=settings.PARSE_CACHE_ALIAS,
+                )
+    return _parse_cache
+
+
+def parse_cache_key(data_digest, model=None):
+    # A new prompt or parser model must not serve answers produced by the old one.
+    return f"parse:{data_digest}:{PROMPT_DIGEST[:16]}:{model or settings.PARSER_MODEL}"
+
+
+def build_input(content_type, file_id):
+    parts = [{"type": "input_text", "text": PARSER_PROMPT}]
+    if content_type == "application/pdf":
+        parts.append({"type": "input_file", "file_id": file_id})
+    elif content_type.startswith("image/"):
+        parts.append({"type": "input_image", "file_id": file_id})
+    return [{"role": "user", "content": parts}]
+
+
+def load_output(output_text):
+    return json.loads(output_text.strip().replace("\n", ""))
+
+
+def parse_with_llm(filename, data, content_type):
+    client = get_client()
+    with span("upload.llm_file"):
+        result = client.files.create(
+            file=(filename, data, content_type),
+            purpose="user_data",
+        )
+    with span("upload.llm_response"):
+        response = client.responses.create(
+            model=settings.PARSER_MODEL,
+            input=build_input(content_type, result.id),
+        )
+    return load_output(response.output_text)
+
+
+def parse_itinerary(filename, data, content_type, digest=None):
+    """Parse an uploaded document into the PARSER_PROMPT JSON array.
+
+    `data` is the document's bytes or a binary file object, which is streamed
+    to the parser; pass `digest` (its SHA-256) when it is already known.
+    Returns (items, tier): "cache", the local tier that answered ("bcbp" or
+    "text") or "llm". Only LLM answers are cached.
+    """
+    cache = get_parse_cache()
+    key = parse_cache_key(digest or content_digest(data))
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            PARSES.labels("cache").inc()
+            return cached, "cache"
+
+    with span("upload.local"):
+        local = parse_locally(data, content_type)
+    if local is not None:
+        PARSES.labels(local[1]).inc()
+        return local
+
+    try:
+        items = parse_with_llm(filename, data, content_type)
+    except Exception as exc:
+        PARSE_FAILURES.labels(type(exc).__name__).inc()
+        raise
+    if cache is not None:
+        cache.set(key, items)
+    PARSES.labels("llm").inc()
+    return items, "llm"
+
+
+async def parse_with_llm_async(filename, data, content_type):
+    client, slots = get_async_resources()
+    try:
+        await asyncio.wait_for(slots.acquire(), settings.PARSER_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ParserBusy() from None
+    try:
+        with span("upload.llm_file"):
+            result = await client.files.create(
+                file=(filename, data, content_type),
+                purpose="user_data",
+            )
+        with span("upload.llm_response"):
+            response = await client.responses.create(
+                model=settings.PARSER_MODEL,
+                input=build_input(content_type, result.id),
+            )
+    except asyncio.CancelledError:
+        # The ASGI handler cancels the view when the client disconnects; the
+        # in-flight HTTP request is dropped and the slot is freed below.
+        logger.info("Parse of %s cancelled by client disconnect", filename)
+        raise
+    finally:
+        slots.release()
+    return load_output(response.output_text)
+
+
+async def parse_itinerary_async(filename, data, content_type, digest):
+    """Non-blocking parse_itinerary() for the ASGI upload view.
+
+    The parse cache (SQLite or a Django cache) does blocking I/O, so its reads
+    and writes run in a thread like the local parse does.
+    """
+    cache = get_parse_cache()
+    key = parse_cache_key(digest)
+    if cache is not None:
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            PARSES.labels("cache").inc()
+            return cached, "cache"
+
+    with span("upload.local"):
+        local = await asyncio.to_thread(parse_locally, data, content_type)
+    if local is not None:
+        PARSES.labels(local[1]).inc()
+        return local
+
+    try:
+        items = await parse_with_llm_async(filename, data, content_type)
+    except Exception as exc:
+        PARSE_FAILURES.labels(type(exc).__name__).inc()
+        raise
+    if cache is not None:
+        await asyncio.to_thread(cache.set, key, items)
+    PARSES.labels("llm").inc()
+    return items, "llm"
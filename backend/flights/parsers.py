@@ -0,0 +1,35 @@
+import json
+
+import pandas as pd
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class CSVParser(BaseParser):
+    """text/csv with a header row, parsed into a DataFrame of strings."""
+
+    media_type = "text/csv"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return pd.DataFrame()
+        try:
+            return pd.read_csv(stream, dtype=str, keep_default_na=False, skipinitialspace=True)
+        except (ValueError, pd.errors.ParserError) as exc:
+            raise ParseError(f"CSV parse error - {exc}")
+
+
+class NDJSONParser(BaseParser):
+    """One JSON object per line, parsed into a DataFrame."""
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return pd.DataFrame()
+        encoding = (parser_context or {}).get("encoding", "utf-8")
+        try:
+            rows = [json.loads(line) for line in stream.read().decode(encoding).splitlines() if line.strip()]
+        except ValueError as exc:
+            raise ParseError(f"NDJSON parse error - {exc}")
+        return pd.DataFrame(rows)
@@ -0,0 +1,255 @@
+"""Opt-in request profiling (ProfilingMiddleware).
+
+With PROFILE_ENABLED set, requests to the PROFILE_VIEWS URL names are
+profiled when they carry a valid signed X-Profile header (`manage.py
+profile_token` prints one; signed with PROFILE_SIGNING_KEY, and ignored while
+that is unset) or win a PROFILE_SAMPLE_RATE coin toss. Each
+profile is written to PROFILE_DIR as collapsed stacks (flamegraph.pl,
+inferno, speedscope) or a speedscope JSON file, and named in the response's
+X-Profile-File header.
+
+Two profilers, both stdlib only:
+
+- "sampling" (default) reads the request thread's stack from a side thread
+  every PROFILE_INTERVAL seconds; its overhead is low enough for production.
+- "deterministic" hooks sys.setprofile and attributes exact self-time,
+  C calls (numpy, pandas internals) included, to every stack; it slows the
+  request several-fold.
+
+Both follow the thread a request runs on. Under ASGI that is the event loop
+thread: the profile of an async view also holds whatever other requests ran
+on the loop meanwhile, and misses sync views, which Django runs in a thread
+of their own.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_TOKEN_SALT = "flights.profiling"
+
+
+def _signer():
+    # A key of its own: SECRET_KEY is committed with the settings.
+    if not settings.PROFILE_SIGNING_KEY:
+        return None
+    return signing.TimestampSigner(key=settings.PROFILE_SIGNING_KEY, salt=PROFILE_TOKEN_SALT)
+
+
+def make_profile_token():
+    """A value for the X-Profile header, valid for PROFILE_TOKEN_MAX_AGE seconds."""
+    signer = _signer()
+    if signer is None:
+        raise ValueError("PROFILE_SIGNING_KEY is not set.")
+    return signer.sign("profile")
+
+
+def valid_profile_token(token):
+    signer = _signer()
+    if signer is None:
+        return False
+    try:
+        signer.unsign(token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def _frame_name(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Counts the stacks of one thread, sampled every `interval` seconds."""
+
+    unit = "samples"
+
+    def __init__(self, interval=0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, args=(target,), name="request-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self, target):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+
+
+class DeterministicProfiler:
+    """Exact self-time, in microseconds, of every call stack on this thread."""
+
+    unit = "microseconds"
+
+    def __init__(self, interval=None):
+        self.stacks = Counter()
+        self._names = []
+        self._entries = []  # (start, time spent in children)
+
+    def start(self):
+        sys.setprofile(self._event)
+        return self
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def _event(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == "call" or event == "c_call":
+            self._names.append(_frame_name(frame.f_code) if event == "call" else
+                               f"{getattr(arg, '__qualname__', repr(arg))} (builtin)")
+            self._entries.append([now, 0.0])
+        elif self._entries:
+            # return / c_return / c_exception of a call made after start().
+            start, children = self._entries.pop()
+            elapsed = now - start
+            self.stacks[tuple(self._names)] += int((elapsed - children) * 1e6)
+            self._names.pop()
+            if self._entries:
+                self._entries[-1][1] += elapsed
+
+
+PROFILERS = {"sampling": SamplingProfiler, "deterministic": DeterministicProfiler}
+
+
+def write_collapsed(stacks, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, weight in stacks.most_common():
+            if weight > 0:
+                f.write(f"{';'.join(name.replace(';', ':') for name in stack)} {weight}\n")
+
+
+def write_speedscope(stacks, path, name, unit):
+    frames, frame_ids, samples, weights = [], {}, [], []
+    for stack, weight in stacks.most_common():
+        if weight <= 0:
+            continue
+        ids = []
+        for frame in stack:
+            if frame not in frame_ids:
+                frame_ids[frame] = len(frames)
+                frames.append({"name": frame})
+            ids.append(frame_ids[frame])
+        samples.append(ids)
+        weights.append(weight)
+    document = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "microseconds" if unit == "microseconds" else "none",
+            "startValue": 0, "endValue": sum(weights), "samples": samples, "weights": weights,
+        }],
+        "name": name,
+        "exporter": "flights.profiling",
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f)
+
+
+def write_profile(profiler, directory, name, fmt):
+    """Write `profiler`'s stacks to a new file in `directory`; returns its name."""
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S")
+    suffix = ".speedscope.json" if fmt == "speedscope" else ".collapsed"
+    filename = f"{name}-{stamp}-{uuid.uuid4().hex[:8]}{suffix}"
+    tmp = os.path.join(directory, f".{filename}.tmp")
+    if fmt == "speedscope":
+        write_speedscope(profiler.stacks, tmp, name, profiler.unit)
+    else:
+        write_collapsed(profiler.stacks, tmp)
+    os.replace(tmp, os.path.join(directory, filename))
+    return filename
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILE_ENABLED:
+            raise MiddlewareNotUsed()
+        if settings.PROFILE_MODE not in PROFILERS:
+            raise ValueError(f"PROFILE_MODE must be one of {', '.join(PROFILERS)}, not {settings.PROFILE_MODE!r}")
+        self.get_response = get_response
+        self.views = set(settings.PROFILE_VIEWS)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        name = self._profiled_view(request)
+        if name is None:
+            return self.get_response(request)
+
+        profiler = PROFILERS[settings.PROFILE_MODE](settings.PROFILE_INTERVAL).start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        try:
+            response["X-Profile-File"] = write_profile(profiler, settings.PROFILE_DIR, name, settings.PROFILE_FORMAT)
+        except Exception:
+            logger.exception("Could not write the profile of %s", request.path)
+        return response
+
+    async def __acall__(self, request):
+        name = self._profiled_view(request)
+        if name is None:
+            return await self.get_response(request)
+
+        profiler = PROFILERS[settings.PROFILE_MODE](settings.PROFILE_INTERVAL).start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.stop()
+        try:
+            # Off the event loop: a deterministic profile can run to megabytes.
+            response["X-Profile-File"] = await sync_to_async(write_profile, thread_sensitive=False)(
+                profiler, settings.PROFILE_DIR, name, settings.PROFILE_FORMAT,
+            )
+        except Exception:
+            logger.exception("Could not write the profile of %s", request.path)
+        return response
+
+    def _profiled_view(self, request):
+        # The header or the coin toss first: resolving the URL is the costly part.
+        token = request.META.get(PROFILE_HEADER)
+        if not (token and valid_profile_token(token)) and random.random() >= settings.PROFILE_SAMPLE_RATE:
+            return None
+        try:
+            name = resolve(request.path_info).url_name
+        except Resolver404:
+            return None
+        return name if name in self.views else None
@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak, in KiB on Linux; the best we can do elsewhere.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Artifact:
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.value = None
+        self.loaded = False
+        self.load_seconds = None
+        self.rss_delta_bytes = None
+        self.nbytes = None
+        self.mapped = False
+
+
+class ArtifactRegistry:
+    """Read-only serving artifacts, loaded on first use.
+
+    Call preload() in the parent process (e.g. gunicorn --preload) to load
+    everything before workers fork; large arrays are memory-mapped so the page
+    cache holds one copy for all workers. A loader that returns None (the
+    artifact has not been built yet) is not cached: get() calls it again
+    until it returns something.
+    """
+
+    def __init__(self):
+        self._artifacts = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        self._artifacts[name] = Artifact(name, loader)
+
+    def get(self, name):
+        artifact = self._artifacts[name]
+        if not artifact.loaded:
+            with self._lock:
+                if not artifact.loaded:
+                    self._load(artifact)
+        return artifact.value
+
+    def _load(self, artifact):
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+        value = artifact.loader()
+        if value is None:
+            return
+        artifact.load_seconds = time.perf_counter() - started
+        artifact.rss_delta_bytes = current_rss_bytes() - rss_before
+        arrays = [a for a in getattr(value, "__dict__", {}).values() if isinstance(a, np.ndarray)]
+        artifact.nbytes = sum(a.nbytes for a in arrays) or None
+        artifact.mapped = any(isinstance(a, np.memmap) for a in arrays)
+        artifact.value = value
+        artifact.loaded = True
+        logger.info(
+            "Loaded %s in %.1f ms (RSS %+.1f MB%s)", artifact.name, artifact.load_seconds * 1e3,
+            artifact.rss_delta_bytes / 2**20, ", memory-mapped" if artifact.mapped else "",
+        )
+
+    def preload(self, names=None):
+        for name in names or list(self._artifacts):
+            self.get(name)
+
+    def stats(self):
+        return {
+            name: {
+                "loaded": a.loaded,
+                "load_seconds": a.load_seconds,
+                "rss_delta_bytes": a.rss_delta_bytes,
+                "nbytes": a.nbytes,
+                "memory_mapped": a.mapped,
+            }
+            for name, a in self._artifacts.items()
+        }
+
+
+registry = ArtifactRegistry()
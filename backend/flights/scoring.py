@@ -0,0 +1,144 @@
+import threading
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+
+from .caching import make_cache
+from .features import build_features
+from .metrics import PREDICTION_LEGS, span
+from .registry import registry
+from .utils import calculate_flight_duration, predict, require_served
+
+# One leg as the frontend and the bulk endpoint send it.
+FLIGHT_FIELDS = [
+    "airline", "flightNumber", "departureAirport", "arrivalAirport",
+    "departureDateTime", "arrivalDateTime",
+]
+
+_prediction_cache = None
+_lock = threading.Lock()
+
+
+def get_prediction_cache():
+    """The shared prediction cache, or None when PREDICTION_CACHE_BACKEND is "none"."""
+    global _prediction_cache
+    if _prediction_cache is None and settings.PREDICTION_CACHE_BACKEND != "none":
+        with _lock:
+            if _prediction_cache is None:
+                _prediction_cache = make_cache(
+                    settings.PREDICTION_CACHE_BACKEND,
+                    ttl=settings.PREDICTION_CACHE_TTL,
+                    max_entries=settings.PREDICTION_CACHE_MAX_ENTRIES,
+                    path=settings.PREDICTION_CACHE_PATH,
+                    alias=settings.PREDICTION_CACHE_ALIAS,
+                )
+    return _prediction_cache
+
+
+def flights_frame(flights):
+    """Validate legs (a DataFrame or a list of dicts) into a frame of FLIGHT_FIELDS strings."""
+    frame = flights if isinstance(flights, pd.DataFrame) else pd.DataFrame(list(flights))
+    missing = [f for f in FLIGHT_FIELDS if f not in frame.columns]
+    if missing:
+        raise ValidationError({"error": f"Missing fields: {', '.join(missing)}."})
+    frame = frame[FLIGHT_FIELDS].reset_index(drop=True)
+    blank = frame.isna() | (frame.astype(str).apply(lambda c: c.str.strip()) == "")
+    if blank.any(axis=None):
+        rows = blank.any(axis=1).to_numpy().nonzero()[0][:10].tolist()
+        raise ValidationError({"error": "Missing values.", "rows": rows})
+    return frame.astype(str)
+
+
+def _leg_times(legs):
+    dep_str = legs["departureDateTime"].str.removesuffix("Z")
+    arr_str = legs["arrivalDateTime"].str.removesuffix("Z")
+    try:
+        dep = pd.to_datetime(dep_str, format="ISO8601")
+        arr = pd.to_datetime(arr_str, format="ISO8601")
+    except (ValueError, TypeError) as exc:
+        raise ValidationError({"error": f"Invalid datetime: {exc}"}) from None
+    return dep_str, arr_str, dep, arr
+
+
+def prediction_cache_keys(legs, model_version):
+    """One key per leg: the fields every feature is derived from, with times
+    normalized, tagged with the model version."""
+    _, _, dep, arr = _leg_times(legs)
+    dep = dep.dt.strftime("%Y-%m-%dT%H:%M:%S")
+    arr = arr.dt.strftime("%Y-%m-%dT%H:%M:%S")
+    return [
+        f"pred:{model_version}:{d}|{a}|{airline}|{number}|{origin}|{dest}"
+        for d, a, airline, number, origin, dest in zip(
+            dep, arr, legs["airline"], legs["flightNumber"], legs["departureAirport"], legs["arrivalAirport"],
+        )
+    ]
+
+
+def segments_from_flights(legs):
+    """build_features() input for a frame of FLIGHT_FIELDS, computed per column."""
+    index = registry.get("airport_index")
+    origin, dest = legs["departureAirport"], legs["arrivalAirport"]
+    with span("predict.airports"):
+        require_served(index, pd.unique(np.concatenate([origin.to_numpy(object), dest.to_numpy(object)])))
+        origin_ids, dest_ids = index.ids(origin), index.ids(dest)
+        distance = index.route_miles(origin_ids, dest_ids)
+
+    with span("predict.timezones"):
+        dep_str, arr_str, dep, arr = _leg_times(legs)
+        elapsed = (index.to_utc(arr, dest_ids) - index.to_utc(dep, origin_ids)).dt.total_seconds() / 60
+        for i in np.flatnonzero(elapsed.isna().to_numpy()):
+            elapsed.iloc[i] = calculate_flight_duration(dep_str.iloc[i], arr_str.iloc[i], origin.iloc[i], dest.iloc[i])
+
+    return pd.DataFrame({
+        "date": dep,
+        "airline": legs["airline"],
+        "flight_number": legs["flightNumber"],
+        "origin": origin,
+        "dest": dest,
+        # Minutes after midnight, as utils.minutes_after_midnight() gives them.
+        "dep_time": (dep.dt.hour * 60 + dep.dt.minute).astype(np.int64),
+        "arr_time": (arr.dt.hour * 60 + arr.dt.minute).astype(np.int64),
+        "elapsed_time": elapsed.astype(np.float64),
+        "distance": distance,
+    })
+
+
+def score_flights(flights, model):
+    """Class probabilities for every leg, in order, with one model call.
+
+    Identical legs (group bookings, repeated schedules) are scored once and
+    fanned back out, and legs in the prediction cache skip feature building
+    and inference. Returns (probabilities, unique_leg_count).
+    """
+    with span("predict.validate"):
+        frame = flights_frame(flights)
+        codes, unique = pd.factorize(pd.MultiIndex.from_frame(frame))
+        legs = unique.to_frame(index=False, name=FLIGHT_FIELDS)
+
+    cache = get_prediction_cache()
+    if cache is None:
+        PREDICTION_LEGS.labels("model").inc(len(legs))
+        return _predict_legs(legs, model)[codes], len(legs)
+
+    with span("predict.cache"):
+        keys = prediction_cache_keys(legs, model.version)
+        cached = cache.get_many(keys)
+    rows = [cached.get(key) for key in keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    PREDICTION_LEGS.labels("cache").inc(len(rows) - len(missing))
+    PREDICTION_LEGS.labels("model").inc(len(missing))
+    if missing:
+        fresh = _predict_legs(legs.iloc[missing].reset_index(drop=True), model).tolist()
+        for i, row in zip(missing, fresh):
+            rows[i] = row
+        cache.set_many({keys[i]: row for i, row in zip(missing, fresh)})
+    return np.asarray(rows, dtype=np.float64)[codes], len(legs)
+
+
+def _predict_legs(legs, model):
+    segments = segments_from_flights(legs)
+    with span("predict.features"):
+        features = build_features(segments)
+    return np.asarray(predict(features, model))
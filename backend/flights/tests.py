@@ -1,3 +1,1218 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import zlib
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import addModuleCleanup, mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+from pandas.tseries.holiday import USFederalHolidayCalendar
+
+from .airports import AirportIndex
+from .caching import CountingCache, LRUBackend, SQLiteBackend
+from .calendar_index import CALENDAR_FIELDS, CalendarIndex
+from .encoding import CategoricalEncoder
+from .fake_openai import FakeOpenAIServer
+from .features import FEATURE_COLUMNS, build_features
+from .forest import LEAF_SCALE, CompiledForest, floor_float32, quantize_leaves
+from .jobs import claim_next_job, job_events, run_pending_jobs
+from .local_parser import find_flights, parse_bcbp, parse_locally
+from .metrics import Counter, Histogram, span
+from .model_registry import (
+    ENCODER_FILENAME, FOREST_FILENAME, MODEL_FILENAME, ModelRegistry, file_digest, load_encoder, model_registry,
+)
+from .models import ParseJob
+from .neighbors import N_DELAYS, NeighborIndex
+from .offline_scoring import check_state, segments_from_schedule
+from .profiling import DeterministicProfiler, make_profile_token, write_speedscope
+from .registry import ArtifactRegistry, registry
+from . import model_registry as model_registry_module, neighbors, parser, scoring
+from .scoring import flights_frame, prediction_cache_keys, score_flights, segments_from_flights
+from .utils import (
+    calculate_flight_duration, get_coordinates, haversine, load_airport_index, load_sklearn_forest, map,
+    minutes_after_midnight, model_file_path, predict,
+)
+
+
+# categorical_encoder.json comes from the training data (model/build_encoder.py),
+# which is not in the tree. Tests that need a serving model get this vocabulary
+# whenever a model directory has no encoder of its own.
+TEST_ENCODER = CategoricalEncoder({
+    "Reporting_Airline": ["AA", "DL", "NK", "UA", "WN"],
+    "Origin": ["ATL", "DAL", "DCA", "FLL", "JFK", "LAX", "MIA", "SFO"],
+    "Dest": ["EWR", "HOU", "JFK", "LAX", "LGA", "ORD"],
+    "season": ["DJF", "JJA", "MAM", "SON"],
+})
+
+
+def setUpModule():
+    def encoder_or_test_vocabulary(directory):
+        try:
+            return load_encoder(directory)
+        except FileNotFoundError:
+            return TEST_ENCODER
+
+    patcher = mock.patch.object(model_registry_module, "load_encoder", encoder_or_test_vocabulary)
+    patcher.start()
+    addModuleCleanup(patcher.stop)
+
+
+SEGMENTS = [
+    # plain weekday, minutes-after-midnight style times as sent by the predict view
+    dict(date="2025-09-26T14:35:00.000", airline="DL", flight_number="DL423", origin="JFK", dest="LAX",
+         dep_time=875, arr_time=1070, elapsed_time=375.0, distance=2475.3),
+    # Thanksgiving week, arrives next day
+    dict(date="2025-11-26T22:10:00.000", airline="UA", flight_number="UA15", origin="SFO", dest="EWR",
+         dep_time=1330, arr_time=650, elapsed_time=330.0, distance=2565.0),
+    # July 4th holiday, ULCC carrier, quarter-hour departure
+    dict(date="2024-07-04T06:45:00.000", airline="NK", flight_number="NK1200", origin="FLL", dest="LGA",
+         dep_time=405, arr_time=555, elapsed_time=165.0, distance=1076.0),
+    # Christmas/NYE window across the year boundary, unknown carrier, no digits
+    dict(date="2025-01-02T00:05:00.000", airline="ZZ", flight_number="ZZ", origin="DCA", dest="ORD",
+         dep_time=5, arr_time=125, elapsed_time=140.0, distance=612.0),
+    # zero elapsed time -> NaN speed, month end
+    dict(date="2025-03-31T12:00:00.000", airline="WN", flight_number="WN9", origin="DAL", dest="HOU",
+         dep_time=720, arr_time=720, elapsed_time=0.0, distance=239.0),
+    # BTS-style HHMM ints and a plain date string
+    dict(date="2023-12-24", airline="AA", flight_number=2387, origin="MIA", dest="JFK",
+         dep_time=1959, arr_time=2301, elapsed_time=182.0, distance=1089.0),
+]
+
+
+class BuildFeaturesTests(SimpleTestCase):
+    def test_matches_map_row_by_row(self):
+        for segment in SEGMENTS:
+            with self.subTest(segment=segment):
+                expected = map(**segment)
+                actual = build_features([segment])
+                pd.testing.assert_frame_equal(actual, expected)
+
+    def test_batch_matches_concatenated_map_rows(self):
+        segments = [s for s in SEGMENTS if isinstance(s["flight_number"], str)]
+        expected = pd.concat([map(**s) for s in segments], ignore_index=True)
+        actual = build_features(segments)
+        self.assertEqual(list(actual.columns), FEATURE_COLUMNS)
+        pd.testing.assert_frame_equal(actual, expected)
+
+    def test_batch_predict_matches_single_rows(self):
+        segments = SEGMENTS[:4]
+        batch = predict(build_features(segments))
+        single = np.vstack([predict(map(**s)) for s in segments])
+        np.testing.assert_array_equal(batch, single)
+
+
+class OfflineScoringTests(SimpleTestCase):
+    SCHEDULE = pd.DataFrame({
+        "FlightDate": ["2023-12-24", "2023-12-24", "2023-12-25"],
+        "Reporting_Airline": ["AA", "AA", "DL"],
+        "Flight_Number_Reporting_Airline": [2387, 2388, 423],
+        "Origin": ["MIA", "JFK", "JFK"],
+        "Dest": ["JFK", "MIA", "LAX"],
+        "CRSDepTime": [1959.0, np.nan, 1435.0],
+        "CRSArrTime": [2301.0, 900.0, 1750.0],
+        "CRSElapsedTime": [182.0, 180.0, 375.0],
+        "Distance": [1089.0, 1089.0, 2475.0],
+    })
+
+    def test_bts_rows_match_segment_features(self):
+        segments, valid = segments_from_schedule(self.SCHEDULE)
+        self.assertEqual(valid.tolist(), [True, False, True])
+        pd.testing.assert_frame_equal(build_features(segments.iloc[:1]), map(**SEGMENTS[5]))
+
+    def test_missing_distance_uses_airport_index(self):
+        segments, valid = segments_from_schedule(self.SCHEDULE.drop(columns="Distance"))
+        self.assertEqual(valid.tolist(), [True, False, True])
+        def miles(origin, dest):
+            a, b = get_coordinates(origin), get_coordinates(dest)
+            return haversine(a["lat"], a["lon"], b["lat"], b["lon"])
+
+        np.testing.assert_allclose(segments["distance"], [miles("MIA", "JFK"), miles("JFK", "LAX")], rtol=1e-12)
+
+    def test_missing_columns_are_rejected(self):
+        with self.assertRaises(ValueError):
+            segments_from_schedule(self.SCHEDULE.drop(columns="CRSDepTime"))
+
+    def test_non_numeric_values_leave_the_row_unscored(self):
+        schedule = self.SCHEDULE.astype({"Flight_Number_Reporting_Airline": object, "CRSArrTime": object})
+        schedule.loc[0, "Flight_Number_Reporting_Airline"] = "AA2387"
+        schedule.loc[2, "CRSArrTime"] = "17:50"
+        segments, valid = segments_from_schedule(pd.concat([schedule, self.SCHEDULE], ignore_index=True))
+        self.assertEqual(valid.tolist(), [False, False, False, True, False, True])
+        self.assertEqual(segments["flight_number"].tolist(), [2387, 423])
+
+    def test_resume_needs_the_same_model(self):
+        state = {"schedule": "/data/2023.csv", "size": 1, "mtime": 0.0, "shard_rows": 10, "model_digest": "a"}
+        with tempfile.TemporaryDirectory() as tmp:
+            check_state(tmp, state)
+            check_state(tmp, dict(state))
+            with self.assertRaisesRegex(ValueError, "different run"):
+                check_state(tmp, dict(state, model_digest="b"))
+
+
+class CategoricalEncoderTests(SimpleTestCase):
+    def setUp(self):
+        self.encoder = CategoricalEncoder({
+            "Origin": ["ATL", "JFK", "LAX"],
+            "season": ["DJF", "JJA", "MAM", "SON"],
+        })
+
+    def test_known_and_unknown_categories(self):
+        X = self.encoder.transform(pd.DataFrame({
+            "Origin": ["LAX", "XYZ", "ATL"],
+            "season": ["SON", "SON", "DJF"],
+            "Distance": [1.0, 2.0, 3.0],
+        }))
+        self.assertEqual(X["Origin"].tolist(), [2.0, -1.0, 0.0])
+        self.assertEqual(X["season"].tolist(), [3.0, 3.0, 0.0])
+        self.assertEqual(X["Distance"].tolist(), [1.0, 2.0, 3.0])
+
+    def test_flight_numbers_keep_their_digits(self):
+        X = self.encoder.transform(pd.DataFrame({"Flight_Number_Reporting_Airline": ["423", "DL423", "DL", None]}))
+        self.assertEqual(X["Flight_Number_Reporting_Airline"].tolist(), [423.0, 423.0, -1.0, -1.0])
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "categorical_encoder.json")
+            self.encoder.save(path)
+            loaded = CategoricalEncoder.load(path)
+        self.assertEqual(loaded.categories, self.encoder.categories)
+        self.assertEqual(loaded.unknown_value, -1.0)
+
+
+def reference_calendar_row(date):
+    # The per-date queries utils.map() used before the lookup table existed.
+    hol = USFederalHolidayCalendar().holidays(start=date - pd.Timedelta(days=2), end=date + pd.Timedelta(days=2))
+    hol = pd.to_datetime(hol).normalize()
+    is_holiday = date in hol
+    window = is_holiday or (date - pd.Timedelta(days=1)) in hol or (date + pd.Timedelta(days=1)) in hol
+    fourth_thu = pd.date_range(f"{date.year}-11-01", f"{date.year}-11-30", freq="W-THU")[3]
+    thanksgiving = fourth_thu - pd.Timedelta(days=3) <= date <= fourth_thu + pd.Timedelta(days=3)
+    xmas = (date.month == 12 and date.day >= 20) or (date.month == 1 and date.day <= 5)
+    return [int(is_holiday), int(window), int(thanksgiving), int(xmas), date.isocalendar().week, date.day_of_year]
+
+
+class CalendarIndexTests(SimpleTestCase):
+    def test_matches_per_date_holiday_queries(self):
+        # Covers New Year's Day 2022 being observed on Friday 2021-12-31.
+        days = pd.date_range("2021-12-01", "2023-01-10", freq="D")
+        index = CalendarIndex(2022, 2022)
+        table = index.lookup(days)
+        self.assertEqual(table.shape, (len(days), len(CALENDAR_FIELDS)))
+        for day, row in zip(days, table):
+            with self.subTest(day=day):
+                self.assertEqual(row.tolist(), reference_calendar_row(day))
+
+    def test_grows_to_cover_dates_outside_the_range(self):
+        index = CalendarIndex(2024, 2024)
+        row = index.lookup_one("2031-11-27")
+        self.assertEqual(index.years, (2024, 2031))
+        self.assertEqual(row.tolist(), reference_calendar_row(pd.Timestamp("2031-11-27")))
+
+
+class CompiledForestTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.rf = load_sklearn_forest()
+        cls.forest = CompiledForest.from_sklearn(cls.rf)
+        internal = cls.forest.children[0::2] != np.arange(len(cls.forest.feature))
+        rng = np.random.default_rng(7)
+        X = rng.normal(size=(500, cls.rf.n_features_in_))
+        for f in range(X.shape[1]):
+            t = cls.forest.threshold[internal & (cls.forest.feature == f)]
+            if t.size:
+                X[:, f] = rng.uniform(t.min() - 1.0, t.max() + 1.0, size=len(X))
+        cls.X = pd.DataFrame(X, columns=cls.rf.feature_names_in_)
+
+    def assertMatchesSklearn(self, X):
+        np.testing.assert_allclose(self.forest.predict_proba(X), self.rf.predict_proba(X), rtol=0, atol=1e-12)
+
+    def test_save_and_memory_mapped_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "forest")
+            self.forest.save(path)
+            loaded = CompiledForest.load(path, mmap_mode="r")
+            self.assertIsInstance(loaded.value, np.memmap)
+            np.testing.assert_array_equal(loaded.predict_proba(self.X), self.forest.predict_proba(self.X))
+
+    def test_binary_export_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "forest.forest")
+            self.forest.export(path, leaf_encoding="float64")
+            exact = CompiledForest.from_file(path)
+            self.assertIsInstance(exact.value, np.memmap)
+            np.testing.assert_array_equal(exact.predict_proba(self.X), self.forest.predict_proba(self.X))
+            self.assertEqual(exact.feature_names, self.forest.feature_names)
+            np.testing.assert_array_equal(exact.classes_, self.forest.classes_)
+
+            self.forest.export(path)
+            quantized = CompiledForest.from_file(path)
+            self.assertEqual(quantized.value.dtype, np.uint16)
+            probabilities = quantized.predict_proba(self.X)
+            np.testing.assert_allclose(probabilities, self.forest.predict_proba(self.X), rtol=0, atol=2e-5)
+            np.testing.assert_allclose(probabilities.sum(axis=1), 1.0, rtol=0, atol=1e-12)
+
+    def test_binary_format_rejects_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "forest.forest")
+            with open(path, "wb") as f:
+                f.write(b"\x80\x04not a forest at all")
+            with self.assertRaises(ValueError):
+                CompiledForest.from_file(path)
+
+    def test_quantized_leaves_sum_to_scale(self):
+        value = np.array([[1 / 3, 1 / 3, 1 / 3], [0.5, 0.25, 0.25], [1.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+        counts = quantize_leaves(value)
+        self.assertEqual(counts[:3].sum(axis=1).tolist(), [LEAF_SCALE] * 3)
+        self.assertEqual(counts[3].tolist(), [0, 0, 0])
+        self.assertLessEqual(np.abs(counts / LEAF_SCALE - value).max(), 1 / LEAF_SCALE)
+
+    def test_matches_sklearn_probabilities(self):
+        self.assertMatchesSklearn(self.X)
+        self.assertMatchesSklearn(self.X.iloc[:1])
+
+    def test_values_on_split_thresholds(self):
+        X = self.X.copy()
+        tree = self.rf.estimators_[0].tree_
+        for i, node in enumerate(np.flatnonzero(tree.feature >= 0)):
+            X.iloc[i, tree.feature[node]] = tree.threshold[node]
+        self.assertMatchesSklearn(X)
+
+    def test_missing_values_follow_sklearn(self):
+        X = self.X.copy()
+        X.iloc[::3, self.rf.estimators_[0].tree_.feature[:3]] = np.nan
+        self.assertMatchesSklearn(X)
+
+    def test_floor_float32(self):
+        t = np.array([0.5, 1.0000000001, -2.7, 0.86602357])
+        f = floor_float32(t)
+        self.assertEqual(f.dtype, np.float32)
+        self.assertTrue((f.astype(np.float64) <= t).all())
+        # ...and it is the largest such float32
+        self.assertTrue((np.nextafter(f, np.float32(np.inf)).astype(np.float64) > t).all())
+
+
+class AirportIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = AirportIndex.from_sources(
+            {"JFK": {"lat": 40.6398, "lon": -73.7789}, "LAX": {"lat": 33.9425, "lon": -118.4081},
+             "XXX": {"lat": 0.0, "lon": 0.0}},
+            {"JFK": {"lat": 40.64, "lon": -73.78, "tz": "America/New_York"},
+             "LAX": {"lat": 33.94, "lon": -118.41, "tz": "America/Los_Angeles"},
+             "LHR": {"lat": 51.4706, "lon": -0.4619, "tz": "Europe/London"}},
+        )
+
+    def test_ids_and_time_zones(self):
+        ids = self.index.ids(["LAX", "JFK", "QQQ", "XXX", "LHR"])
+        self.assertEqual(ids[2], -1)
+        self.assertEqual(self.index.tz[ids[3]], -1)
+        self.assertGreaterEqual(ids[4], self.index.n_served)
+        self.assertIs(self.index.zone("JFK"), self.index.zone("JFK"))
+        self.assertEqual(str(self.index.zone("LHR")), "Europe/London")
+        # Served coordinates come from airports.json.
+        self.assertEqual(self.index.coordinates("JFK"), {"lat": 40.6398, "lon": -73.7789})
+
+    def test_unknown_codes(self):
+        self.assertEqual(self.index.unknown(["JFK", "LHR", "QQQ", "XXX", "LAX", "QQQ"]), ["LHR", "QQQ", "XXX"])
+
+    def test_missing_table_names_the_build_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaisesRegex(FileNotFoundError, "build_airport_table"):
+                load_airport_index(os.path.join(tmp, "airports.npz"))
+
+    def test_unknown_airports_are_validation_errors(self):
+        self.assertEqual(set(get_coordinates("JFK")), {"lat", "lon"})
+        for call in (lambda: get_coordinates("QQQ"),
+                     lambda: calculate_flight_duration("2025-09-26T14:35", "2025-09-26T17:50", "JFK", "QQQ")):
+            with self.assertRaisesRegex(ValidationError, "Unknown airports: QQQ"):
+                call()
+        # Block times only need time zones, so airports the model does not serve work too.
+        self.assertEqual(calculate_flight_duration("2025-10-03T11:20", "2025-10-04T15:05", "LAX", "NRT"), 705.0)
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "airports.npz")
+            self.index.save(path)
+            loaded = AirportIndex.load(path)
+        np.testing.assert_array_equal(loaded.codes, self.index.codes)
+        np.testing.assert_array_equal(loaded.lat, self.index.lat)
+        np.testing.assert_array_equal(loaded.tz, self.index.tz)
+        self.assertEqual(loaded.tz_names, self.index.tz_names)
+        self.assertEqual(loaded.n_served, self.index.n_served)
+
+    def test_route_miles_match_scalar_haversine(self):
+        ids = self.index.ids(["JFK", "LAX", "JFK"])
+        miles = self.index.route_miles(ids, ids[[1, 0, 1]])
+        expected = haversine(40.6398, -73.7789, 33.9425, -118.4081)
+        np.testing.assert_allclose(miles, [expected] * 3, rtol=1e-12)
+
+    def test_to_utc_matches_zoneinfo(self):
+        local = pd.Series(pd.to_datetime(["2025-11-02T01:30", "2025-07-01T12:00", "2025-03-09T02:30"]))
+        utc = self.index.to_utc(local, self.index.ids(["JFK", "LAX", "JFK"]))
+        self.assertEqual(utc[0], pd.Timestamp("2025-11-02T05:30", tz="UTC"))
+        self.assertEqual(utc[1], pd.Timestamp("2025-07-01T19:00", tz="UTC"))
+        self.assertTrue(pd.isna(utc[2]))
+
+
+class ArtifactRegistryTests(SimpleTestCase):
+    def test_loads_once_on_first_use_and_reports_stats(self):
+        calls = []
+        registry = ArtifactRegistry()
+        registry.register("answer", lambda: calls.append(1) or {"value": 42})
+        self.assertFalse(registry.stats()["answer"]["loaded"])
+        self.assertEqual(registry.get("answer"), {"value": 42})
+        self.assertEqual(registry.get("answer"), {"value": 42})
+        self.assertEqual(len(calls), 1)
+        stats = registry.stats()["answer"]
+        self.assertTrue(stats["loaded"])
+        self.assertGreaterEqual(stats["load_seconds"], 0.0)
+        self.assertIsNotNone(stats["rss_delta_bytes"])
+
+    def test_missing_artifact_is_retried(self):
+        values = [None, None, {"value": 42}]
+        registry = ArtifactRegistry()
+        registry.register("answer", lambda: values.pop(0))
+        self.assertIsNone(registry.get("answer"))
+        self.assertIsNone(registry.get("answer"))
+        self.assertFalse(registry.stats()["answer"]["loaded"])
+        self.assertEqual(registry.get("answer"), {"value": 42})
+        self.assertEqual(registry.get("answer"), {"value": 42})
+
+
+class ModelRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.model_dir = os.path.join(self.tmp, "models")
+        self.registry = ModelRegistry(self.model_dir, os.path.dirname(model_file_path), os.path.join(self.tmp, "cache"))
+
+    def publish(self, version, content=None):
+        directory = os.path.join(self.model_dir, version)
+        os.makedirs(directory)
+        target = os.path.join(directory, MODEL_FILENAME)
+        if content is None:
+            shutil.copyfile(model_file_path, target)
+        else:
+            with open(target, "wb") as fh:
+                fh.write(content)
+        TEST_ENCODER.save(os.path.join(directory, ENCODER_FILENAME))
+
+    def test_serves_default_model_by_content_hash(self):
+        self.assertEqual(self.registry.current().version, file_digest(model_file_path)[:12])
+        self.assertFalse(self.registry.refresh())
+
+    def test_swaps_to_newest_version_without_touching_held_models(self):
+        self.publish("v2")
+        held = self.registry.current()
+        self.assertEqual(held.version, "v2")
+
+        self.publish("v10")
+        self.publish(".v11-uploading")
+        self.assertTrue(self.registry.refresh())
+        self.assertEqual(self.registry.current().version, "v10")
+        self.assertEqual(held.version, "v2")
+        self.assertIsNotNone(held.forest)
+
+    def test_prefers_the_binary_forest_file(self):
+        self.publish("v1")
+        directory = os.path.join(self.model_dir, "v1")
+        CompiledForest.from_sklearn(load_sklearn_forest()).export(os.path.join(directory, FOREST_FILENAME))
+        os.unlink(os.path.join(directory, MODEL_FILENAME))
+        model = self.registry.current()
+        self.assertEqual(model.version, "v1")
+        self.assertEqual(model.forest.value.dtype, np.uint16)
+        self.assertFalse(os.path.exists(os.path.join(self.tmp, "cache")))
+
+    def test_refuses_a_model_without_its_encoder(self):
+        self.publish("v1")
+        os.unlink(os.path.join(self.model_dir, "v1", ENCODER_FILENAME))
+        with self.assertRaisesRegex(FileNotFoundError, "build_encoder.py"):
+            load_encoder(os.path.join(self.model_dir, "v1"))
+
+    def test_check_names_the_missing_encoder_and_its_build_step(self):
+        self.publish("v1")
+        self.registry.check()
+        os.unlink(os.path.join(self.model_dir, "v1", ENCODER_FILENAME))
+        with self.assertRaisesRegex(ImproperlyConfigured, "v1.*make build-encoder"):
+            self.registry.check()
+
+    def test_broken_version_keeps_serving_the_previous_one(self):
+        self.publish("v1")
+        self.registry.current()
+        self.publish("v2", content=b"not a pickle")
+        with self.assertLogs("flights.model_registry", level="ERROR"):
+            self.assertFalse(self.registry.refresh())
+        self.assertFalse(self.registry.refresh())
+        self.assertEqual(self.registry.current().version, "v1")
+
+
+PREDICT_FLIGHTS = [
+    {"airline": "DL", "flightNumber": "DL423", "departureAirport": "JFK", "arrivalAirport": "LAX",
+     "departureDateTime": "2025-09-26T14:35:00.000Z", "arrivalDateTime": "2025-09-26T17:50:00.000Z"},
+    {"airline": "UA", "flightNumber": "UA1102", "departureAirport": "ATL", "arrivalAirport": "ORD",
+     "departureDateTime": "2025-10-03T06:10:00.000Z", "arrivalDateTime": "2025-10-03T07:45:00.000Z"},
+]
+
+
+class PredictFlightViewTests(SimpleTestCase):
+    def setUp(self):
+        cache = mock.patch.object(scoring, "_prediction_cache", CountingCache(LRUBackend(), ttl=60))
+        cache.start()
+        self.addCleanup(cache.stop)
+
+    def test_predicts_every_leg_and_reports_model_version(self):
+        response = APIClient().post("/api/flights/predict", {"flights": PREDICT_FLIGHTS}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data["results"]), 2)
+        for probabilities in response.data["results"]:
+            self.assertAlmostEqual(float(sum(probabilities)), 1.0)
+        self.assertTrue(response.data["model_version"])
+
+    def test_rejects_empty_requests(self):
+        response = APIClient().post("/api/flights/predict", {"flights": []}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_airport_is_a_bad_request(self):
+        flight = dict(PREDICT_FLIGHTS[0], arrivalAirport="QQQ")
+        response = APIClient().post("/api/flights/predict", {"flights": [flight]}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_matches_per_leg_segments(self):
+        flights = PREDICT_FLIGHTS + [
+            # 01:30 on the night DST ends happens twice; utils takes the first.
+            dict(PREDICT_FLIGHTS[0], departureDateTime="2025-11-02T01:30:00.000Z",
+                 arrivalDateTime="2025-11-02T04:45:00.000Z"),
+        ]
+        expected = []
+        for f in flights:
+            dep, arr = f["departureDateTime"][:-1], f["arrivalDateTime"][:-1]
+            a, b = get_coordinates(f["departureAirport"]), get_coordinates(f["arrivalAirport"])
+            expected.append({
+                "date": dep, "airline": f["airline"], "flight_number": f["flightNumber"],
+                "origin": f["departureAirport"], "dest": f["arrivalAirport"],
+                "dep_time": minutes_after_midnight(dep), "arr_time": minutes_after_midnight(arr),
+                "elapsed_time": calculate_flight_duration(dep, arr, f["departureAirport"], f["arrivalAirport"]),
+                "distance": haversine(a["lat"], a["lon"], b["lat"], b["lon"]),
+            })
+        actual = build_features(segments_from_flights(flights_frame(flights)))
+        pd.testing.assert_frame_equal(actual, build_features(expected))
+
+    def test_duplicate_legs_are_scored_once(self):
+        model = model_registry.current()
+        flights = [PREDICT_FLIGHTS[0], PREDICT_FLIGHTS[1], PREDICT_FLIGHTS[0], PREDICT_FLIGHTS[0]]
+        with mock.patch.object(model, "predict_proba", wraps=model.predict_proba) as predict_proba:
+            results, unique_legs = score_flights(flights, model)
+        self.assertEqual(unique_legs, 2)
+        self.assertEqual(len(predict_proba.call_args.args[0]), 2)
+        np.testing.assert_array_equal(results[0], results[2])
+        np.testing.assert_array_equal(results, score_flights(flights[:2], model)[0][[0, 1, 0, 0]])
+
+
+    def test_hot_legs_skip_features_and_inference(self):
+        model = model_registry.current()
+        first, _ = score_flights(PREDICT_FLIGHTS, model)
+        with mock.patch.object(scoring, "build_features") as build, \
+                mock.patch.object(model, "predict_proba") as predict_proba:
+            again, _ = score_flights(PREDICT_FLIGHTS, model)
+        build.assert_not_called()
+        predict_proba.assert_not_called()
+        np.testing.assert_array_equal(first, again)
+
+        # Same leg with a differently written time is the same key.
+        flight = dict(PREDICT_FLIGHTS[0], departureDateTime="2025-09-26T14:35:00Z")
+        with mock.patch.object(model, "predict_proba") as predict_proba:
+            score_flights([flight], model)
+        predict_proba.assert_not_called()
+
+        with override_settings(METRICS_ENABLED=True, METRICS_ALLOWED_IPS=["127.0.0.1"]):
+            stats = APIClient().get("/api/flights/metrics/caches").data["prediction"]
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 2))
+
+    def test_cache_is_tagged_with_the_model_version(self):
+        keys = prediction_cache_keys(flights_frame(PREDICT_FLIGHTS), "v1")
+        self.assertNotEqual(keys, prediction_cache_keys(flights_frame(PREDICT_FLIGHTS), "v2"))
+        self.assertEqual(len(set(keys)), 2)
+
+
+class NeighborIndexTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = rng.normal(size=(20, 33))
+        X = centers[rng.integers(0, 20, 3000)] + 0.1 * rng.normal(size=(3000, 33))
+        self.data = np.hstack([X, rng.normal(10, 20, size=(3000, 2))]).astype(np.float32)
+        self.index = NeighborIndex.build(lambda: [self.data[:1000], self.data[1000:]], nlist=16,
+                                         airline_stats={}, airport_busyness={})
+
+    def test_exact_search_matches_brute_force(self):
+        queries = self.data[:5, :33]
+        rows, dist = self.index.search_exact(queries, 10)
+        vectors = np.asarray(self.index.vectors, dtype=np.float64)
+        for q, r, d in zip(queries.astype(np.float64), rows, dist):
+            expected = ((vectors - q) ** 2).sum(axis=1)
+            np.testing.assert_allclose(d, np.sort(expected)[:10], rtol=1e-3, atol=1e-3)
+
+    def test_probing_every_list_is_exact(self):
+        queries = self.data[:5, :33]
+        approx, _ = self.index.search(queries, 10, nprobe=self.index.nlist)
+        exact, _ = self.index.search_exact(queries, 10)
+        np.testing.assert_array_equal(approx, exact)
+
+    def test_approximate_search_recall(self):
+        queries = self.data[::100, :33]
+        approx, _ = self.index.search(queries, 10, nprobe=4)
+        exact, _ = self.index.search_exact(queries, 10)
+        recall = np.mean([len(np.intersect1d(a, e)) / 10 for a, e in zip(approx, exact)])
+        self.assertGreater(recall, 0.9)
+
+    def test_delays_follow_their_vectors(self):
+        rows, _ = self.index.search_exact(self.data[7:8, :33], 1)
+        np.testing.assert_array_equal(self.index.delays[rows[0, 0]], self.data[7, 33:])
+
+    def test_saved_index_is_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.index.save(os.path.join(tmp, "neighbors"))
+            loaded = NeighborIndex.load(os.path.join(tmp, "neighbors"))
+            self.assertIsInstance(loaded.vectors, np.memmap)
+            np.testing.assert_array_equal(
+                loaded.search(self.data[:3, :33], 5, nprobe=4)[0], self.index.search(self.data[:3, :33], 5, nprobe=4)[0],
+            )
+            built = NeighborIndex.build(lambda: [self.data], nlist=16, directory=os.path.join(tmp, "built"),
+                                        airline_stats={}, airport_busyness={})
+            self.assertIsInstance(built.vectors, np.memmap)
+            self.assertEqual(built.vectors.shape, (3000, 33))
+
+
+def load_gen_embeddings():
+    spec = importlib.util.spec_from_file_location(
+        "gen_embeddings", os.path.join(settings.BASE_DIR.parent, "model", "gen_embeddings.py"),
+    )
+    gen_embeddings = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gen_embeddings)
+    return gen_embeddings
+
+
+class GenEmbeddingsTests(SimpleTestCase):
+    def test_month_file_matches_embed_row(self):
+        gen_embeddings = load_gen_embeddings()
+        airport_map = {"JFK": (40.6413, -73.7781), "LGA": (40.7769, -73.8740), "MSP": (44.8820, -93.2218)}
+        airline_stats = {"DL": {"centroid_xyz": [0.2, -0.7, 0.6], "typical_dep_sin": 0.1,
+                                "typical_dep_cos": -0.9, "mean_distance_miles": 950.0}}
+        busyness = {"JFK": 1.0, "MSP": 0.5}
+        month = pd.DataFrame({
+            "Month": 7, "DayofMonth": [1, 2, 3, 4, 5, 6], "DayOfWeek": [1, 2, 3, 4, 5, 6],
+            "Reporting_Airline": ["DL", "AA", "DL", "UA", "DL", "AA"],
+            "Origin": ["JFK", "LGA", "MSP", "ZZZ", "JFK", "MSP"], "Dest": ["MSP", "JFK", "LGA", "JFK", "LGA", "JFK"],
+            "CRSDepTime": [5, 1359, 2400, 830, 1745, 2359], "CRSArrTime": [815, 1500, 250, 1030, 1845, 345],
+            # Signed zeros must survive: a late-by-nothing flight is written as -0.0.
+            "DepDelay": [-0.0, 0.0, 12.0, 3.0, -7.0, 0.0], "ArrDelay": [0.0, -0.0, 30.5, 1.0, -12.0, -0.0],
+            "CRSElapsedTime": [190.0, 61.0, 170.0, 120.0, 65.0, 165.0],
+            "Distance": [1029.0, 22.0, 1020.0, 700.0, 11.0, 1029.0],
+            "is_christmas_eve": 0, "is_thanksgiving": 0,
+        })
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "2024", "2024_7.csv")
+            os.makedirs(os.path.dirname(path))
+            month.to_csv(path, index=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                stats = gen_embeddings.process_month_file(path, os.path.join(tmp, "out"), airport_map,
+                                                          airline_stats, busyness, chunk_rows=4)
+            with open(stats["csv"], "r", encoding="utf-8") as f:
+                written = [line.split(",", 1)[1] for line in f]
+
+            # The original per-row loop, written out the same way (without the row IDs).
+            rows = gen_embeddings.clean_and_require(pd.read_csv(path))
+            vectors = [gen_embeddings.embed_row(row, 2024, airport_map, airline_stats, busyness)
+                       for _, row in rows.iterrows()]
+            expected = pd.DataFrame(np.array([v for v in vectors if v is not None], dtype=np.float32),
+                                    columns=gen_embeddings.make_feature_names())
+
+        self.assertEqual(stats["rows_out"], 5)
+        self.assertEqual(stats["dropped_unknown_airport"], 1)
+        self.assertEqual("".join(written), expected.to_csv(index=False))
+
+
+class NeighborEmbeddingTests(SimpleTestCase):
+    def test_matches_the_training_embeddings(self):
+        gen_embeddings = load_gen_embeddings()
+
+        flights = PREDICT_FLIGHTS + [
+            {"airline": "AA", "flightNumber": "AA10", "departureAirport": "LAX", "arrivalAirport": "JFK",
+             "departureDateTime": "2025-11-27T23:05:00.000Z", "arrivalDateTime": "2025-11-28T07:30:00.000Z"},
+            {"airline": "DL", "flightNumber": "DL88", "departureAirport": "ORD", "arrivalAirport": "ATL",
+             "departureDateTime": "2025-12-24T00:20:00.000Z", "arrivalDateTime": "2025-12-24T03:15:00.000Z"},
+        ]
+        airline_stats = {
+            "DL": {"centroid_xyz": [0.1, -0.7, 0.6], "typical_dep_sin": 0.3, "typical_dep_cos": -0.9,
+                   "mean_distance_miles": 850.0},
+            "AA": {"centroid_xyz": [-0.2, -0.8, 0.5], "typical_dep_sin": -0.4, "typical_dep_cos": 0.9,
+                   "mean_distance_miles": 1100.0},
+        }
+        busyness = {"JFK": 0.8, "ATL": 1.0, "ORD": 0.9}
+        index = NeighborIndex.build(lambda: [np.zeros((1, 35), np.float32)], nlist=1,
+                                    airline_stats=airline_stats, airport_busyness=busyness)
+
+        # The same legs as rows of the BTS on-time table.
+        seg = segments_from_flights(flights_frame(flights))
+        date = pd.to_datetime(seg["date"])
+        airports = registry.get("airport_index")
+        codes = pd.unique(pd.concat([seg["origin"], seg["dest"]]))
+        ids = airports.ids(codes)
+        history = pd.DataFrame({
+            "Month": date.dt.month, "DayofMonth": date.dt.day, "DayOfWeek": date.dt.dayofweek + 1,
+            "Reporting_Airline": seg["airline"], "Origin": seg["origin"], "Dest": seg["dest"],
+            "CRSDepTime": seg["dep_time"] // 60 * 100 + seg["dep_time"] % 60,
+            "CRSArrTime": seg["arr_time"] // 60 * 100 + seg["arr_time"] % 60,
+            "DepDelay": 0.0, "ArrDelay": 0.0, "CRSElapsedTime": seg["elapsed_time"], "Distance": seg["distance"],
+            "is_christmas_eve": [0, 0, 0, 1], "is_thanksgiving": [0, 0, 1, 0],
+        })
+        expected, keep, _ = gen_embeddings.embed_frame(
+            history, 2025, {c: (airports.lat[i], airports.lon[i]) for c, i in zip(codes, ids)},
+            airline_stats, busyness,
+        )
+        self.assertTrue(keep.all())
+        np.testing.assert_allclose(index.embed(flights), expected[:, :-N_DELAYS], atol=1e-5)
+
+
+class SimilarFlightsViewTests(SimpleTestCase):
+    def test_reports_neighbor_delay_distribution(self):
+        rng = np.random.default_rng(0)
+        data = np.hstack([rng.normal(size=(500, 33)), rng.normal(10, 20, size=(500, 2))]).astype(np.float32)
+        index = NeighborIndex.build(lambda: [data], nlist=4, airline_stats={}, airport_busyness={"JFK": 1.0})
+        self.assertEqual(index.embed(PREDICT_FLIGHTS).shape, (2, 33))
+        with mock.patch.object(neighbors, "get_neighbor_index", return_value=index), \
+                mock.patch("flights.views.get_neighbor_index", return_value=index):
+            response = APIClient().post("/api/flights/similar", {"flights": PREDICT_FLIGHTS, "k": 20}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), 2)
+        result = response.data["results"][0]
+        self.assertEqual(result["neighbors"], 20)
+        self.assertLessEqual(result["departure_delay"]["p10"], result["departure_delay"]["p90"])
+
+    def test_unavailable_index_and_bad_k(self):
+        with mock.patch("flights.views.get_neighbor_index", return_value=None):
+            response = APIClient().post("/api/flights/similar", {"flights": PREDICT_FLIGHTS}, format="json")
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("no neighbor index", response.data["error"])
+        response = APIClient().post("/api/flights/similar", {"flights": PREDICT_FLIGHTS, "k": 0}, format="json")
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(NEIGHBOR_INDEX_DIR="/nonexistent/neighbor-index")
+    def test_missing_index_is_logged_once(self):
+        with mock.patch.object(neighbors, "_missing_logged", False), \
+                self.assertLogs("flights.neighbors", level="WARNING") as logs:
+            for _ in range(3):
+                self.assertIsNone(neighbors.load_neighbor_index())
+        self.assertEqual(len(logs.records), 1)
+
+
+class BulkPredictViewTests(SimpleTestCase):
+    def test_csv_in_csv_out(self):
+        body = pd.DataFrame(PREDICT_FLIGHTS * 3).to_csv(index=False)
+        response = APIClient().post("/api/flights/predict/bulk", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(response["X-Unique-Legs"], "2")
+        out = pd.read_csv(io.StringIO(response.content.decode()))
+        self.assertEqual(len(out), 6)
+        probabilities = out.filter(like="p_")
+        np.testing.assert_allclose(probabilities.sum(axis=1), 1.0)
+        np.testing.assert_array_equal(probabilities.iloc[0], probabilities.iloc[2])
+
+    def test_ndjson(self):
+        body = "".join(json.dumps(f) + "\n" for f in PREDICT_FLIGHTS)
+        response = APIClient().post("/api/flights/predict/bulk", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        lines = response.content.decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertAlmostEqual(sum(json.loads(lines[0])["results"]), 1.0)
+
+    def test_json_body_and_row_cap(self):
+        response = APIClient().post("/api/flights/predict/bulk", {"flights": PREDICT_FLIGHTS}, format="json")
+        self.assertEqual((response.status_code, response.data["unique_legs"]), (201, 2))
+        with override_settings(PREDICT_BULK_MAX_ROWS=1):
+            response = APIClient().post("/api/flights/predict/bulk", {"flights": PREDICT_FLIGHTS}, format="json")
+        self.assertEqual(response.status_code, 413)
+
+    def test_missing_columns(self):
+        response = APIClient().post("/api/flights/predict/bulk", "airline,flightNumber\nDL,DL1\n", content_type="text/csv")
+        self.assertEqual(response.status_code, 400)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        histogram = Histogram("test_seconds", "Test.", ["stage"], buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.labels('a"b').observe(value)
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="a\\"b",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="a\\"b",le="1.0"} 3', lines)
+        self.assertIn('test_seconds_bucket{stage="a\\"b",le="+Inf"} 4', lines)
+        self.assertIn('test_seconds_count{stage="a\\"b"} 4', lines)
+
+    def test_counter_without_labels(self):
+        counter = Counter("test_total", "Test.")
+        counter.inc()
+        counter.inc(2)
+        self.assertEqual(counter.render()[-1], "test_total 3")
+
+    def test_span_records_one_observation(self):
+        from .metrics import STAGE_SECONDS
+        before = STAGE_SECONDS.labels("test.span").count
+        with span("test.span"):
+            pass
+        self.assertEqual(STAGE_SECONDS.labels("test.span").count, before + 1)
+
+    @mock.patch.object(scoring, "_prediction_cache", None)
+    @override_settings(PREDICTION_CACHE_BACKEND="none", METRICS_ENABLED=True)
+    def test_endpoint_reports_prediction_stages(self):
+        APIClient().post("/api/flights/predict", {"flights": PREDICT_FLIGHTS}, format="json")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        for stage in ("predict.validate", "predict.airports", "predict.timezones", "predict.features",
+                      "predict.encode", "predict.forest"):
+            self.assertIn(f'skygamble_stage_seconds_count{{stage="{stage}"}}', body)
+        self.assertIn('skygamble_segments_per_request_bucket{endpoint="predict",le="2.0"}', body)
+
+    def test_endpoint_is_off_by_default_and_gated_when_on(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+        with override_settings(METRICS_ENABLED=True, METRICS_ALLOWED_IPS=["10.0.0.1"], METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.1").status_code, 200)
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.9").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.9",
+                                             HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="203.0.113.9",
+                                             HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+    def test_cache_stats_share_the_metrics_gate(self):
+        url = "/api/flights/metrics/caches"
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with override_settings(METRICS_ENABLED=True, METRICS_ALLOWED_IPS=["10.0.0.1"], METRICS_TOKEN="s3cret"):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR="10.0.0.1").status_code, 200)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR="203.0.113.9").status_code, 403)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR="203.0.113.9",
+                                             HTTP_AUTHORIZATION="Bearer s3cret").status_code, 200)
+
+
+class ProfilingTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def profile(self, signing_key="profile-test-key", **headers):
+        with override_settings(PROFILE_ENABLED=True, PROFILE_DIR=self.tmp, PROFILE_SAMPLE_RATE=0.0,
+                               PROFILE_SIGNING_KEY=signing_key):
+            return APIClient().post("/api/flights/predict", {"flights": PREDICT_FLIGHTS}, format="json", **headers)
+
+    def token(self, key="profile-test-key"):
+        with override_settings(PROFILE_SIGNING_KEY=key):
+            return make_profile_token()
+
+    def test_signed_header_writes_a_profile(self):
+        response = self.profile(HTTP_X_PROFILE=self.token())
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(os.listdir(self.tmp), [response["X-Profile-File"]])
+        self.assertTrue(response["X-Profile-File"].startswith("predict-flight-"))
+
+    def test_bad_signature_is_not_profiled(self):
+        response = self.profile(HTTP_X_PROFILE="profile:forged:token")
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header("X-Profile-File"))
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_headers_are_ignored_without_a_signing_key(self):
+        signed_with_secret_key = signing.TimestampSigner(salt="flights.profiling").sign("profile")
+        for token, key in ((signed_with_secret_key, "profile-test-key"), (self.token(), "")):
+            response = self.profile(signing_key=key, HTTP_X_PROFILE=token)
+            self.assertFalse(response.has_header("X-Profile-File"))
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_failed_write_keeps_the_response(self):
+        with mock.patch("flights.profiling.write_profile", side_effect=OSError("disk full")):
+            with self.assertLogs("flights.profiling", level="ERROR"):
+                response = self.profile(HTTP_X_PROFILE=self.token())
+        self.assertEqual(response.status_code, 201)
+        self.assertFalse(response.has_header("X-Profile-File"))
+
+    def test_deterministic_profile_as_speedscope(self):
+        def leaf():
+            return sum(range(1000))
+
+        profiler = DeterministicProfiler().start()
+        leaf()
+        profiler.stop()
+        path = os.path.join(self.tmp, "p.json")
+        write_speedscope(profiler.stacks, path, "test", profiler.unit)
+        with open(path, encoding="utf-8") as f:
+            document = json.load(f)
+        names = [frame["name"] for frame in document["shared"]["frames"]]
+        self.assertTrue(any("leaf" in name for name in names))
+        profile = document["profiles"][0]
+        self.assertEqual(len(profile["samples"]), len(profile["weights"]))
+        self.assertEqual(profile["endValue"], sum(profile["weights"]))
+
+
+class CacheBackendTests(SimpleTestCase):
+    def test_lru_evicts_least_recently_used(self):
+        backend = LRUBackend(max_entries=2)
+        backend.set("a", 1)
+        backend.set("b", 2)
+        backend.get("a")
+        backend.set("c", 3)
+        self.assertEqual((backend.get("a"), backend.get("b"), backend.get("c")), (1, None, 3))
+
+    def test_entries_expire_after_ttl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for backend in (LRUBackend(), SQLiteBackend(os.path.join(tmp, "cache.sqlite3"))):
+                with self.subTest(backend=type(backend).__name__):
+                    backend.set("k", [{"relevant": True}], ttl=60)
+                    self.assertEqual(backend.get("k"), [{"relevant": True}])
+                    with mock.patch("flights.caching.time.time", return_value=time.time() + 61):
+                        self.assertIsNone(backend.get("k"))
+
+    def test_batch_get_and_set(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for backend in (LRUBackend(), SQLiteBackend(os.path.join(tmp, "cache.sqlite3"))):
+                with self.subTest(backend=type(backend).__name__):
+                    backend.set_many({f"k{i}": [i, 0.5] for i in range(600)}, ttl=60)
+                    found = backend.get_many(["k1", "k599", "missing"])
+                    self.assertEqual(found, {"k1": [1, 0.5], "k599": [599, 0.5]})
+                    with mock.patch("flights.caching.time.time", return_value=time.time() + 61):
+                        self.assertEqual(backend.get_many(["k1"]), {})
+
+    def test_counting_cache_tracks_hit_rate(self):
+        cache = CountingCache(LRUBackend())
+        cache.get("k")
+        cache.set("k", "v")
+        cache.get("k")
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["hit_rate"], 0.5)
+
+
+PARSED = [{
+    "relevant": True, "departure_airport": "JFK", "arrival_airport": "LAX",
+    "departure_datetime_local": "2025-09-26T14:35", "arrival_datetime_local": "2025-09-26T17:50",
+    "airline_iata": "DL", "flight_number": "DL423", "missing_fields": [], "notes": "",
+}]
+
+
+def fake_openai_client():
+    client = mock.Mock()
+    client.files.create.return_value = SimpleNamespace(id="file-123")
+    client.responses.create.return_value = SimpleNamespace(output_text=json.dumps(PARSED, indent=2))
+    return client
+
+
+class UploadItineraryViewTests(SimpleTestCase):
+    def setUp(self):
+        self.client_mock = fake_openai_client()
+        patches = [
+            mock.patch.object(parser, "get_client", return_value=self.client_mock),
+            mock.patch.object(parser, "_parse_cache", CountingCache(LRUBackend(), ttl=60)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def upload(self, content=b"%PDF-1.4 boarding pass"):
+        f = SimpleUploadedFile("pass.pdf", content, content_type="application/pdf")
+        return APIClient().post("/api/flights/upload", {"file": f}, format="multipart")
+
+    def test_repeat_upload_is_served_from_cache(self):
+        first = self.upload()
+        second = self.upload()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.data, PARSED)
+        self.assertEqual(second.data, PARSED)
+        self.assertEqual((first["X-Parse-Cache"], second["X-Parse-Cache"]), ("miss", "hit"))
+        self.assertEqual((first["X-Parse-Tier"], second["X-Parse-Tier"]), ("llm", "cache"))
+        self.assertEqual(self.client_mock.responses.create.call_count, 1)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    def test_spooled_upload_is_streamed_and_hashed(self):
+        content = b"%PDF-1.4 " + os.urandom(256 * 1024)
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        _, sent, _ = self.client_mock.files.create.call_args.kwargs["file"]
+        self.assertNotIsInstance(sent, bytes)
+        key = parser.parse_cache_key(hashlib.sha256(content).hexdigest())
+        self.assertEqual(parser._parse_cache.get(key), PARSED)
+
+    @override_settings(UPLOAD_MAX_BYTES=1024)
+    def test_oversized_upload_is_rejected(self):
+        response = self.upload(b"x" * (1 << 20))
+        self.assertEqual(response.status_code, 413)
+        self.client_mock.files.create.assert_not_called()
+
+    def test_text_pdf_never_reaches_the_llm(self):
+        response = self.upload(ITINERARY_PDF)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response["X-Parse-Tier"], "text")
+        self.assertEqual(response.data[0]["flight_number"], "DL423")
+        self.client_mock.files.create.assert_not_called()
+
+    def test_cache_key_covers_prompt_and_model(self):
+        key = parser.parse_cache_key("abc")
+        self.assertIn(parser.PROMPT_DIGEST[:16], key)
+        self.assertNotEqual(key, parser.parse_cache_key("abc", model="another-model"))
+
+
+def text_pdf(*lines):
+    ops = b"BT /F1 10 Tf 72 720 Td " + b" ".join(b"(" + line.encode("latin-1") + b") Tj T*" for line in lines) + b" ET"
+    body = zlib.compress(ops)
+    return (
+        b"%PDF-1.4\n1 0 obj\n<< /Length " + str(len(body)).encode() + b" /Filter /FlateDecode >>\nstream\n"
+        + body + b"\nendstream\nendobj\n%%EOF\n"
+    )
+
+
+ITINERARY_PDF = text_pdf(
+    "Booking reference ABC123",
+    "Flight DL 423  Fri, Sep 26, 2025",
+    "New York (JFK) to Los Angeles (LAX)",
+    "Boarding 1:55 PM",
+    "Depart 2:35 PM  Arrive 5:50 PM",
+    "Flight DL 7  Oct 3, 2025",
+    "LAX - NRT",
+    "Depart 11:20 AM  Arrive 3:05 PM",
+)
+
+BCBP = "M1DESMARAIS/LUC       EABC123 YULFRAAC 0834 326J001A0025 100"
+
+
+class LocalParserTests(SimpleTestCase):
+    def test_text_pdf_is_parsed_locally(self):
+        items, tier = parse_locally(ITINERARY_PDF, "application/pdf")
+        self.assertEqual(tier, "text")
+        self.assertEqual(
+            [(i["flight_number"], i["departure_airport"], i["arrival_airport"],
+              i["departure_datetime_local"], i["arrival_datetime_local"]) for i in items],
+            [
+                ("DL423", "JFK", "LAX", "2025-09-26T14:35", "2025-09-26T17:50"),
+                # Crossing the date line: the only plausible arrival is the next day.
+                ("DL7", "LAX", "NRT", "2025-10-03T11:20", "2025-10-04T15:05"),
+            ],
+        )
+        self.assertTrue(all(i["relevant"] and i["missing_fields"] == [] for i in items))
+
+    def test_aircraft_types_are_not_flights(self):
+        text = "Flight DL 423  Sep 26, 2025\nAircraft: Airbus A321\nConnecting UA1102, operated by E175\nB738 Q400 MD88"
+        self.assertEqual([flight for _, flight in find_flights(text)], [("DL", "423"), ("UA", "1102")])
+
+        pdf = text_pdf(
+            "Flight DL 423  Fri, Sep 26, 2025", "New York (JFK) to Los Angeles (LAX)",
+            "Depart 2:35 PM  Arrive 5:50 PM", "Boeing B739  Seat 21C",
+        )
+        [item], tier = parse_locally(pdf, "application/pdf")
+        self.assertEqual((tier, item["flight_number"]), ("text", "DL423"))
+
+    def test_incomplete_text_is_left_to_the_llm(self):
+        pdf = text_pdf("Flight DL 423  Sep 26, 2025", "JFK to LAX", "Departure 2:35 PM")
+        self.assertIsNone(parse_locally(pdf, "application/pdf"))
+        self.assertIsNone(parse_locally(b"%PDF-1.4 scanned", "application/pdf"))
+
+    def test_implausible_times_are_left_to_the_llm(self):
+        pdf = text_pdf("Flight DL 423  Sep 26, 2025", "JFK to LAX", "Depart 2:35 PM  Arrive 11:40 AM")
+        self.assertIsNone(parse_locally(pdf, "application/pdf"))
+
+    def test_bcbp(self):
+        [leg] = parse_bcbp(BCBP)
+        self.assertEqual((leg["origin"], leg["dest"], leg["airline"], leg["number"]), ("YUL", "FRA", "AC", "834"))
+        self.assertEqual((leg["date"].month, leg["date"].day), (11, 22))
+        self.assertIsNone(parse_bcbp("M1 not a boarding pass"))
+
+    def test_bcbp_with_printed_times(self):
+        text = f"{BCBP}\nDeparture 21:40  Arrival 10:55".encode()
+        [item], tier = parse_locally(text, "text/plain")
+        self.assertEqual(tier, "bcbp")
+        self.assertEqual(item["flight_number"], "AC834")
+        self.assertEqual(item["arrival_datetime_local"][11:], "10:55")
+        self.assertGreater(item["arrival_datetime_local"], item["departure_datetime_local"])
+
+    @override_settings(PARSER_LOCAL_TIERS=[])
+    def test_tiers_can_be_disabled(self):
+        self.assertIsNone(parse_locally(ITINERARY_PDF, "application/pdf"))
+
+
+class AsyncUploadViewTests(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeOpenAIServer(latency=0.2, items=PARSED).start()
+        self.addCleanup(self.server.stop)
+        env = mock.patch.dict(os.environ, {"OPENAI_BASE_URL": self.server.base_url, "OPENAI_API_KEY": "fake"})
+        cache = mock.patch.object(parser, "_parse_cache", CountingCache(LRUBackend(), ttl=60))
+        for p in (env, cache):
+            p.start()
+            self.addCleanup(p.stop)
+
+    async def upload(self, content):
+        f = SimpleUploadedFile("pass.pdf", content, content_type="application/pdf")
+        return await AsyncClient().post("/api/flights/upload/async", {"file": f})
+
+    async def test_parses_through_the_async_client(self):
+        response = await self.upload(b"%PDF-1.4 async pass")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content), PARSED)
+        self.assertEqual([path for path, _ in self.server.requests], ["/v1/files", "/v1/responses"])
+
+        again = await self.upload(b"%PDF-1.4 async pass")
+        self.assertEqual(again["X-Parse-Cache"], "hit")
+        self.assertEqual(len(self.server.requests), 2)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1024)
+    async def test_spooled_upload_is_streamed_to_the_parser(self):
+        content = b"%PDF-1.4 " + os.urandom(256 * 1024)
+        response = await self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        (path, size), _ = self.server.requests
+        self.assertEqual(path, "/v1/files")
+        self.assertGreater(size, len(content))
+
+    @override_settings(UPLOAD_MAX_BYTES=1024)
+    async def test_oversized_upload_is_rejected(self):
+        response = await self.upload(b"x" * (1 << 20))
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.server.requests, [])
+
+    @override_settings(PARSER_MAX_CONCURRENCY=1, PARSER_QUEUE_TIMEOUT=0.05)
+    async def test_sheds_load_when_every_parser_slot_is_taken(self):
+        responses = await asyncio.gather(self.upload(b"first"), self.upload(b"second"))
+        self.assertEqual(sorted(r.status_code for r in responses), [201, 503])
+
+    async def test_missing_file_is_rejected(self):
+        response = await AsyncClient().post("/api/flights/upload/async", {})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_profiled_on_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(
+            PROFILE_ENABLED=True, PROFILE_DIR=tmp, PROFILE_SAMPLE_RATE=1.0, PROFILE_MODE="deterministic",
+        ):
+            response = await self.upload(b"%PDF-1.4 profiled pass")
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(response["X-Profile-File"].startswith("upload-itinerary-async-"))
+            with open(os.path.join(tmp, response["X-Profile-File"]), encoding="utf-8") as f:
+                self.assertIn("upload_itinerary_async", f.read())
+
+
+class ParseJobTests(TestCase):
+    def setUp(self):
+        self.client_mock = fake_openai_client()
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir, ignore_errors=True)
+        patches = [
+            mock.patch.object(parser, "get_client", return_value=self.client_mock),
+            mock.patch.object(parser, "_parse_cache", CountingCache(LRUBackend(), ttl=60)),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        spool = override_settings(PARSE_JOB_SPOOL_DIR=spool_dir, PARSE_JOB_WORKERS=0)
+        spool.enable()
+        self.addCleanup(spool.disable)
+
+    def submit(self, content=b"%PDF-1.4 queued pass"):
+        f = SimpleUploadedFile("pass.pdf", content, content_type="application/pdf")
+        return APIClient().post("/api/flights/upload?mode=job", {"file": f}, format="multipart")
+
+    def test_job_is_queued_then_parsed_by_a_worker(self):
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data["status"], ParseJob.PENDING)
+        self.client_mock.responses.create.assert_not_called()
+
+        status = APIClient().get(response["Location"])
+        self.assertEqual(status.data["status"], ParseJob.PENDING)
+
+        self.assertEqual(run_pending_jobs(), 1)
+        status = APIClient().get(response["Location"])
+        self.assertEqual(status.data["status"], ParseJob.DONE)
+        self.assertEqual(status.data["result"], PARSED)
+        self.assertEqual(os.listdir(settings.PARSE_JOB_SPOOL_DIR), [])
+
+    def test_cached_upload_finishes_immediately(self):
+        APIClient().post(
+            "/api/flights/upload",
+            {"file": SimpleUploadedFile("pass.pdf", b"%PDF-1.4 seen", content_type="application/pdf")},
+            format="multipart",
+        )
+        response = self.submit(b"%PDF-1.4 seen")
+        self.assertEqual(response.data["status"], ParseJob.DONE)
+        self.assertEqual(run_pending_jobs(), 0)
+
+    def test_failed_parse_is_reported(self):
+        self.client_mock.responses.create.side_effect = RuntimeError("parser down")
+        job_id = self.submit().data["job_id"]
+        run_pending_jobs()
+        job = ParseJob.objects.get(id=job_id)
+        self.assertEqual(job.status, ParseJob.FAILED)
+        self.assertIn("parser down", job.error)
+
+    @override_settings(PARSE_JOB_TIMEOUT=60, PARSE_JOB_MAX_ATTEMPTS=2)
+    def test_silent_running_job_is_retried_then_abandoned(self):
+        job_id = self.submit().data["job_id"]
+        claimed = claim_next_job()
+        self.assertEqual((claimed.status, claimed.attempts), (ParseJob.RUNNING, 1))
+        self.assertIsNone(claim_next_job())
+
+        # A long parse whose worker keeps its heartbeat is left alone.
+        ParseJob.objects.filter(id=job_id).update(started_at=claimed.started_at - timedelta(seconds=600))
+        self.assertIsNone(claim_next_job())
+
+        ParseJob.objects.filter(id=job_id).update(heartbeat_at=claimed.heartbeat_at - timedelta(seconds=120))
+        self.assertEqual(claim_next_job().attempts, 2)
+
+        ParseJob.objects.filter(id=job_id).update(heartbeat_at=claimed.heartbeat_at - timedelta(seconds=120))
+        self.assertIsNone(claim_next_job())
+        self.assertEqual(ParseJob.objects.get(id=job_id).status, ParseJob.FAILED)
+        self.assertEqual(os.listdir(settings.PARSE_JOB_SPOOL_DIR), [])
+
+    def test_events_stream_ends_with_the_result(self):
+        job_id = self.submit().data["job_id"]
+        run_pending_jobs()
+
+        async def collect():
+            return [event async for event in job_events(job_id, poll_interval=0, timeout=1)]
+
+        events = async_to_sync(collect)()
+        self.assertTrue(events[0].startswith("retry: "))
+        self.assertTrue(events[1].startswith("event: status"))
+        self.assertTrue(events[-1].startswith("event: result"))
+        self.assertEqual(json.loads(events[-1].split("data: ", 1)[1])["result"], PARSED)
+
+        async def stream():
+            response = await AsyncClient().get(f"/api/flights/jobs/{job_id}/events")
+            return response, b"".join([chunk async for chunk in response.streaming_content])
+
+        response, body = async_to_sync(stream)()
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertIn("event: result", body.decode())
+
+    def test_events_stream_times_out_for_a_pending_job(self):
+        job_id = self.submit().data["job_id"]
+
+        async def collect():
+            return [event async for event in job_events(job_id, poll_interval=0, timeout=0)]
+
+        self.assertTrue(async_to_sync(collect)()[-1].startswith("event: timeout"))
+
+    def test_unknown_job_is_404(self):
+        self.assertEqual(APIClient().get(f"/api/flights/jobs/{uuid.uuid4()}").status_code, 404)
@@ -0,0 +1,105 @@
+import hashlib
+import mimetypes
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from rest_framework.exceptions import APIException
+
+CHUNK_SIZE = 1 << 16
+
+# Room for the multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD = 1 << 16
+
+
+class UploadTooLarge(APIException):
+    status_code = 413
+    default_detail = "Uploaded file is too large."
+    default_code = "upload_too_large"
+
+
+class HashingUploadMixin:
+    """Hashes each chunk as it is received and stops the upload once it passes
+    UPLOAD_MAX_BYTES. The stored file gets a `sha256` attribute."""
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > settings.UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD:
+            raise UploadTooLarge()
+        return super().handle_raw_input(input_data, META, content_length, boundary, encoding)
+
+    def new_file(self, *args, **kwargs):
+        # Set up first: MemoryFileUploadHandler.new_file() raises
+        # StopFutureHandlers when it takes the file.
+        self.sha256 = hashlib.sha256()
+        self.received = 0
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_BYTES:
+            raise UploadTooLarge()
+        remaining = super().receive_data_chunk(raw_data, start)
+        if remaining is None:
+            # This handler stored the chunk; a pass-through means a later one will.
+            self.sha256.update(raw_data)
+        return remaining
+
+    def file_complete(self, file_size):
+        up = super().file_complete(file_size)
+        if up is not None:
+            up.sha256 = self.sha256.hexdigest()
+        return up
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+
+def content_digest(data):
+    """SHA-256 hex digest of bytes or a binary file, read in chunks."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(data).hexdigest()
+    h = hashlib.sha256()
+    data.seek(0)
+    for chunk in iter(lambda: data.read(CHUNK_SIZE), b""):
+        h.update(chunk)
+    data.seek(0)
+    return h.hexdigest()
+
+
+def describe_upload(up):
+    """(filename, content_type, sha256) for an uploaded file, without reading it
+    into memory."""
+    filename = getattr(up, "name", "upload.bin")
+    content_type = (
+        getattr(up, "content_type", None)
+        or mimetypes.guess_type(filename)[0]
+        or "application/octet-stream"
+    )
+    digest = getattr(up, "sha256", None)
+    if digest is None:
+        # Uploaded through handlers other than the hashing ones above.
+        h = hashlib.sha256()
+        for chunk in up.chunks(CHUNK_SIZE):
+            h.update(chunk)
+        digest = h.hexdigest()
+    return filename, content_type, digest
+
+
+@contextmanager
+def open_upload(up):
+    """A binary file object for the upload, positioned at the start.
+
+    Spooled uploads are reopened from their temp file path; the OpenAI client
+    streams either kind in chunks rather than reading it whole.
+    """
+    if hasattr(up, "temporary_file_path"):
+        with open(up.temporary_file_path(), "rb") as fh:
+            yield fh
+    else:
+        up.seek(0)
+        yield up.file
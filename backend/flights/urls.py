@@ -1,7 +1,13 @@
 from django.urls import path
-from .views import UploadItineraryView, PredictFlightView
+from .views import UploadItineraryView, PredictFlightView, BulkPredictView, SimilarFlightsView, CacheStatsView, ParseJobView, parse_job_events, upload_itinerary_async
 
 urlpatterns = [
     path('upload', UploadItineraryView.as_view(), name='upload-itinerary'),
+    path('upload/async', upload_itinerary_async, name='upload-itinerary-async'),
+    path('jobs/<uuid:job_id>', ParseJobView.as_view(), name='parse-job'),
+    path('jobs/<uuid:job_id>/events', parse_job_events, name='parse-job-events'),
     path('predict', PredictFlightView.as_view(), name='predict-flight'),
+    path('predict/bulk', BulkPredictView.as_view(), name='predict-bulk'),
+    path('similar', SimilarFlightsView.as_view(), name='similar-flights'),
+    path('metrics/caches', CacheStatsView.as_view(), name='cache-stats'),
 ]
@@ -4,12 +4,14 @@ import math
 import json
 import os
 from datetime import datetime
-import airportsdata
 from zoneinfo import ZoneInfo
-from joblib import dump, load
-from pandas.tseries.holiday import USFederalHolidayCalendar as USCal
+from joblib import load
 from django.conf import settings
-from sklearn.preprocessing import OrdinalEncoder
+from rest_framework.exceptions import ValidationError
+from .airports import AIRPORT_TABLE_FILENAME, AirportIndex
+from .calendar_index import CALENDAR_FIELDS, calendar_index
+from .model_registry import model_registry
+from .registry import registry
 
 PARSER_PROMPT: str = """
 You are an expert travel document parser. Your task is to extract structured data from a SINGLE uploaded file
@@ -150,6 +152,10 @@ EXAMPLES
 ]
 """
 
+IS_US_HOLIDAY, IS_HOLIDAY_WINDOW, IS_THANKSGIVING_WEEK = (
+    CALENDAR_FIELDS.index(f) for f in ("is_us_holiday", "is_holiday_window", "is_thanksgiving_week")
+)
+
 # --- helpers (from your script) ---
 def hhmm_to_min_of_day(val):
     s = str(val).zfill(4)
@@ -174,18 +180,11 @@ def season_from_month(m):
     if m in [9,10,11]:return "SON"
 
 def us_holiday_flags(date):
-    cal = USCal()
-    hol = cal.holidays(start=date - pd.Timedelta(days=2), end=date + pd.Timedelta(days=2))
-    hol = pd.to_datetime(hol).normalize()
-    is_holiday = date.normalize() in hol
-    before = (date - pd.Timedelta(days=1)).normalize() in hol
-    after  = (date + pd.Timedelta(days=1)).normalize() in hol
-    return int(is_holiday), int(is_holiday or before or after)
+    row = calendar_index().lookup_one(date)
+    return int(row[IS_US_HOLIDAY]), int(row[IS_HOLIDAY_WINDOW])
 
 def thanksgiving_week_flag(date):
-    y = date.year
-    fourth_thu = pd.date_range(f"{y}-11-01", f"{y}-11-30", freq="W-THU")[3]
-    return int((date >= (fourth_thu - pd.Timedelta(days=3))) and (date <= (fourth_thu + pd.Timedelta(days=3))))
+    return int(calendar_index().lookup_one(date)[IS_THANKSGIVING_WEEK])
 
 def xmas_nye_window_flag(date):
     m, d = date.month, date.day
@@ -289,12 +288,39 @@ def map(date, airline, flight_number, origin, dest, dep_time, arr_time, elapsed_
 
 
 json_file_path = os.path.join(settings.BASE_DIR, 'flights', 'data', 'airports.json')
-with open(json_file_path, 'r') as file:
-    airports = json.load(file)
+
+def load_airports():
+    with open(json_file_path, 'r') as file:
+        return json.load(file)
+
+
+airport_table_path = os.path.join(settings.BASE_DIR, 'flights', 'data', AIRPORT_TABLE_FILENAME)
+
+def build_airport_index():
+    import airportsdata
+    return AirportIndex.from_sources(load_airports(), airportsdata.load('IATA'))
+
+
+def load_airport_index(path=airport_table_path):
+    try:
+        return AirportIndex.load(path)
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"No airport table at {path}; build it with `python manage.py build_airport_table` before serving."
+        ) from None
+
+
+def require_served(airport_index, codes):
+    """Reject codes the model cannot score with the 400 the predict views give."""
+    unknown = airport_index.unknown(codes)
+    if unknown:
+        raise ValidationError({"error": f"Unknown airports: {', '.join(unknown)}."})
 
 
 def get_coordinates(airport_code):
-    return airports[airport_code]
+    airport_index = registry.get("airport_index")
+    require_served(airport_index, [airport_code])
+    return airport_index.coordinates(airport_code)
 
 
 def haversine(lat1, lon1, lat2, lon2):
@@ -315,14 +341,19 @@ def minutes_after_midnight(datetime_str):
     return dt.hour * 60 + dt.minute
   
 
-airports_data = airportsdata.load('IATA')
-  
 def calculate_flight_duration(departureDateTime, arrivalDateTime, departureAirport, arrivalAirport):
+    # Any airport with a time zone will do (the local parser checks block
+    # times of international legs); whether the model serves it is for the
+    # predict views to decide.
+    airport_index = registry.get("airport_index")
     dep_naive = datetime.fromisoformat(departureDateTime)
     arr_naive = datetime.fromisoformat(arrivalDateTime)
 
-    dep_tz = ZoneInfo(airports_data[departureAirport]['tz'])
-    arr_tz = ZoneInfo(airports_data[arrivalAirport]['tz'])
+    try:
+        dep_tz = airport_index.zone(departureAirport)
+        arr_tz = airport_index.zone(arrivalAirport)
+    except KeyError as exc:
+        raise ValidationError({"error": f"Unknown airports: {exc.args[0]}."}) from None
 
     dep_time = dep_naive.replace(tzinfo=dep_tz)
     arr_time = arr_naive.replace(tzinfo=arr_tz)
@@ -332,15 +363,14 @@ def calculate_flight_duration(departureDateTime, arrivalDateTime, departureAirpo
 
 
 model_file_path = os.path.join(settings.BASE_DIR, 'flights', 'data', 'random_forest_model.joblib')
-rf_loaded = load(model_file_path)
-
-def predict(df_row):
-    X_test = df_row
-    cat_cols = X_test.select_dtypes(include=["object"]).columns
-    num_cols = X_test.select_dtypes(exclude=["object"]).columns
-
-    if len(cat_cols) > 0:
-        enc = OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1)
-        X_test[cat_cols] = enc.fit_transform(X_test[cat_cols])
-        
-    return rf_loaded.predict_proba(X_test)
+
+def load_sklearn_forest(path=model_file_path):
+    return load(path)
+
+
+registry.register("airport_index", load_airport_index)
+
+def predict(df_rows, model=None):
+    # Pass the model a request started with so a hot swap can't split its results.
+    model = model or model_registry.current()
+    return model.predict_proba(df_rows)
@@ -1,66 +1,104 @@
-import os
+import asyncio
+import hmac
 import json
-import mimetypes
-from openai import OpenAI
-from rest_framework.parsers import MultiPartParser
+import pandas as pd
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from openai import APITimeoutError
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.views import APIView, Response
 from .serializers import UploadPDFSerializer
-from .utils import PARSER_PROMPT, map, get_coordinates, haversine, minutes_after_midnight, calculate_flight_duration, predict
-
-
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-)
+from .parsers import CSVParser, NDJSONParser
+from .jobs import job_events, submit_job
+from . import metrics
+from .metrics import SEGMENTS_PER_REQUEST, span
+from .model_registry import model_registry
+from .models import ParseJob
+from .neighbors import get_neighbor_index, similar_flights
+from .parser import ParserBusy, get_parse_cache, parse_itinerary, parse_itinerary_async
+from .scoring import get_prediction_cache, score_flights
+from .uploads import UploadTooLarge, describe_upload, open_upload
 
 
 class UploadItineraryView(APIView):
     parser_classes = [MultiPartParser]
 
     def post(self, request):
-        serializer = UploadPDFSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        up = serializer.validated_data["file"]
-
-        filename = getattr(up, "name", "upload.bin")
-        content_type = (
-            getattr(up, "content_type", None)
-            or mimetypes.guess_type(filename)[0]
-            or "application/octet-stream"
-        )
-
-        if hasattr(up, "temporary_file_path"):  
-            with open(up.temporary_file_path(), "rb") as fh:
-                data = fh.read()
-        else:
-            up.seek(0)
-            data = up.read()
-            
-        parts = [{"type": "input_text", "text": PARSER_PROMPT}]
-
-
-        result = client.files.create(
-            file=(filename, data, content_type), 
-            purpose="user_data",
-        )
-        if content_type == "application/pdf":
-            parts.append({"type": "input_file", "file_id": result.id})
-        elif content_type.startswith("image/"):
-            parts.append({"type": "input_image", "file_id": result.id})   
-            
-        response = client.responses.create(
-            model="gpt-5-mini",
-            input=[
-                {
-                    "role": "user",
-                    "content": parts
-                }
-            ],
-        )
-        
-        response = response.output_text.strip().replace("\n", "")
-        response_json = json.loads(response)
-
-        return Response(response_json, status=201)
+        # Reading request.data pulls the multipart body off the socket.
+        with span("upload.receive"):
+            serializer = UploadPDFSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            up = serializer.validated_data["file"]
+            filename, content_type, digest = describe_upload(up)
+
+        if request.query_params.get("mode") == "job":
+            with open_upload(up) as fh:
+                job = submit_job(filename, content_type, fh, digest)
+            status_url = reverse("parse-job", args=[job.id])
+            response = Response({
+                "job_id": str(job.id),
+                "status": job.status,
+                "status_url": request.build_absolute_uri(status_url),
+                "events_url": request.build_absolute_uri(reverse("parse-job-events", args=[job.id])),
+            }, status=202)
+            response["Location"] = status_url
+            return response
+
+        with open_upload(up) as fh:
+            response_json, tier = parse_itinerary(filename, fh, content_type, digest=digest)
+
+        response = Response(response_json, status=201)
+        response["X-Parse-Cache"] = "hit" if tier == "cache" else "miss"
+        response["X-Parse-Tier"] = tier
+        return response
+
+
+@csrf_exempt
+@require_POST
+async def upload_itinerary_async(request):
+    # Same contract as UploadItineraryView, but the OpenAI round trips are
+    # awaited on the event loop instead of holding a worker thread.
+    try:
+        serializer = UploadPDFSerializer(data=request.FILES)
+    except UploadTooLarge as exc:
+        return JsonResponse({"detail": exc.detail}, status=exc.status_code)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    up = serializer.validated_data["file"]
+    with span("upload.receive"):
+        filename, content_type, digest = await asyncio.to_thread(describe_upload, up)
+
+    try:
+        with open_upload(up) as fh:
+            response_json, tier = await parse_itinerary_async(filename, fh, content_type, digest)
+    except ParserBusy:
+        return JsonResponse({"error": "Parser is busy, try again shortly."}, status=503)
+    except APITimeoutError:
+        return JsonResponse({"error": "Parser timed out."}, status=504)
+
+    response = JsonResponse(response_json, safe=False, status=201)
+    response["X-Parse-Cache"] = "hit" if tier == "cache" else "miss"
+    response["X-Parse-Tier"] = tier
+    return response
+
+
+class ParseJobView(APIView):
+    def get(self, request, job_id):
+        job = get_object_or_404(ParseJob, id=job_id)
+        return Response(job.as_dict())
+
+
+async def parse_job_events(request, job_id):
+    if not await ParseJob.objects.filter(id=job_id).aexists():
+        raise Http404("No ParseJob matches the given query.")
+    response = StreamingHttpResponse(job_events(job_id), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 class PredictFlightView(APIView):
@@ -68,40 +106,106 @@ class PredictFlightView(APIView):
         flight_data = request.data.get("flights", [])
         if not flight_data:
             return Response({"error": "No flight data provided."}, status=400)
-        
-        results = []
-        for flight in flight_data:
-            departure_coordinates = get_coordinates(flight["departureAirport"])
-            arrival_coordinates = get_coordinates(flight["arrivalAirport"])
-            flight["departureDateTime"] = flight["departureDateTime"][:-1]
-            flight["arrivalDateTime"] = flight["arrivalDateTime"][:-1]
-            distance = haversine(
-                departure_coordinates["lat"],
-                departure_coordinates["lon"],
-                arrival_coordinates["lat"],
-                arrival_coordinates["lon"]
-            )
-            flight_duration = calculate_flight_duration(
-                flight["departureDateTime"], 
-                flight["arrivalDateTime"], 
-                flight["departureAirport"], 
-                flight["arrivalAirport"]
-            )
-            
-            # print(distance, flight_duration)
-            
-            df_row = map(
-                date=flight["departureDateTime"],          
-                airline=flight["airline"],              
-                flight_number=flight["flightNumber"],         
-                origin=flight["departureAirport"],
-                dest=flight["arrivalAirport"],               
-                dep_time=minutes_after_midnight(flight["departureDateTime"]),
-                arr_time=minutes_after_midnight(flight["arrivalDateTime"]),
-                elapsed_time=flight_duration,
-                distance=distance
-            )
-            
-            results.append(predict(df_row)[0])
-            
-        return Response({"results": results}, status=201)
\ No newline at end of file
+
+        SEGMENTS_PER_REQUEST.labels("predict").observe(len(flight_data))
+        model = model_registry.current()
+        with span("predict"):
+            results, _ = score_flights(flight_data, model)
+
+        return Response({"results": results.tolist(), "model_version": model.version}, status=201)
+
+
+class SimilarFlightsView(APIView):
+    """Delay distribution of the k most similar historical flights for each leg."""
+
+    def post(self, request):
+        flight_data = request.data.get("flights", [])
+        if not flight_data:
+            return Response({"error": "No flight data provided."}, status=400)
+        try:
+            k = int(request.data.get("k", settings.NEIGHBOR_DEFAULT_K))
+        except (TypeError, ValueError):
+            return Response({"error": "k must be an integer."}, status=400)
+        if not 1 <= k <= settings.NEIGHBOR_MAX_K:
+            return Response({"error": f"k must be between 1 and {settings.NEIGHBOR_MAX_K}."}, status=400)
+        if get_neighbor_index() is None:
+            return Response({"error": "Similar flights are unavailable: no neighbor index has been built."},
+                            status=503)
+
+        return Response({"k": k, "results": similar_flights(flight_data, k)}, status=200)
+
+
+class BulkPredictView(APIView):
+    """Scores a whole schedule: {"flights": [...]}, CSV or NDJSON with the
+    FLIGHT_FIELDS columns. CSV and NDJSON requests get the same format back."""
+
+    parser_classes = [JSONParser, CSVParser, NDJSONParser]
+
+    def post(self, request):
+        data = request.data
+        if not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame(data.get("flights", []) if isinstance(data, dict) else data)
+        if data.empty:
+            return Response({"error": "No flight data provided."}, status=400)
+        if len(data) > settings.PREDICT_BULK_MAX_ROWS:
+            return Response({"error": f"At most {settings.PREDICT_BULK_MAX_ROWS} flights per request."}, status=413)
+
+        SEGMENTS_PER_REQUEST.labels("predict_bulk").observe(len(data))
+        model = model_registry.current()
+        with span("predict_bulk"):
+            results, unique_legs = score_flights(data, model)
+
+        media_type = request.content_type.split(";")[0].strip()
+        if media_type == CSVParser.media_type:
+            out = data.copy()
+            for i, label in enumerate(model.classes_):
+                out[f"p_{label}"] = results[:, i]
+            response = HttpResponse(out.to_csv(index=False), content_type="text/csv", status=201)
+        elif media_type == NDJSONParser.media_type:
+            body = "".join(json.dumps({"results": row}) + "\n" for row in results.tolist())
+            response = HttpResponse(body, content_type="application/x-ndjson", status=201)
+        else:
+            return Response({
+                "results": results.tolist(),
+                "unique_legs": unique_legs,
+                "model_version": model.version,
+            }, status=201)
+        response["X-Model-Version"] = model.version
+        response["X-Unique-Legs"] = str(unique_legs)
+        return response
+
+
+def metrics_allowed(request):
+    """Whether `request` may read this worker's metrics.
+
+    Raises Http404 unless METRICS_ENABLED; then True for METRICS_ALLOWED_IPS and
+    for requests bearing METRICS_TOKEN.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404()
+    token = request.META.get("HTTP_AUTHORIZATION", "").removeprefix("Bearer ")
+    return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS or bool(
+        settings.METRICS_TOKEN and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode())
+    )
+
+
+class CacheStatsView(APIView):
+    """Hit/miss counters of this worker's parse and prediction caches, behind
+    the same gate as /metrics."""
+
+    def get(self, request):
+        if not metrics_allowed(request):
+            return Response({"error": "Forbidden"}, status=403)
+        caches = {"parse": get_parse_cache(), "prediction": get_prediction_cache()}
+        return Response({name: cache.stats() if cache is not None else None for name, cache in caches.items()})
+
+
+def metrics_view(request):
+    """This worker's stage timings and counters in the Prometheus text format.
+
+    Gated by metrics_allowed().
+    """
+    if not metrics_allowed(request):
+        return HttpResponse("Forbidden\n", status=403, content_type="text/plain")
+    caches = {"parse": get_parse_cache(), "prediction": get_prediction_cache()}
+    return HttpResponse(metrics.render(caches), content_type=metrics.CONTENT_TYPE)
@@ -51,7 +51,8 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'corsheaders',
-    'rest_framework'
+    'rest_framework',
+    'flights',
 ]
 
 MIDDLEWARE = [
@@ -63,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'flights.profiling.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'skygamble.urls'
@@ -137,4 +139,114 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-CORS_ALLOW_ALL_ORIGINS = True
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = True
+
+# Years precomputed by the calendar feature table (flights.calendar_index).
+# Dates outside the range still work; the table grows on first use.
+CALENDAR_START_YEAR = env.int('CALENDAR_START_YEAR', default=2015)
+CALENDAR_END_YEAR = env.int('CALENDAR_END_YEAR', default=2035)
+
+# Serving artifacts (flights.registry). Derived, memory-mapped copies of the
+# model live in ARTIFACT_CACHE_DIR; set PRELOAD_ARTIFACTS when the app is
+# imported before forking (gunicorn --preload) so workers share them.
+ARTIFACT_CACHE_DIR = env('ARTIFACT_CACHE_DIR', default=os.path.join(BASE_DIR, 'flights', 'data', 'cache'))
+PRELOAD_ARTIFACTS = env.bool('PRELOAD_ARTIFACTS', default=False)
+
+# Versioned models: MODEL_DIR/<version>/random_forest_model.joblib. The newest
+# version is served; workers poll for new ones every MODEL_RELOAD_INTERVAL
+# seconds (0 disables hot reload).
+MODEL_DIR = env('MODEL_DIR', default=os.path.join(BASE_DIR, 'flights', 'data', 'models'))
+MODEL_RELOAD_INTERVAL = env.float('MODEL_RELOAD_INTERVAL', default=0)
+
+# Itinerary parsing (flights.parser). Parse results are cached by the SHA-256
+# of the upload, the prompt and the model. PARSE_CACHE_BACKEND is one of
+# memory (per-worker LRU), sqlite (PARSE_CACHE_PATH), django (the
+# PARSE_CACHE_ALIAS cache) or none.
+PARSER_MODEL = env('PARSER_MODEL', default='gpt-5-mini')
+PARSER_TIMEOUT = env.float('PARSER_TIMEOUT', default=120.0)
+PARSER_CONNECT_TIMEOUT = env.float('PARSER_CONNECT_TIMEOUT', default=5.0)
+PARSER_MAX_RETRIES = env.int('PARSER_MAX_RETRIES', default=2)
+# Async upload view: parses in flight per worker, and how long an upload may
+# wait for a free slot before getting a 503.
+PARSER_MAX_CONCURRENCY = env.int('PARSER_MAX_CONCURRENCY', default=16)
+PARSER_QUEUE_TIMEOUT = env.float('PARSER_QUEUE_TIMEOUT', default=10.0)
+# Local tiers (flights.local_parser) tried in order before the LLM; an empty
+# list sends every upload to the LLM. Larger uploads skip them.
+PARSER_LOCAL_TIERS = env.list('PARSER_LOCAL_TIERS', default=['bcbp', 'text'])
+PARSER_LOCAL_MAX_BYTES = env.int('PARSER_LOCAL_MAX_BYTES', default=5 * 1024 * 1024)
+PARSE_CACHE_BACKEND = env('PARSE_CACHE_BACKEND', default='memory')
+PARSE_CACHE_TTL = env.int('PARSE_CACHE_TTL', default=24 * 60 * 60)
+PARSE_CACHE_MAX_ENTRIES = env.int('PARSE_CACHE_MAX_ENTRIES', default=1024)
+PARSE_CACHE_PATH = env('PARSE_CACHE_PATH', default=os.path.join(BASE_DIR, 'parse_cache.sqlite3'))
+PARSE_CACHE_ALIAS = env('PARSE_CACHE_ALIAS', default='default')
+
+# Job mode of the upload endpoint (POST /api/flights/upload?mode=job). Uploads
+# are spooled to PARSE_JOB_SPOOL_DIR and parsed by `manage.py run_parse_workers`
+# or, with PARSE_JOB_WORKERS > 0, by that many threads in each web process.
+PARSE_JOB_SPOOL_DIR = env('PARSE_JOB_SPOOL_DIR', default=os.path.join(BASE_DIR, 'parse_jobs'))
+PARSE_JOB_WORKERS = env.int('PARSE_JOB_WORKERS', default=0)
+PARSE_JOB_POLL_INTERVAL = env.float('PARSE_JOB_POLL_INTERVAL', default=1.0)
+# A worker refreshes a running job's heartbeat every
+# PARSE_JOB_HEARTBEAT_INTERVAL seconds; one silent for PARSE_JOB_TIMEOUT is
+# presumed dead and its job retried, however long the parse itself takes.
+PARSE_JOB_HEARTBEAT_INTERVAL = env.float('PARSE_JOB_HEARTBEAT_INTERVAL', default=15.0)
+PARSE_JOB_TIMEOUT = env.float('PARSE_JOB_TIMEOUT', default=90.0)
+PARSE_JOB_MAX_ATTEMPTS = env.int('PARSE_JOB_MAX_ATTEMPTS', default=3)
+# Job event streams end after PARSE_JOB_EVENTS_TIMEOUT seconds; EventSource
+# clients reconnect after PARSE_JOB_EVENTS_RETRY_MS.
+PARSE_JOB_EVENTS_TIMEOUT = env.float('PARSE_JOB_EVENTS_TIMEOUT', default=25.0)
+PARSE_JOB_EVENTS_RETRY_MS = env.int('PARSE_JOB_EVENTS_RETRY_MS', default=1000)
+
+# Uploads are hashed as they arrive and rejected with a 413 once they pass
+# UPLOAD_MAX_BYTES; files over FILE_UPLOAD_MAX_MEMORY_SIZE are spooled to disk
+# and streamed to the parser from there.
+UPLOAD_MAX_BYTES = env.int('UPLOAD_MAX_BYTES', default=20 * 1024 * 1024)
+FILE_UPLOAD_MAX_MEMORY_SIZE = env.int('FILE_UPLOAD_MAX_MEMORY_SIZE', default=1024 * 1024)
+FILE_UPLOAD_HANDLERS = [
+    'flights.uploads.HashingMemoryFileUploadHandler',
+    'flights.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Most legs accepted by one POST /api/flights/predict/bulk.
+PREDICT_BULK_MAX_ROWS = env.int('PREDICT_BULK_MAX_ROWS', default=50000)
+
+# Prediction cache (flights.scoring), keyed by each leg's date, times, flight
+# and airports plus the model version. Backends as for PARSE_CACHE_BACKEND.
+PREDICTION_CACHE_BACKEND = env('PREDICTION_CACHE_BACKEND', default='memory')
+PREDICTION_CACHE_TTL = env.int('PREDICTION_CACHE_TTL', default=6 * 60 * 60)
+PREDICTION_CACHE_MAX_ENTRIES = env.int('PREDICTION_CACHE_MAX_ENTRIES', default=100000)
+PREDICTION_CACHE_PATH = env('PREDICTION_CACHE_PATH', default=os.path.join(BASE_DIR, 'prediction_cache.sqlite3'))
+PREDICTION_CACHE_ALIAS = env('PREDICTION_CACHE_ALIAS', default='default')
+
+# Nearest-neighbor delay lookup (flights.neighbors) over the flight embeddings
+# from model/gen_embeddings.py; build the index with `manage.py
+# build_neighbor_index`. A query scans the NEIGHBOR_NPROBE nearest of the
+# index's lists; NEIGHBOR_NPROBE >= its list count is exact search.
+NEIGHBOR_INDEX_DIR = env('NEIGHBOR_INDEX_DIR', default=os.path.join(BASE_DIR, 'flights', 'data', 'neighbors'))
+NEIGHBOR_NPROBE = env.int('NEIGHBOR_NPROBE', default=8)
+NEIGHBOR_DEFAULT_K = env.int('NEIGHBOR_DEFAULT_K', default=50)
+NEIGHBOR_MAX_K = env.int('NEIGHBOR_MAX_K', default=1000)
+
+# Prometheus metrics on /metrics (flights.metrics) and the cache counters on
+# /api/flights/metrics/caches. Off by default; when enabled, only
+# METRICS_ALLOWED_IPS (the scraper's address as REMOTE_ADDR sees it) and
+# requests with "Authorization: Bearer <METRICS_TOKEN>" may read them.
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=False)
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# On-demand profiling (flights.profiling). With PROFILE_ENABLED, requests to the
+# PROFILE_VIEWS URL names are profiled when they carry a signed X-Profile
+# header (`manage.py profile_token`) or with probability PROFILE_SAMPLE_RATE.
+# Headers are signed with PROFILE_SIGNING_KEY and ignored while it is unset.
+# PROFILE_MODE is sampling (every PROFILE_INTERVAL seconds) or deterministic;
+# PROFILE_FORMAT is collapsed (flamegraph stacks) or speedscope.
+PROFILE_ENABLED = env.bool('PROFILE_ENABLED', default=False)
+PROFILE_SAMPLE_RATE = env.float('PROFILE_SAMPLE_RATE', default=0.0)
+PROFILE_VIEWS = env.list('PROFILE_VIEWS', default=['predict-flight', 'upload-itinerary', 'upload-itinerary-async'])
+PROFILE_MODE = env('PROFILE_MODE', default='sampling')
+PROFILE_INTERVAL = env.float('PROFILE_INTERVAL', default=0.001)
+PROFILE_FORMAT = env('PROFILE_FORMAT', default='collapsed')
+PROFILE_DIR = env('PROFILE_DIR', default=os.path.join(BASE_DIR, 'profiles'))
+PROFILE_TOKEN_MAX_AGE = env.int('PROFILE_TOKEN_MAX_AGE', default=60 * 60)
+PROFILE_SIGNING_KEY = env('PROFILE_SIGNING_KEY', default='')
@@ -16,8 +16,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from flights.views import metrics_view
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/flights/', include('flights.urls'))
+    path('api/flights/', include('flights.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
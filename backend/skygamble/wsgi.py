@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'skygamble.settings')
 
 application = get_wsgi_application()
+
+# Fail at boot, not on the first /predict, when the served model has no encoder.
+from flights.model_registry import model_registry  # noqa: E402
+
+model_registry.check()
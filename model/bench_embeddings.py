@@ -0,0 +1,95 @@
+# Rows/sec of the vectorized process_month_file() against the original
+# iterrows() + embed_row() loop, on a synthetic BTS month; also checks that
+# both write byte-identical CSVs.
+#
+#   python bench_embeddings.py --rows 200000
+
+import os, time, argparse, tempfile
+import numpy as np
+import pandas as pd
+
+from gen_embeddings import (
+    clean_and_require, embed_row, extract_year_month_from_path,
+    hhmm_to_minutes, make_feature_names, process_month_file,
+)
+
+AIRPORTS = {
+    "LGA": (40.7769, -73.8740),
+    "JFK": (40.6413, -73.7781),
+    "BDL": (41.9389, -72.6833),
+    "BGM": (42.2087, -75.9799),
+    "PIT": (40.4914, -80.2329),
+    "MSP": (44.8820, -93.2218),
+    "BWI": (39.1754, -76.6684),
+    "BGR": (44.8074, -68.8281),
+}
+
+def synthetic_month(path: str, n_rows: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    codes = list(AIRPORTS) + ["ZZZ"]  # one unknown airport
+    dep = rng.integers(0, 24, n_rows) * 100 + rng.integers(0, 60, n_rows)
+    pd.DataFrame({
+        "Month": 7, "DayofMonth": rng.integers(1, 32, n_rows), "DayOfWeek": rng.integers(1, 8, n_rows),
+        "Reporting_Airline": rng.choice(["AA", "DL", "UA", "WN", "B6"], n_rows),
+        "Origin": rng.choice(codes, n_rows), "Dest": rng.choice(codes, n_rows),
+        "CRSDepTime": dep, "CRSArrTime": (dep + 230) % 2400,
+        "DepDelay": rng.normal(5, 30, n_rows).round(), "ArrDelay": rng.normal(3, 35, n_rows).round(),
+        "CRSElapsedTime": rng.integers(45, 400, n_rows).astype(float),
+        "Distance": rng.integers(80, 2800, n_rows).astype(float),
+        "is_christmas_eve": 0, "is_thanksgiving": 0,
+    }).to_csv(path, index=False)
+
+def legacy_month_file(file_path: str, csv_path: str, airport_map, airline_stats, airport_busyness):
+    # process_month_file() as it was before vectorization.
+    year, _ = extract_year_month_from_path(file_path)
+    df = clean_and_require(pd.read_csv(file_path))
+    df["dep_min"] = df["CRSDepTime"].apply(hhmm_to_minutes)
+    df["arr_min"] = df["CRSArrTime"].apply(hhmm_to_minutes)
+    df = df[df["dep_min"].notna() & df["arr_min"].notna()].copy()
+    rows, ids = [], []
+    for _, row in df.iterrows():
+        vec = embed_row(row, year, airport_map, airline_stats, airport_busyness)
+        if vec is None:
+            continue
+        rows.append(vec)
+        ids.append(f"{year}-{int(row['Month']):02d}-{int(row['DayofMonth']):02d}_{row['Reporting_Airline']}_{row['Origin']}-{row['Dest']}_{row['CRSDepTime']}")
+    out_df = pd.DataFrame(np.array(rows, dtype=np.float32), columns=make_feature_names())
+    out_df.insert(0, "row_id", ids)
+    out_df.to_csv(csv_path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding generation")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-rows", type=int, default=50_000)
+    args = parser.parse_args()
+
+    airport_map = dict(AIRPORTS)
+    airline_stats = {"DL": {"centroid_xyz": [0.2, -0.7, 0.6], "typical_dep_sin": 0.1,
+                            "typical_dep_cos": -0.9, "mean_distance_miles": 950.0}}
+    airport_busyness = {"JFK": 1.0, "LGA": 0.8, "MSP": 0.5}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        month_path = os.path.join(tmp, "2024", "2024_7.csv")
+        os.makedirs(os.path.dirname(month_path))
+        synthetic_month(month_path, args.rows)
+
+        legacy_csv = os.path.join(tmp, "legacy.csv")
+        t0 = time.perf_counter()
+        legacy_month_file(month_path, legacy_csv, airport_map, airline_stats, airport_busyness)
+        t_legacy = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        stats = process_month_file(month_path, os.path.join(tmp, "out"), airport_map, airline_stats,
+                                   airport_busyness, chunk_rows=args.chunk_rows)
+        t_vec = time.perf_counter() - t0
+
+        with open(legacy_csv, "rb") as a, open(stats["csv"], "rb") as b:
+            identical = a.read() == b.read()
+
+    print(f"{'path':>10} {'seconds':>9} {'rows/sec':>12}")
+    print(f"{'iterrows':>10} {t_legacy:>9.2f} {args.rows / t_legacy:>12,.0f}")
+    print(f"{'vectorized':>10} {t_vec:>9.2f} {args.rows / t_vec:>12,.0f}")
+    print(f"speedup {t_legacy / t_vec:.1f}x, byte-identical: {identical}")
+
+if __name__ == "__main__":
+    main()
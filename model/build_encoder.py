@@ -0,0 +1,48 @@
+# Builds the categorical encoder artifact served next to random_forest_model.joblib.
+# It replays the preprocessing from RandomForest.ipynb so the codes line up with
+# what the forest was trained on.
+
+import os, json, argparse
+import pandas as pd
+from sklearn.preprocessing import OrdinalEncoder
+
+ENCODER_FORMAT = 1
+TARGET_COLUMN = "delay_bucket"
+DROP_COLUMNS = ["y_dep_bucket"]
+
+def load_training_frame(file_path: str) -> pd.DataFrame:
+    df = pd.read_csv(file_path, dtype=str, low_memory=False)
+    for c in df.columns:
+        try:
+            df[c] = pd.to_numeric(df[c])
+        except (ValueError, TypeError):
+            pass
+    df = df.dropna(subset=[TARGET_COLUMN])
+    return df.drop(columns=DROP_COLUMNS + [TARGET_COLUMN], errors="ignore")
+
+def fit_categories(X: pd.DataFrame) -> dict:
+    cat_cols = X.select_dtypes(include=["object"]).columns
+    enc = OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=-1)
+    enc.fit(X[cat_cols])
+    return {col: [str(v) for v in cats] for col, cats in zip(cat_cols, enc.categories_)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the training vocabulary of the categorical features")
+    parser.add_argument("--data", default="flights_transformed.csv")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "..", "backend", "flights", "data", "categorical_encoder.json"))
+    args = parser.parse_args()
+
+    X = load_training_frame(args.data)
+    categories = fit_categories(X)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"format": ENCODER_FORMAT, "unknown_value": -1.0, "categories": categories}, f)
+
+    sizes = ", ".join(f"{c}={len(v)}" for c, v in categories.items())
+    print(f"Wrote {args.output} ({sizes})")
+
+if __name__ == "__main__":
+    main()
+
+'''
+python3 build_encoder.py --data flights_transformed.csv
+'''
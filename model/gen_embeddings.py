@@ -1,7 +1,8 @@
 # This is the code we used to generate embedding vectors for flights data
 # Accuracy of this approach was a bit lower than Random Forest tho
 
-import os, json, math, argparse, calendar, re, sys, subprocess
+import os, json, math, argparse, calendar, re, sys, subprocess, hashlib
+from concurrent.futures import ProcessPoolExecutor
 from typing import Dict, Tuple, List, Optional
 import numpy as np
 import pandas as pd
@@ -19,16 +20,9 @@ REQUIRED_COLUMNS = [
     "is_christmas_eve", "is_thanksgiving"
 ]
 
-FALLBACK_AIRPORTS = {
-    "LGA": (40.7769, -73.8740),
-    "JFK": (40.6413, -73.7781),
-    "BDL": (41.9389, -72.6833),
-    "BGM": (42.2087, -75.9799),
-    "PIT": (40.4914, -80.2329),
-    "MSP": (44.8820, -93.2218),
-    "BWI": (39.1754, -76.6684),
-    "BGR": (44.8074, -68.8281),
-}
+# Airport table shared with the backend (manage.py build_airport_table).
+AIRPORT_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", "flights", "data", "airports.npz")
+AIRPORT_TABLE_FORMAT = 1
 
 def hhmm_to_minutes(val) -> Optional[int]:
     if val is None or (isinstance(val, float) and math.isnan(val)):
@@ -77,75 +71,20 @@ def initial_bearing_sin_cos(lat1_deg: float, lon1_deg: float, lat2_deg: float, l
     bearing = math.atan2(y, x)
     return math.sin(bearing), math.cos(bearing)
 
-def read_airports_csv(airports_csv: str) -> Dict[str, Tuple[float, float]]:
-    df = pd.read_csv(airports_csv)
-    cols = {c.lower(): c for c in df.columns}
-    iata_col = None
-    for cand in ["iata", "iata_code", "code", "ident"]:
-        if cand.lower() in cols:
-            iata_col = cols[cand.lower()]
-            break
-    if iata_col is None:
-        raise ValueError("Could not find IATA column in airports CSV. Expected one of: iata, iata_code, code, ident")
-    lat_col = None; lon_col = None
-    for cand in ["lat", "latitude", "latitude_deg", "lat_deg"]:
-        if cand.lower() in cols:
-            lat_col = cols[cand.lower()]
-            break
-    for cand in ["lon", "lng", "longitude", "longitude_deg", "lon_deg"]:
-        if cand.lower() in cols:
-            lon_col = cols[cand.lower()]
-            break
-    if lat_col is None or lon_col is None:
-        raise ValueError("Could not find latitude/longitude columns in airports CSV.")
-    mapping = {}
-    for _, row in df.iterrows():
-        code = str(row[iata_col]).strip().upper()
-        if not code or code == "nan" or len(code) != 3:
-            continue
-        try:
-            lat = float(row[lat_col]); lon = float(row[lon_col])
-            if not (math.isnan(lat) or math.isnan(lon)):
-                mapping[code] = (lat, lon)
-        except Exception:
-            continue
-    return mapping
-
-def load_airports_from_package() -> Dict[str, Tuple[float, float]]:
-    try:
-        from airportsdata import load
-    except Exception:
-        print("Package 'airportsdata' not available. Consider: pip install airportsdata")
-        return {}
-    try:
-        db = load("IATA")
-    except Exception as e:
-        print(f"airportsdata.load('IATA') failed: {e}")
-        return {}
-    mapping = {}
-    for code, rec in db.items():
-        try:
-            lat = float(rec.get("lat"))
-            lon = float(rec.get("lon"))
-            if not (math.isnan(lat) or math.isnan(lon)):
-                mapping[str(code).upper()] = (lat, lon)
-        except Exception:
-            continue
-    return mapping
-
-def build_airport_lookup(airports_csv: Optional[str]) -> Dict[str, Tuple[float, float]]:
-    mapping = load_airports_from_package()
-    if mapping:
-        print(f"Loaded {len(mapping):,} airports from 'airportsdata' package.")
-        return mapping
-    if airports_csv and os.path.exists(airports_csv):
-        print(f"Loading airports from CSV: {airports_csv}")
-        try:
-            return read_airports_csv(airports_csv)
-        except Exception as e:
-            print(f"Failed to read airports CSV: {e}")
-    print("Using fallback mapping (limited). Some rows may be skipped if codes are missing.")
-    return dict(FALLBACK_AIRPORTS)
+def load_airport_table(path: str) -> Dict[str, Tuple[float, float]]:
+    with np.load(path) as data:
+        if int(data["format"]) != AIRPORT_TABLE_FORMAT:
+            raise ValueError(f"Unsupported airport table format in {path}: {int(data['format'])!r}")
+        return dict(zip(data["codes"].tolist(), zip(data["lat"].tolist(), data["lon"].tolist())))
+
+def build_airport_lookup(airports_table: str) -> Tuple[Dict[str, Tuple[float, float]], str]:
+    # The one airport store; there is no fallback, so a missing table is an error.
+    if not os.path.exists(airports_table):
+        raise SystemExit(f"No airport table at {airports_table}; build it with "
+                         "`python backend/manage.py build_airport_table` (or pass --airports-table).")
+    mapping = load_airport_table(airports_table)
+    print(f"Loaded {len(mapping):,} airports from table: {airports_table}")
+    return mapping, "table"
 
 def clean_and_require(df: pd.DataFrame) -> pd.DataFrame:
     for c in REQUIRED_COLUMNS:
@@ -171,112 +110,6 @@ def extract_year_month_from_path(path: str) -> Tuple[int, int]:
 def days_in_month(year: int, month: int) -> int:
     return calendar.monthrange(year, month)[1]
 
-def build_airline_stats(root: str, airport_map: Dict[str, Tuple[float,float]]) -> Dict[str, dict]:
-    sums = {}
-    counts = {}
-    dep_sin_sum = {}
-    dep_cos_sum = {}
-    distance_sum = {}
-    for year_dir in sorted(os.listdir(root)):
-        year_path = os.path.join(root, year_dir)
-        if not os.path.isdir(year_path) or not year_dir.isdigit():
-            continue
-        for fname in os.listdir(year_path):
-            if not fname.endswith(".csv"):
-                continue
-            file_path = os.path.join(year_path, fname)
-            try:
-                year, month = extract_year_month_from_path(file_path)
-                df = pd.read_csv(file_path)
-            except Exception as e:
-                print(f"Skipping {file_path}: {e}")
-                continue
-            try:
-                df = clean_and_require(df)
-            except Exception as e:
-                print(f"Skipping {file_path} (schema): {e}")
-                continue
-
-            dep_min = df["CRSDepTime"].apply(hhmm_to_minutes)
-            mask_valid_time = dep_min.notna()
-            df = df[mask_valid_time].copy()
-            dep_min = dep_min[mask_valid_time].astype(int)
-
-            def map_airport(code):
-                return airport_map.get(str(code).strip().upper())
-
-            orig_ll = df["Origin"].map(map_airport)
-            dest_ll = df["Dest"].map(map_airport)
-            mask_known = orig_ll.notna() & dest_ll.notna()
-            df = df[mask_known].copy()
-            if df.empty:
-                continue
-            orig_ll = orig_ll[mask_known]
-            dest_ll = dest_ll[mask_known]
-
-            orig_xyz = np.array([latlon_to_xyz(lat, lon) for (lat, lon) in orig_ll])
-            dest_xyz = np.array([latlon_to_xyz(lat, lon) for (lat, lon) in dest_ll])
-            mid_xyz = (orig_xyz + dest_xyz) / 2.0
-
-            airlines = df["Reporting_Airline"].astype(str).str.strip().values
-            dists = pd.to_numeric(df["Distance"], errors="coerce").fillna(0.0).values
-            dep_f = dep_min.values.astype(float) / 1440.0
-            dep_sin = np.sin(2.0 * np.pi * dep_f)
-            dep_cos = np.cos(2.0 * np.pi * dep_f)
-
-            for i, al in enumerate(airlines):
-                if al not in sums:
-                    sums[al] = np.zeros(3, dtype=float)
-                    counts[al] = 0
-                    dep_sin_sum[al] = 0.0
-                    dep_cos_sum[al] = 0.0
-                    distance_sum[al] = 0.0
-                sums[al] += mid_xyz[i]
-                counts[al] += 1
-                dep_sin_sum[al] += float(dep_sin[i])
-                dep_cos_sum[al] += float(dep_cos[i])
-                distance_sum[al] += float(dists[i])
-    stats = {}
-    for al, cnt in counts.items():
-        if cnt <= 0:
-            continue
-        centroid = (sums[al] / cnt).tolist()
-        s = dep_sin_sum[al] / cnt
-        c = dep_cos_sum[al] / cnt
-        norm = math.hypot(s, c)
-        if norm > 1e-8:
-            s /= norm; c /= norm
-        mean_dist = distance_sum[al] / cnt
-        stats[al] = {
-            "centroid_xyz": centroid,
-            "typical_dep_sin": float(s),
-            "typical_dep_cos": float(c),
-            "mean_distance_miles": float(mean_dist),
-        }
-    return stats
-
-def build_airport_counts(root: str) -> Dict[str, int]:
-    counts = {}
-    for year_dir in sorted(os.listdir(root)):
-        year_path = os.path.join(root, year_dir)
-        if not os.path.isdir(year_path) or not year_dir.isdigit():
-            continue
-        for fname in os.listdir(year_path):
-            if not fname.endswith(".csv"):
-                continue
-            file_path = os.path.join(year_path, fname)
-            try:
-                df = pd.read_csv(file_path, usecols=["Origin", "Dest"])
-            except Exception:
-                continue
-            for col in ["Origin", "Dest"]:
-                vals = df[col].astype(str).str.strip().str.upper()
-                for code in vals:
-                    if not code or code == "NAN":
-                        continue
-                    counts[code] = counts.get(code, 0) + 1
-    return counts
-
 def normalize_counts(counts: Dict[str, int]) -> Dict[str, float]:
     if not counts:
         return {}
@@ -380,79 +213,325 @@ def embed_row(row: pd.Series,
     ]
     return vec
 
+CHUNK_ROWS = 200_000
+
+def map_unique(col: pd.Series, fn) -> np.ndarray:
+    # Apply a scalar function once per distinct value and fan the results back out.
+    codes, uniques = pd.factorize(col)
+    return np.asarray([fn(v) for v in uniques], dtype=object)[codes]
+
+def convert(col: pd.Series, fn) -> np.ndarray:
+    # embed_row's int()/float()/hhmm_to_minutes() conversions; NaN where they fail.
+    def safe(v):
+        try:
+            out = fn(v)
+        except Exception:
+            return np.nan
+        return np.nan if out is None else out
+    return map_unique(col, safe).astype(np.float64)
+
+def to_float(col: pd.Series) -> np.ndarray:
+    # embed_row's float() passthrough, NaN where it fails. Not deduplicated:
+    # factorize() folds -0.0 into 0.0, and the delays must keep their sign bit.
+    return pd.to_numeric(col, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+
+def lookup(fn, width: int, *keys: np.ndarray) -> np.ndarray:
+    # (n, width) matrix of fn(*key) per row, with fn run once per distinct key.
+    if len(keys) == 1:
+        codes, uniques = pd.factorize(keys[0])
+        uniques = [(k,) for k in uniques]
+    else:
+        codes, uniques = pd.factorize(pd.MultiIndex.from_arrays(keys))
+    table = np.array([fn(*k) for k in uniques], dtype=np.float64).reshape(len(uniques), width)
+    return table[codes]
+
+def embed_frame(df: pd.DataFrame,
+                year: int,
+                airport_map: Dict[str, Tuple[float,float]],
+                airline_stats: Dict[str, dict],
+                airport_busyness: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """embed_row() for a whole frame.
+
+    Returns the embedding matrix of the rows embed_row() keeps, the mask of
+    those rows, and the mask of rows dropped for an unknown airport. The trig
+    runs through the same scalar helpers once per distinct value (month, day,
+    minute of day, airport, route), so the output matches embed_row() exactly.
+    """
+    num = {
+        "month": convert(df["Month"], int), "dom": convert(df["DayofMonth"], int),
+        "dow": convert(df["DayOfWeek"], int),
+        "dep_m": convert(df["CRSDepTime"], hhmm_to_minutes), "arr_m": convert(df["CRSArrTime"], hhmm_to_minutes),
+        "dist": to_float(df["Distance"]), "elap": to_float(df["CRSElapsedTime"]),
+        "xmas": convert(df["is_christmas_eve"], int), "tgiv": convert(df["is_thanksgiving"], int),
+        "dep_delay": to_float(df["DepDelay"]), "arr_delay": to_float(df["ArrDelay"]),
+    }
+    o_code = map_unique(df["Origin"], lambda v: str(v).strip().upper())
+    d_code = map_unique(df["Dest"], lambda v: str(v).strip().upper())
+    known = (map_unique(df["Origin"], lambda v: str(v).strip().upper() in airport_map).astype(bool)
+             & map_unique(df["Dest"], lambda v: str(v).strip().upper() in airport_map).astype(bool))
+    unknown = ~(map_unique(df["Origin"], lambda v: str(v).upper() in airport_map).astype(bool)
+                & map_unique(df["Dest"], lambda v: str(v).upper() in airport_map).astype(bool))
+    keep = known & ~np.isnan(np.column_stack(list(num.values()))).any(axis=1)
+
+    v = {k: a[keep] for k, a in num.items()}
+    o_code, d_code = o_code[keep], d_code[keep]
+    month, dom = v["month"].astype(np.int64), v["dom"].astype(np.int64)
+
+    def day_sin_cos(m, d):
+        try:
+            dim = calendar.monthrange(year, m)[1]
+        except Exception:
+            dim = 31
+        return sin_cos((d - 1) / float(max(1, dim)))
+
+    month_sc = lookup(lambda m: sin_cos((int(m) - 1) / 12.0), 2, month)
+    day_sc = lookup(lambda m, d: day_sin_cos(int(m), int(d)), 2, month, dom)
+    dow_sc = lookup(lambda w: sin_cos((int(w) - 1) / 7.0), 2, v["dow"].astype(np.int64))
+    dep_sc = lookup(lambda m: sin_cos(int(m) / TIME_PERIOD_MIN), 2, v["dep_m"].astype(np.int64))
+    arr_sc = lookup(lambda m: sin_cos(int(m) / TIME_PERIOD_MIN), 2, v["arr_m"].astype(np.int64))
+
+    o_xyz = lookup(lambda c: latlon_to_xyz(*airport_map[c]), 3, o_code)
+    d_xyz = lookup(lambda c: latlon_to_xyz(*airport_map[c]), 3, d_code)
+    route_vec = (d_xyz - o_xyz) / ROUTE_VEC_DIV
+    bearing_sc = lookup(lambda o, d: initial_bearing_sin_cos(*airport_map[o], *airport_map[d]), 2, o_code, d_code)
+    o_xyz *= COORD_SCALE
+    d_xyz *= COORD_SCALE
+    route_vec *= COORD_SCALE
+
+    def airline_features(al):
+        if al not in airline_stats:
+            return (0.0,) * 6
+        ainfo = airline_stats[al]
+        cx, cy, cz = ainfo["centroid_xyz"]
+        return (COORD_SCALE * float(cx), COORD_SCALE * float(cy), COORD_SCALE * float(cz),
+                float(ainfo["typical_dep_sin"]), float(ainfo["typical_dep_cos"]),
+                float(ainfo["mean_distance_miles"]) / DISTANCE_SCALE)
+
+    airline = lookup(airline_features, 6, map_unique(df["Reporting_Airline"], lambda a: str(a).strip())[keep])
+    busy = lookup(lambda o, d: (float(airport_busyness.get(o, 0.0)), float(airport_busyness.get(d, 0.0))), 2,
+                  o_code, d_code)
+
+    X = np.column_stack([
+        month_sc, day_sc, dow_sc, dep_sc, arr_sc,
+        o_xyz, d_xyz, route_vec, bearing_sc,
+        v["elap"] / ELAPSED_SCALE, v["dist"] / DISTANCE_SCALE, v["xmas"], v["tgiv"],
+        airline, busy,
+        v["dep_delay"], v["arr_delay"],
+    ])
+    return X, keep, unknown
+
+OUTPUT_FORMATS = ["csv", "parquet", "npy"]
+
+def write_embeddings(X: np.ndarray, ids: List[str], path_base: str, output_format: str) -> dict:
+    """Write one month's embeddings; returns the manifest entries naming the files.
+
+    csv:     <base>.csv with a row_id column, as always.
+    parquet: <base>.parquet with a row_id column and one float32 column per feature.
+    npy:     <base>.npy, a C-contiguous float32 matrix that np.load(mmap_mode="r")
+             maps without copying, plus <base>_row_ids.txt with one ID per line.
+    """
+    if output_format == "npy":
+        npy_path, ids_path = f"{path_base}.npy", f"{path_base}_row_ids.txt"
+        np.save(npy_path, np.ascontiguousarray(X, dtype=np.float32))
+        with open(ids_path, "w", encoding="utf-8") as f:
+            f.writelines(f"{rid}\n" for rid in ids)
+        return {"npy": npy_path, "row_ids": ids_path}
+
+    out_df = pd.DataFrame(X, columns=make_feature_names())
+    out_df.insert(0, "row_id", ids)
+    if output_format == "parquet":
+        parquet_path = f"{path_base}.parquet"
+        out_df.to_parquet(parquet_path, index=False)
+        return {"parquet": parquet_path}
+    csv_path = f"{path_base}.csv"
+    out_df.to_csv(csv_path, index=False)
+    return {"csv": csv_path}
+
+def read_embeddings(entry: dict) -> Tuple[np.ndarray, List[str]]:
+    """(matrix, row IDs) of one manifest file entry; .npy matrices come back memory-mapped."""
+    if "npy" in entry:
+        X = np.load(entry["npy"], mmap_mode="r")
+        with open(entry["row_ids"], "r", encoding="utf-8") as f:
+            ids = f.read().splitlines()
+        return X, ids
+    if "parquet" in entry:
+        df = pd.read_parquet(entry["parquet"], memory_map=True)
+    else:
+        df = pd.read_csv(entry["csv"], dtype={"row_id": str})
+    return df[make_feature_names()].to_numpy(np.float32), df["row_id"].tolist()
+
 def process_month_file(file_path: str,
                        output_dir: str,
                        airport_map: Dict[str, Tuple[float,float]],
                        airline_stats: Dict[str, dict],
-                       airport_busyness: Dict[str, float]) -> dict:
+                       airport_busyness: Dict[str, float],
+                       chunk_rows: int = CHUNK_ROWS,
+                       output_format: str = "csv") -> dict:
     year, month = extract_year_month_from_path(file_path)
     print(f"Embedding {file_path} ...")
-    df = pd.read_csv(file_path)
-    df = clean_and_require(df)
 
-    df["dep_min"] = df["CRSDepTime"].apply(hhmm_to_minutes)
-    df["arr_min"] = df["CRSArrTime"].apply(hhmm_to_minutes)
-    df = df[df["dep_min"].notna() & df["arr_min"].notna()].copy()
-
-    feature_names = make_feature_names()
-    rows = []
-    ids = []
+    blocks, prefixes, dep_times, dep_kinds = [], [], [], []
+    rows_in = 0
     dropped_unknown_airport = 0
-    for idx, row in df.iterrows():
-        vec = embed_row(row, year, airport_map, airline_stats, airport_busyness)
-        if vec is None:
-            o = str(row.get("Origin", "")); d = str(row.get("Dest", ""))
-            if o.upper() not in airport_map or d.upper() not in airport_map:
-                dropped_unknown_airport += 1
-            continue
-        rows.append(vec)
-        rid = f"{year}-{int(row['Month']):02d}-{int(row['DayofMonth']):02d}_{row['Reporting_Airline']}_{row['Origin']}-{row['Dest']}_{row['CRSDepTime']}"
-        ids.append(rid)
+    for df in pd.read_csv(file_path, chunksize=chunk_rows):
+        df = clean_and_require(df)
+        df = df[~np.isnan(convert(df["CRSDepTime"], hhmm_to_minutes)) & ~np.isnan(convert(df["CRSArrTime"], hhmm_to_minutes))]
+        rows_in += len(df)
+        X, keep, unknown = embed_frame(df, year, airport_map, airline_stats, airport_busyness)
+        dropped_unknown_airport += int(unknown.sum())
+
+        kept = df[keep]
+        fields = [map_unique(kept[c], str) for c in ("Reporting_Airline", "Origin", "Dest")]
+        date = map_unique(kept["Month"], lambda m: f"{year}-{int(m):02d}-") + \
+            map_unique(kept["DayofMonth"], lambda d: f"{int(d):02d}")
+        prefixes.append(date + "_" + fields[0] + "_" + fields[1] + "-" + fields[2] + "_")
+        dep_times.append(kept["CRSDepTime"].to_numpy())
+        dep_kinds.append(df["CRSDepTime"].dtype.kind)
+        blocks.append(X.astype(np.float32))
+
+    # A whole-file read_csv types CRSDepTime as float if any chunk parses as
+    # float; format the integer chunks the same way so row IDs do not change.
+    as_float = "f" in dep_kinds and "O" not in dep_kinds
+    ids = []
+    for prefix, dep, kind in zip(prefixes, dep_times, dep_kinds):
+        if as_float and kind in "iu":
+            dep = dep.astype(np.float64)
+        ids.extend((prefix + map_unique(pd.Series(dep), str)).tolist())
 
-    X = np.array(rows, dtype=np.float32)
+    feature_names = make_feature_names()
+    X = np.concatenate(blocks) if blocks else np.empty((0, len(feature_names)), dtype=np.float32)
     os.makedirs(output_dir, exist_ok=True)
     year_dir = os.path.join(output_dir, str(year))
     os.makedirs(year_dir, exist_ok=True)
 
     base = os.path.splitext(os.path.basename(file_path))[0]
-    csv_path = os.path.join(year_dir, f"{base}_embeddings.csv")
-
-    out_df = pd.DataFrame(X, columns=feature_names)
-    out_df.insert(0, "row_id", ids)
-    out_df.to_csv(csv_path, index=False)
+    outputs = write_embeddings(X, ids, os.path.join(year_dir, f"{base}_embeddings"), output_format)
 
     stats = {
         "file": file_path,
         "year": year,
         "month": month,
-        "rows_in": int(len(df)),
+        "rows_in": int(rows_in),
         "rows_out": int(X.shape[0]),
         "dropped_unknown_airport": int(dropped_unknown_airport),
-        "csv": csv_path,
+        **outputs,
+        "shape": list(X.shape),
+        "dtype": str(X.dtype),
         "coord_scale": COORD_SCALE,
         "route_vec_div": ROUTE_VEC_DIV,
     }
     print(f" -> {X.shape[0]} embeddings written | dropped_unknown_airport={dropped_unknown_airport}")
     return stats
 
-def main():
-    parser = argparse.ArgumentParser(description="Convert flights to vector embeddings")
-    parser.add_argument("--root", default="/Users/maksimkrylykov/Desktop/HackGT/flights_data")
-    parser.add_argument("--output", default="./flights_embeddings")
-    parser.add_argument("--airports-csv", default=None)
-    args = parser.parse_args()
-
-    root = args.root
-    out_dir = args.output
+def list_month_files(root: str) -> List[str]:
+    files = []
+    for year_dir in sorted(os.listdir(root)):
+        year_path = os.path.join(root, year_dir)
+        if not os.path.isdir(year_path) or not year_dir.isdigit():
+            continue
+        for fname in sorted(os.listdir(year_path)):
+            if fname.endswith(".csv"):
+                files.append(os.path.join(year_path, fname))
+    return files
+
+AIRLINE_SUMS = ["sx", "sy", "sz", "dep_sin", "dep_cos", "distance", "count"]
+
+def empty_partial() -> dict:
+    return {"airlines": {}, "airports": {}}
+
+def merge_partials(*partials: dict) -> dict:
+    # Partial aggregates are plain sums, so scans of disjoint files merge by addition.
+    out = empty_partial()
+    for part in partials:
+        for al, sums in part["airlines"].items():
+            acc = out["airlines"].setdefault(al, [0.0] * len(AIRLINE_SUMS))
+            for i, v in enumerate(sums):
+                acc[i] += v
+        for code, n in part["airports"].items():
+            out["airports"][code] = out["airports"].get(code, 0) + n
+    return out
+
+def scan_chunk(df: pd.DataFrame, airport_map: Dict[str, Tuple[float,float]], with_airlines: bool) -> dict:
+    part = empty_partial()
+    for col in ["Origin", "Dest"]:
+        if col in df.columns:
+            vals = df[col].astype(str).str.strip().str.upper()
+            counts = vals[(vals != "") & (vals != "NAN")].value_counts()
+            for code, n in counts.items():
+                part["airports"][code] = part["airports"].get(code, 0) + int(n)
+    if not with_airlines:
+        return part
 
-    airport_map = build_airport_lookup(airports_csv=args.airports_csv)
+    df = clean_and_require(df)
+    dep_min = convert(df["CRSDepTime"], hhmm_to_minutes)
+    df, dep_min = df[~np.isnan(dep_min)], dep_min[~np.isnan(dep_min)]
+    o_code = map_unique(df["Origin"], lambda c: str(c).strip().upper())
+    d_code = map_unique(df["Dest"], lambda c: str(c).strip().upper())
+    known = (map_unique(df["Origin"], lambda c: str(c).strip().upper() in airport_map).astype(bool)
+             & map_unique(df["Dest"], lambda c: str(c).strip().upper() in airport_map).astype(bool))
+    if not known.any():
+        return part
+    df, dep_min, o_code, d_code = df[known], dep_min[known], o_code[known], d_code[known]
+
+    mid_xyz = (lookup(lambda c: latlon_to_xyz(*airport_map[c]), 3, o_code)
+               + lookup(lambda c: latlon_to_xyz(*airport_map[c]), 3, d_code)) / 2.0
+    dep_f = dep_min / 1440.0
+    frame = pd.DataFrame({
+        "sx": mid_xyz[:, 0], "sy": mid_xyz[:, 1], "sz": mid_xyz[:, 2],
+        "dep_sin": np.sin(2.0 * np.pi * dep_f), "dep_cos": np.cos(2.0 * np.pi * dep_f),
+        "distance": pd.to_numeric(df["Distance"], errors="coerce").fillna(0.0).to_numpy(np.float64),
+        "count": 1,
+    })
+    sums = frame.groupby(df["Reporting_Airline"].astype(str).str.strip().to_numpy(), sort=False).sum()
+    part["airlines"] = {al: [float(v) for v in row] for al, row in zip(sums.index, sums[AIRLINE_SUMS].to_numpy())}
+    return part
+
+def scan_month_file(file_path: str, airport_map: Dict[str, Tuple[float,float]], chunk_rows: int = CHUNK_ROWS) -> dict:
+    """Partial corpus statistics of one month file: per-airline sums and airport counts.
+
+    Airport counts cover every row with an Origin/Dest, as before; airline sums
+    need a parseable file name and the full schema.
+    """
+    try:
+        extract_year_month_from_path(file_path)
+        with_airlines = True
+    except Exception as e:
+        print(f"Skipping airline stats for {file_path}: {e}")
+        with_airlines = False
+    parts = []
+    try:
+        for df in pd.read_csv(file_path, usecols=lambda c: c in REQUIRED_COLUMNS, chunksize=chunk_rows):
+            try:
+                parts.append(scan_chunk(df, airport_map, with_airlines))
+            except ValueError as e:
+                print(f"Skipping airline stats for {file_path} (schema): {e}")
+                with_airlines = False
+                parts.append(scan_chunk(df, airport_map, with_airlines))
+    except Exception as e:
+        print(f"Skipping {file_path}: {e}")
+        return empty_partial()
+    return merge_partials(*parts)
 
-    print("First pass: computing airline embeddings and airport busyness...")
-    airline_stats = build_airline_stats(root, airport_map)
-    airport_counts = build_airport_counts(root)
-    airport_busyness = normalize_counts(airport_counts)
-    print(f"Computed airline stats for {len(airline_stats)} airlines; airport busyness for {len(airport_busyness)} airports.")
+def airline_stats_from_partial(partial: dict) -> Dict[str, dict]:
+    stats = {}
+    for al, (sx, sy, sz, dep_sin, dep_cos, distance, cnt) in partial["airlines"].items():
+        if cnt <= 0:
+            continue
+        s = dep_sin / cnt
+        c = dep_cos / cnt
+        norm = math.hypot(s, c)
+        if norm > 1e-8:
+            s /= norm; c /= norm
+        stats[al] = {
+            "centroid_xyz": [sx / cnt, sy / cnt, sz / cnt],
+            "typical_dep_sin": float(s),
+            "typical_dep_cos": float(c),
+            "mean_distance_miles": float(distance / cnt),
+        }
+    return stats
 
+def write_corpus_metadata(out_dir: str, root: str, airline_stats: Dict[str, dict],
+                          airport_busyness: Dict[str, float], airports_source: str):
     os.makedirs(out_dir, exist_ok=True)
     with open(os.path.join(out_dir, "airline_embeddings.json"), "w", encoding="utf-8") as f:
         json.dump(airline_stats, f, indent=2)
@@ -467,26 +546,157 @@ def main():
             "elapsed_scale": ELAPSED_SCALE,
             "route_vec_div": ROUTE_VEC_DIV,
             "coord_scale": COORD_SCALE,
-            "airports_source": "airportsdata/csv/fallback"
+            "airports_source": airports_source
         }, f, indent=2)
 
-    manifest = {"root": root, "output_dir": out_dir, "files": []}
-    for year_dir in sorted(os.listdir(root)):
-        year_path = os.path.join(root, year_dir)
-        if not os.path.isdir(year_path) or not year_dir.isdigit():
-            continue
-        for fname in sorted(os.listdir(year_path)):
-            if not fname.endswith(".csv"):
-                continue
-            file_path = os.path.join(year_path, fname)
+PARTIALS_FILENAME = "corpus_partials.json"
+
+def write_json(path: str, obj) -> None:
+    # Written under a temporary name and renamed, so a crash never leaves half a file.
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, indent=2)
+    os.replace(tmp, path)
+
+def read_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_fingerprint(path: str, known: Optional[dict] = None) -> dict:
+    """Size, mtime and SHA-256 of an input file. The hash is only recomputed
+    when size or mtime differ from `known`, so unchanged months cost a stat()."""
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime": st.st_mtime}
+    if known and known.get("size") == fp["size"] and known.get("mtime") == fp["mtime"]:
+        fp["sha256"] = known["sha256"]
+    else:
+        fp["sha256"] = file_sha256(path)
+    return fp
+
+def same_input(a: Optional[dict], b: Optional[dict]) -> bool:
+    return bool(a and b) and a["size"] == b["size"] and a["sha256"] == b["sha256"]
+
+def outputs_exist(entry: dict) -> bool:
+    return all(os.path.exists(entry[k]) for k in ("csv", "parquet", "npy", "row_ids") if k in entry)
+
+def run_config(args, airports_source: str, airport_map: Dict[str, Tuple[float,float]]) -> dict:
+    airports_digest = hashlib.sha256(json.dumps(sorted(airport_map.items())).encode()).hexdigest()
+    return {
+        "distance_scale": DISTANCE_SCALE,
+        "elapsed_scale": ELAPSED_SCALE,
+        "route_vec_div": ROUTE_VEC_DIV,
+        "coord_scale": COORD_SCALE,
+        "features": make_feature_names(),
+        "format": args.format,
+        "airports_source": airports_source,
+        "airports_sha256": airports_digest,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert flights to vector embeddings")
+    parser.add_argument("--root", default="/Users/maksimkrylykov/Desktop/HackGT/flights_data")
+    parser.add_argument("--output", default="./flights_embeddings")
+    parser.add_argument("--airports-table", default=AIRPORT_TABLE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="month files scanned and embedded in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="csv",
+                        help="per-month output: csv, parquet (needs pyarrow) or npy matrices with a row-ID sidecar")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse statistics and outputs recorded in an existing manifest.json for unchanged months")
+    parser.add_argument("--keep-stale-stats", action="store_true",
+                        help="with --incremental, also keep unchanged months embedded with older airline/airport statistics")
+    args = parser.parse_args()
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("--format parquet needs pyarrow: pip install pyarrow")
+
+    root = args.root
+    out_dir = args.output
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    partials_path = os.path.join(out_dir, PARTIALS_FILENAME)
+
+    airport_map, airports_source = build_airport_lookup(args.airports_table)
+    config = run_config(args, airports_source, airport_map)
+
+    # In incremental mode, per-file partial aggregates and manifest entries of
+    # earlier runs are reused for months whose input and config are unchanged.
+    previous = read_json(manifest_path, {}) if args.incremental else {}
+    stored = read_json(partials_path, {}) if args.incremental else {}
+    if stored.get("airports_sha256") != config["airports_sha256"]:
+        stored = {}
+    previous_files = {e["file"]: e for e in previous.get("files", [])} if previous.get("config") == config else {}
+
+    files = list_month_files(root)
+    known = {f: (stored.get("files", {}).get(f) or previous_files.get(f) or {}).get("input") for f in files}
+    inputs = {f: file_fingerprint(f, known[f]) for f in files}
+
+    manifest = {
+        "root": root, "output_dir": out_dir, "format": args.format,
+        "dtype": "float32", "features": make_feature_names(), "config": config, "files": [],
+    }
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        print("First pass: computing airline embeddings and airport busyness...")
+        partials = {
+            f: entry for f, entry in stored.get("files", {}).items()
+            if f in inputs and same_input(entry["input"], inputs[f])
+        }
+        todo = [f for f in files if f not in partials]
+        print(f"Scanning {len(todo)} of {len(files)} month files.")
+        for f, part in zip(todo, pool.map(scan_month_file, todo, [airport_map] * len(todo), [args.chunk_rows] * len(todo))):
+            partials[f] = {"input": inputs[f], "partial": part}
+        write_json(partials_path, {"airports_sha256": config["airports_sha256"], "files": partials})
+
+        partial = merge_partials(*(partials[f]["partial"] for f in files))
+        airline_stats = airline_stats_from_partial(partial)
+        airport_busyness = normalize_counts(partial["airports"])
+        print(f"Computed airline stats for {len(airline_stats)} airlines; airport busyness for {len(airport_busyness)} airports.")
+        write_corpus_metadata(out_dir, root, airline_stats, airport_busyness, airports_source)
+        stats_digest = hashlib.sha256(json.dumps([airline_stats, airport_busyness], sort_keys=True).encode()).hexdigest()
+
+        # A month is kept only if it was embedded with these statistics (its
+        # entry's stats_sha256); a new month usually shifts them, so every
+        # month is re-embedded unless --keep-stale-stats allows the mix.
+        current = {
+            f: previous_files[f] for f in files
+            if f in previous_files and same_input(previous_files[f].get("input"), inputs[f])
+            and outputs_exist(previous_files[f])
+            and (args.keep_stale_stats or previous_files[f].get("stats_sha256") == stats_digest)
+        }
+        todo = [f for f in files if f not in current]
+        print(f"Embedding {len(todo)} of {len(files)} month files.")
+        futures = {
+            f: pool.submit(process_month_file, f, out_dir, airport_map, airline_stats, airport_busyness,
+                           args.chunk_rows, args.format)
+            for f in todo
+        }
+        done = dict(current)
+        for file_path in todo:
             try:
-                stats = process_month_file(file_path, out_dir, airport_map, airline_stats, airport_busyness)
-                manifest["files"].append(stats)
+                stats = futures[file_path].result()
             except Exception as e:
                 print(f"Failed to process {file_path}: {e}")
+                continue
+            stats.update(input=inputs[file_path], stats_sha256=stats_digest)
+            done[file_path] = stats
+            # Recorded as each month lands, so --incremental resumes a crashed run.
+            manifest["files"] = [done[f] for f in files if f in done]
+            write_json(manifest_path, manifest)
+        manifest["files"] = [done[f] for f in files if f in done]
 
-    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as f:
-        json.dump(manifest, f, indent=2)
+    write_json(manifest_path, manifest)
 
     print(f"\nDone. Embeddings and metadata are in: {os.path.abspath(out_dir)}")
 
@@ -497,4 +707,11 @@ if __name__ == "__main__":
 python3 gen_embeddings.py \
   --root "/Users/maksimkrylykov/Desktop/HackGT/flights_data" \
   --output "./flights_embeddings"
-'''
\ No newline at end of file
+
+# After a crash, only the months not yet written are embedded (and only new or
+# changed months are rescanned for statistics):
+python3 gen_embeddings.py --root ... --output "./flights_embeddings" --incremental
+
+# After a new month lands, embed just that month and keep the others on their older statistics:
+python3 gen_embeddings.py --root ... --output "./flights_embeddings" --incremental --keep-stale-stats
+'''